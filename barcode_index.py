@@ -0,0 +1,177 @@
+import bisect
+import threading
+
+import numpy as np
+import pandas as pd
+
+FIRST_BARCODE = 100000
+LAST_BARCODE = 999999
+
+ABSENT = 0
+ACTIVE = 1
+REMOVED = 2
+
+
+# In-process index of every barcode, for answering scans without a database round trip.
+#
+# Barcodes are 6-digit integers, so the index is two arrays with one slot per possible
+# barcode: a byte per slot for its state (absent, active or removed) and the full row for
+# active barcodes. It is filled from the barcodes table at startup and patched by the
+# write routes after each write. Until it has been loaded, lookups report a miss so the
+# caller falls back to the database.
+#
+# The index only sees writes made through this process, so another worker may have added,
+# changed or removed a barcode since it was last patched. Scans only take its answer for
+# barcodes it has as removed; active barcodes and misses are confirmed against the
+# database, and the row read there is written back here.
+class BarcodeIndex:
+    def __init__(self):
+        self.ready = False
+        self._state = np.zeros(LAST_BARCODE - FIRST_BARCODE + 1, dtype=np.uint8)
+        self._records = [None] * len(self._state)
+        self._lock = threading.Lock()
+
+    # Replace the whole index with the rows of a barcodes DataFrame
+    def load(self, frame):
+        state = np.zeros(LAST_BARCODE - FIRST_BARCODE + 1, dtype=np.uint8)
+        records = [None] * len(state)
+        if not frame.empty:
+            numbers = pd.to_numeric(frame["barcode"], errors="coerce")
+            in_range = numbers.between(FIRST_BARCODE, LAST_BARCODE)
+            frame = frame[in_range]
+            slots = numbers[in_range].astype(int).to_numpy() - FIRST_BARCODE
+            removed = (pd.to_numeric(frame["remove"], errors="coerce").fillna(0) != 0).to_numpy()
+
+            state[slots[removed]] = REMOVED
+            state[slots[~removed]] = ACTIVE
+            active = frame[~removed]
+            columns = list(active.columns)
+            for slot, values in zip(slots[~removed].tolist(), zip(*[active[column].tolist() for column in columns])):
+                records[slot] = dict(zip(columns, values))
+
+        with self._lock:
+            self._state = state
+            self._records = records
+            self.ready = True
+
+    # (True, row) if the index can answer for this barcode, else (False, None). The row is
+    # just the barcode and its remove flag for one that has been removed.
+    def get(self, barcode):
+        slot = _slot(barcode)
+        with self._lock:
+            if not self.ready or slot is None:
+                return False, None
+            state = self._state[slot]
+            if state == ACTIVE:
+                return True, dict(self._records[slot])
+            if state == REMOVED:
+                return True, {"barcode": str(barcode), "remove": 1}
+            return False, None
+
+    # Replace the indexed rows for barcodes after a write (None marks one as deleted)
+    def put_barcodes(self, records):
+        with self._lock:
+            for barcode, record in records.items():
+                slot = _slot(barcode)
+                if slot is None:
+                    continue
+                if record is None:
+                    self._state[slot] = ABSENT
+                    self._records[slot] = None
+                elif int(record.get("remove") or 0) != 0:
+                    self._state[slot] = REMOVED
+                    self._records[slot] = None
+                else:
+                    self._state[slot] = ACTIVE
+                    self._records[slot] = dict(record)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "active": int((self._state == ACTIVE).sum()),
+                "removed": int((self._state == REMOVED).sum()),
+            }
+
+
+# In-process index of active barcodes (remove == 0) ordered by expiry date.
+#
+# Holds a sorted list of (exp_date, barcode) pairs, so the barcodes expiring in a date
+# range are one binary search away and come out in expiry order. Dates are kept as
+# "YYYY-MM-DD" strings, which sort like the dates themselves; barcodes without a valid
+# date are left out. Loaded and patched alongside BarcodeIndex.
+class ExpiryIndex:
+    def __init__(self):
+        self.ready = False
+        self._entries = []  # sorted (exp_date, barcode) pairs
+        self._dates = {}    # barcode -> exp_date, for finding a barcode's entry
+        self._lock = threading.Lock()
+
+    # Replace the whole index with the active rows of a barcodes DataFrame
+    def load(self, frame):
+        entries = []
+        if not frame.empty:
+            numbers = pd.to_numeric(frame["barcode"], errors="coerce")
+            active = (pd.to_numeric(frame["remove"], errors="coerce").fillna(0) == 0) & numbers.notna()
+            dates = pd.to_datetime(frame["exp_date"], errors="coerce").dt.strftime("%Y-%m-%d")
+            active &= dates.notna()
+            entries = sorted(zip(dates[active].tolist(), numbers[active].astype(int).tolist()))
+
+        with self._lock:
+            self._entries = entries
+            self._dates = {barcode: date for date, barcode in entries}
+            self.ready = True
+
+    # Move, add or drop barcodes after a write (None marks one as deleted)
+    def put_barcodes(self, records):
+        with self._lock:
+            for barcode, record in records.items():
+                try:
+                    barcode = int(barcode)
+                except (TypeError, ValueError):
+                    continue
+                old = self._dates.pop(barcode, None)
+                if old is not None:
+                    i = bisect.bisect_left(self._entries, (old, barcode))
+                    if i < len(self._entries) and self._entries[i] == (old, barcode):
+                        del self._entries[i]
+
+                date = expiry_date(record.get("exp_date")) if record and int(record.get("remove") or 0) == 0 else None
+                if date is not None:
+                    bisect.insort(self._entries, (date, barcode))
+                    self._dates[barcode] = date
+
+    # (total, barcodes) for the barcodes expiring from start to end inclusive ("YYYY-MM-DD"
+    # strings, either may be None for an open end), in expiry order. `offset` and `limit`
+    # pick a page of the barcodes; total counts them all.
+    def between(self, start=None, end=None, offset=0, limit=None):
+        with self._lock:
+            lo = bisect.bisect_left(self._entries, (start,)) if start else 0
+            hi = bisect.bisect_right(self._entries, (end, LAST_BARCODE + 1)) if end else len(self._entries)
+            total = max(hi - lo, 0)
+            stop = hi if limit is None else min(hi, lo + offset + limit)
+            return total, [barcode for _, barcode in self._entries[lo + offset:stop]]
+
+    def stats(self):
+        with self._lock:
+            return {"ready": self.ready, "barcodes": len(self._entries)}
+
+
+# "YYYY-MM-DD" for an expiry date value, or None if it is not a date
+def expiry_date(value):
+    try:
+        date = pd.to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return None if pd.isna(date) else date.strftime("%Y-%m-%d")
+
+
+# Array slot for a barcode, or None if it is outside the barcode range
+def _slot(barcode):
+    try:
+        number = int(barcode)
+    except (TypeError, ValueError):
+        return None
+    if number < FIRST_BARCODE or number > LAST_BARCODE:
+        return None
+    return number - FIRST_BARCODE
@@ -0,0 +1,112 @@
+# Benchmark the table renderer in main.py against the original iterrows/FastHTML version.
+#
+#   python benchmarks/bench_html_table.py --rows 1000 10000 50000
+import argparse
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# main.py reads its configuration at import time; no database is used here
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ.setdefault("SQLITE_PATH", ":memory:")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("PASSWORD", "benchmark")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fasthtml.common import *
+from main import df_to_html_table
+
+
+# The renderer as it was before: one FastHTML component per cell
+def legacy_df_to_html_table(df, link_trans_id=False, link_barcode=False):
+    if df.empty:
+        return P("No data found.")
+
+    df = df.astype(str)
+
+    header = Thead(Tr(*[Th(col) for col in df.columns]))
+
+    body_rows = []
+    for _, row in df.iterrows():
+        cells = []
+
+        for col in df.columns:
+            value = row[col]
+
+            if col == "Trans ID" and link_trans_id:
+                value = A(
+                    value,
+                    href=f"/edit_transaction?trans_id={row['Trans ID']}",
+                    style="color:#1e88e5; text-decoration:none;"
+                )
+
+            elif col == "Barcode" and link_barcode:
+                value = A(
+                    value,
+                    href=f"/edit_barcode?barcode={row['Barcode']}",
+                    style="color:#1e88e5; text-decoration:none;"
+                )
+
+            cells.append(Td(value))
+
+        body_rows.append(Tr(*cells))
+
+    return Table(header, Tbody(*body_rows), cls="data-table")
+
+
+# A transactions page as the /transactions route builds it
+def make_transactions(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "Trans ID": np.arange(rows, 0, -1),
+        "Barcode": (100000 + rng.integers(0, 900000, rows)).astype(str),
+        "Item #": [f"ITEM-{i}" for i in rng.integers(0, 2000, rows)],
+        "Description": [f"Widget <{i}> & \"parts\"" for i in rng.integers(0, 2000, rows)],
+        "Lot #": [f"L{i:05d}" for i in rng.integers(0, 50000, rows)],
+        "Exp Date": (pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 1000, rows), unit="D")).strftime("%Y-%m-%d"),
+        "Type": rng.choice(["Vendor Damage", "Damage", "Expired", "Short Dated", "Return"], rows),
+        "Add/Remove": rng.choice(["Add", "Remove"], rows),
+        "Quantity": rng.integers(1, 50, rows),
+        "Trans Date": pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 10**8, rows), unit="s"),
+        "Employee": rng.choice(["alice", "bob", "carol", "dave"], rows),
+    })
+    return df
+
+
+# Whitespace between tags differs between the renderers; the markup itself must not
+def normalize(markup):
+    return re.sub(r">\s+<", "><", re.sub(r"\s*\n\s*", "", markup))
+
+
+# Best wall time of `repeat` runs, rendering all the way to the HTML string
+def best_time(render, df, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        markup = to_xml(render(df, link_trans_id=True, link_barcode=False))
+        best = min(best, time.perf_counter() - start)
+    return best, markup
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the HTML table renderers.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'legacy (s)':>12} {'current (s)':>12} {'speedup':>8}")
+    for rows in args.rows:
+        df = make_transactions(rows)
+        legacy, legacy_markup = best_time(legacy_df_to_html_table, df, args.repeat)
+        current, current_markup = best_time(df_to_html_table, df, args.repeat)
+        if normalize(legacy_markup) != normalize(current_markup):
+            sys.exit(f"Renderers produced different HTML for {rows} rows")
+        print(f"{rows:>8} {legacy:>12.3f} {current:>12.3f} {legacy / current:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
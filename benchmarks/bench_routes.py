@@ -0,0 +1,204 @@
+# Benchmark every data route at several table sizes.
+#
+# Each size gets a fresh SQLite database filled with deterministic synthetic data
+# (see synthetic.py); the routes are then driven in-process through the ASGI app.
+# Per route and size it reports latency percentiles, peak RSS and response size,
+# and writes everything to a JSON file for comparison between versions.
+#
+#   python benchmarks/bench_routes.py --rows 10000 100000 1000000 --output bench_routes.json
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCHMARK_DIR, "..")
+
+# main.py reads its configuration at import time
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ.setdefault("SQLITE_PATH", ":memory:")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("PASSWORD", "benchmark")
+sys.path.insert(0, ROOT)
+
+from starlette.testclient import TestClient
+
+import main
+import synthetic
+from storage import SQLiteStorage
+
+
+# Requests for each route; `i` is the request number, so repeated requests vary
+# their parameters the way a user paging and filtering would
+def route_requests(rows, barcodes):
+    active = barcodes.loc[(barcodes["remove"] == 0) & (barcodes["quantity"] > 1), "barcode"].tolist()
+    items = barcodes["item_number"].unique().tolist()
+    sorts = ["barcode", "item_number", "exp_date", "quantity"]
+    pages = max(rows // 100, 1)
+
+    return {
+        "/transactions": lambda i: ("GET", "/transactions", {"page": i % min(pages, 50) + 1}),
+        "/transactions (filtered)": lambda i: ("GET", "/transactions", {"item_number": items[i % len(items)], "trans_date_begin": "2024-01-01"}),
+        "/barcodes": lambda i: ("GET", "/barcodes", {"sort": sorts[i % len(sorts)], "dir": "asc" if i % 2 else "desc"}),
+        "/barcodes (filtered)": lambda i: ("GET", "/barcodes", {"description": "widget 1", "exp_date": "2024-0" + str(i % 9 + 1)}),
+        "/inventory": lambda i: ("GET", "/inventory", {}),
+        "/add_item": lambda i: ("POST", "/add_item", {
+            "barcode": str(synthetic.LAST_BARCODE - i),
+            "item_number": items[i % len(items)],
+            "description": "Benchmark widget",
+            "lot_number": "BENCH",
+            "exp_date": "2027-01-01",
+            "employee": "benchmark",
+            "item_type": "Damage",
+            "quantity": "10",
+        }),
+        "/remove_item": lambda i: ("POST", "/remove_item", {
+            "barcode": active[i % len(active)],
+            "employee": "benchmark",
+            "quantity": "1",
+            "remove": "DO_REMOVE",
+        }),
+        # Starts an export job and polls it until the workbook is built, then downloads it
+        "/export_jobs": lambda i: ("EXPORT", "/export_jobs", {}),
+    }
+
+
+# Peak RSS is a process-wide high-water mark. On Linux it can be reset between routes;
+# elsewhere the reported value is the peak so far.
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Start an export job, wait for it to finish and download its file
+def run_export(client, path):
+    job = client.post(path).json()
+    while job["status"] == "running":
+        time.sleep(0.05)
+        job = client.get(f"{path}/{job['id']}").json()
+    if job["status"] != "done":
+        raise RuntimeError(f"Export failed: {job['error']}")
+    return client.get(job["file"])
+
+
+def run_route(client, request, count, warm_cache):
+    latencies = []
+    sizes = []
+    reset = reset_peak_rss()
+    for i in range(count):
+        method, path, params = request(i)
+        if not warm_cache:
+            main.BARCODE_CACHE.invalidate_queries()
+            # New version tags, so every export builds its workbook rather than reusing the last one
+            main.DATA_VERSION = main.DataVersion()
+        start = time.perf_counter()
+        if method == "EXPORT":
+            response = run_export(client, path)
+        elif method == "GET":
+            response = client.get(path, params=params)
+        else:
+            response = client.post(path, data=params, follow_redirects=False)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} returned {response.status_code}")
+        sizes.append(len(response.content))
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "requests": count,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p90_ms": round(float(np.percentile(latencies, 90)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "max_ms": round(float(latencies.max()), 3),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "peak_rss_reset": reset,
+        "response_bytes": int(np.mean(sizes)),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Benchmark the app's routes against a local SQLite database.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--requests", type=int, default=20, help="requests per route")
+    parser.add_argument("--export-requests", type=int, default=2, help="requests for /export_jobs")
+    parser.add_argument("--routes", nargs="+", help="only run these routes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warm-cache", action="store_true", help="keep cached query results between requests")
+    parser.add_argument("--output", default="bench_routes.json")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'route':<26} {'rows':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'peak RSS MB':>12} {'bytes':>10}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as directory:
+            # Every size starts from a fresh database, an empty cache and no finished exports,
+            # so nothing built for the previous size is reused
+            main.STORAGE = main.InstrumentedStorage(SQLiteStorage(os.path.join(directory, "bench.db")), main.METRICS, payload_bytes=main.METRICS_PAYLOAD_BYTES)
+            main.BARCODE_CACHE = main.BarcodeCache(ttl=main.BARCODE_CACHE_TTL, max_rows=main.BARCODE_CACHE_MAX_ROWS)
+            main.DATA_VERSION = main.DataVersion()
+            main.EXPORT_JOBS = main.ExportJobs(os.path.join(directory, "exports"))
+            main.STORAGE.setup()
+            transactions, barcodes = synthetic.generate(rows, seed=args.seed)
+            synthetic.load(main.STORAGE, transactions, barcodes)
+
+            with TestClient(main.app) as client:
+                client.cookies.set("session", main.SECRET_KEY)
+                for route, request in route_requests(rows, barcodes).items():
+                    if args.routes and route.split(" ")[0] not in args.routes and route not in args.routes:
+                        continue
+                    count = args.export_requests if route == "/export_jobs" else args.requests
+                    result = {"route": route, "rows": rows, **run_route(client, request, count, args.warm_cache)}
+                    results.append(result)
+                    print(f"{route:<26} {rows:>9} {result['p50_ms']:>9.1f} {result['p90_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                          f"{result['peak_rss_bytes'] / 2**20:>12.1f} {result['response_bytes']:>10}")
+            main.STORAGE.connection.close()
+
+    report = {
+        "revision": git_revision(),
+        "created": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": "sqlite",
+        "seed": args.seed,
+        "warm_cache": args.warm_cache,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,74 @@
+# Deterministic synthetic data for the benchmarks.
+#
+# generate(rows, seed) builds `rows` transactions and the barcodes they leave behind:
+# every barcode has an Add transaction, and the remaining transactions remove part or
+# all of a barcode's quantity. The same (rows, seed) always gives the same data.
+import numpy as np
+import pandas as pd
+
+ITEM_TYPES = ["Vendor Damage", "Damage", "Expired", "Short Dated", "Return"]
+EMPLOYEES = ["alice", "bob", "carol", "dave", "erin", "frank", "grace", "heidi"]
+FIRST_BARCODE = 100000
+LAST_BARCODE = 999999
+# Barcodes above this are never generated, so benchmarks can add new ones
+RESERVED_BARCODES = 10000
+BASE_DATE = pd.Timestamp("2023-01-01")
+
+
+# Return (transactions, barcodes) DataFrames with the database column names
+def generate(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    capacity = LAST_BARCODE - FIRST_BARCODE + 1 - RESERVED_BARCODES
+    barcode_count = min(max(rows - rows * 2 // 5, 1), capacity)
+    remove_count = min(rows - barcode_count, barcode_count)
+    barcode_count = rows - remove_count
+    if barcode_count > capacity:
+        raise ValueError(f"At most {capacity * 2} rows can be generated")
+
+    items = rng.integers(0, max(barcode_count // 50, 10), barcode_count)
+    added = rng.integers(1, 50, barcode_count)
+    barcodes = pd.DataFrame({
+        "barcode": (FIRST_BARCODE + rng.permutation(capacity)[:barcode_count]).astype(str),
+        "item_number": [f"ITEM-{i:05d}" for i in items],
+        "description": [f"Widget {i} ({ITEM_TYPES[i % len(ITEM_TYPES)].lower()})" for i in items],
+        "lot_number": [f"L{i:06d}" for i in rng.integers(0, max(barcode_count // 5, 10), barcode_count)],
+        "exp_date": (BASE_DATE + pd.to_timedelta(rng.integers(0, 1500, barcode_count), unit="D")).strftime("%Y-%m-%d"),
+        "typ": rng.choice(ITEM_TYPES, barcode_count),
+        "quantity": added,
+        "remove": 0,
+    })
+
+    # Adds are spread over three years; each remove follows its barcode's add
+    add_seconds = rng.integers(0, 3 * 365 * 86400, barcode_count)
+    adds = barcodes.drop(columns=["quantity", "remove"]).assign(
+        add_remove="Add",
+        quantity=added,
+        seconds=add_seconds,
+    )
+
+    removed = rng.choice(barcode_count, remove_count, replace=False)
+    removed_quantity = rng.integers(1, added[removed] + 1)
+    removes = barcodes.iloc[removed].drop(columns=["quantity", "remove"]).assign(
+        add_remove="Remove",
+        quantity=removed_quantity,
+        seconds=add_seconds[removed] + rng.integers(60, 90 * 86400, remove_count),
+    )
+    barcodes.loc[barcodes.index[removed], "quantity"] = added[removed] - removed_quantity
+    barcodes.loc[barcodes.index[removed], "remove"] = (added[removed] == removed_quantity).astype(int)
+
+    # Sorted by trans_date, so trans_ids assigned on insert follow it as they do for real data
+    transactions = pd.concat([adds, removes], ignore_index=True).sort_values("seconds", kind="stable", ignore_index=True)
+    transactions["employee"] = rng.choice(EMPLOYEES, len(transactions))
+    # Written like the app's str(pd.Timestamp.now()), with microseconds, so one format runs through the table
+    microseconds = transactions["seconds"] * 10**6 + rng.integers(1, 10**6, len(transactions))
+    transactions["trans_date"] = (BASE_DATE + pd.to_timedelta(microseconds, unit="us")).astype(str)
+    return transactions.drop(columns="seconds"), barcodes
+
+
+# Write generated data through a Storage backend and rebuild the inventory aggregate and rollups
+def load(storage, transactions, barcodes, batch_size=10000):
+    for table, df in (("transactions", transactions), ("barcodes", barcodes)):
+        for start in range(0, len(df), batch_size):
+            storage.insert(table, df.iloc[start:start + batch_size].to_dict("records"))
+    storage.rebuild_inventory()
+    storage.rebuild_rollups()
@@ -0,0 +1,150 @@
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+
+# In-process read-through cache for barcode data.
+#
+# Holds two kinds of entries in one LRU:
+#   - point lookups, keyed by barcode, holding the row (or None if it does not exist)
+#   - query results (lists of rows or DataFrames), keyed by a description of the query
+# Entries expire after `ttl` seconds, and the least recently used ones are evicted once
+# more than `max_rows` rows are cached. Write routes patch point entries directly and
+# drop all query results, since any barcode write can change them.
+class BarcodeCache:
+    def __init__(self, ttl=30.0, max_rows=50000):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value, rows)
+        self._rows = 0
+        self._generation = 0  # bumped by every write, so a load that raced a write is not cached
+        self._lock = threading.Lock()
+
+    # Return the cached value for key, or call loader() and cache its result
+    def get_or_load(self, key, loader):
+        hit, value, generation = self._lookup(key)
+        if hit:
+            return value
+
+        value = loader()
+        self._store(key, value, generation)
+        return _copy(value)
+
+    # Same as get_or_load, for an async loader
+    async def aget_or_load(self, key, loader):
+        hit, value, generation = self._lookup(key)
+        if hit:
+            return value
+
+        value = await loader()
+        self._store(key, value, generation)
+        return _copy(value)
+
+    # Cached barcode row (or None if the barcode does not exist)
+    def get_barcode(self, barcode, loader):
+        return self.get_or_load(("barcode", str(barcode)), loader)
+
+    async def aget_barcode(self, barcode, loader):
+        return await self.aget_or_load(("barcode", str(barcode)), loader)
+
+    # Replace the cached row for a barcode after a write (None marks it as deleted)
+    def put_barcode(self, barcode, record):
+        with self._lock:
+            self._generation += 1
+        self._store(("barcode", str(barcode)), _copy(record))
+        self.invalidate_queries()
+
+    # Replace the cached rows for many barcodes after a bulk write
+    def put_barcodes(self, records):
+        with self._lock:
+            self._generation += 1
+        for barcode, record in records.items():
+            self._store(("barcode", str(barcode)), _copy(record))
+        self.invalidate_queries()
+
+    # Drop every cached query result
+    def invalidate_queries(self):
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._entries if key[0] == "query"]:
+                self._rows -= self._entries.pop(key)[2]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "rows": self._rows,
+                "max_rows": self.max_rows,
+                "ttl": self.ttl,
+            }
+
+    # (True, value, None) on a hit; (False, None, generation) on a miss
+    def _lookup(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, _copy(entry[1]), None
+            self.misses += 1
+            return False, None, self._generation
+
+    def _store(self, key, value, generation=None):
+        rows = max(len(value), 1) if isinstance(value, (list, pd.DataFrame)) else 1
+        if rows > self.max_rows:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            old = self._entries.pop(key, None)
+            if old:
+                self._rows -= old[2]
+            self._entries[key] = (time.monotonic() + self.ttl, value, rows)
+            self._rows += rows
+            while self._rows > self.max_rows:
+                _, (_, _, evicted_rows) = self._entries.popitem(last=False)
+                self._rows -= evicted_rows
+                self.evictions += 1
+
+
+# Tags for versions of the app's data. The version is the database's counter (see
+# Storage.data_version()), which every write bumps whichever process or tool makes it; a
+# random per-process prefix keeps tags handed out before a restart from matching. Views
+# combine it with their request parameters into an ETag, so a refresh with nothing changed
+# can be answered with a 304 after one primary key read.
+class DataVersion:
+    def __init__(self):
+        self._prefix = secrets.token_hex(4)
+
+    # Identifier of a data version
+    def tag(self, version):
+        return f"{self._prefix}-{version}"
+
+    # Strong ETag for a data version of the view described by parts
+    def etag(self, version, *parts):
+        digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+        return f'"{self.tag(version)}-{digest}"'
+
+
+# Callers may modify what they get back, so hand out copies of cached rows
+def _copy(value):
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, list):
+        return [dict(row) for row in value]
+    if isinstance(value, dict):
+        return dict(value)
+    return value
@@ -0,0 +1,129 @@
+import asyncio
+import glob
+import logging
+import os
+import secrets
+import time
+
+logger = logging.getLogger("quality_inventory.export_jobs")
+
+FILE_PREFIX = "export-"
+# Files left in the directory by earlier processes are deleted once they are this old (seconds)
+STALE_FILE_AGE = 86400
+
+
+# Export workbooks built in the background and kept on local disk.
+#
+# A job builds the file for one data version (see DataVersion.tag()) as a task on the
+# app's event loop, so the request that starts it returns at once with the job id; the
+# builder reports progress on the job as it goes. Starting an export for a version that
+# already has a job returns that job, so concurrent requests share one build, and once
+# the file is written it is served to every requester until the data changes. Files of
+# older versions are deleted when a newer one is finished.
+#
+# Versions do not survive a restart, so files left by earlier processes are never served
+# again; they are deleted at startup once they are STALE_FILE_AGE old (younger ones may
+# belong to another worker sharing the directory).
+class ExportJobs:
+    def __init__(self, directory):
+        self.directory = directory
+        self._jobs = {}      # job id -> job
+        self._versions = {}  # data version -> job id
+        self._tasks = set()
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, FILE_PREFIX + "*")):
+            if time.time() - os.path.getmtime(path) > STALE_FILE_AGE:
+                os.remove(path)
+
+    # The job for a data version, started with build(path, job) if there is none (or the
+    # last one failed or lost its file). build writes the file at path and may update
+    # job["rows"] and job["expected"] as it goes.
+    def start(self, version, build):
+        job = self.for_version(version)
+        if job and (job["status"] == "running" or job["status"] == "done" and os.path.exists(job["path"])):
+            return job
+
+        job = {
+            "id": secrets.token_hex(8),
+            "version": version,
+            "status": "running",
+            "rows": 0,
+            "expected": None,
+            "started": time.time(),
+            "finished": None,
+            "error": None,
+            "path": os.path.join(self.directory, f"{FILE_PREFIX}{version}.xlsx"),
+        }
+        self._jobs[job["id"]] = job
+        self._versions[version] = job["id"]
+        task = asyncio.create_task(self._run(job, build))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def for_version(self, version):
+        return self._jobs.get(self._versions.get(version))
+
+    # A job's progress for API responses
+    def describe(self, job):
+        progress = 1.0 if job["status"] == "done" else (
+            min(job["rows"] / job["expected"], 0.99) if job["expected"] else 0.0
+        )
+        return {
+            "id": job["id"],
+            "status": job["status"],
+            "rows": job["rows"],
+            "expected": job["expected"],
+            "progress": round(progress, 3),
+            "started": job["started"],
+            "finished": job["finished"],
+            "error": job["error"],
+        }
+
+    def stats(self):
+        return {
+            "jobs": len(self._jobs),
+            "running": sum(job["status"] == "running" for job in self._jobs.values()),
+            "files": len(glob.glob(os.path.join(self.directory, FILE_PREFIX + "*.xlsx"))),
+        }
+
+    # Cancel the running jobs and wait for them to clean up; runs at app shutdown
+    async def shutdown(self):
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Write to a partial file and rename it into place, so a file at a job's path is always complete
+    async def _run(self, job, build):
+        partial = job["path"] + ".part"
+        try:
+            await build(partial, job)
+            os.replace(partial, job["path"])
+            job["status"] = "done"
+            self._drop_older(job)
+        except asyncio.CancelledError:
+            job["status"] = "failed"
+            job["error"] = "Cancelled"
+            raise
+        except Exception as e:
+            logger.exception("Export %s failed", job["id"])
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished"] = time.time()
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    # Forget the finished jobs started before this one and delete their files
+    def _drop_older(self, current):
+        for job in list(self._jobs.values()):
+            if job["status"] != "running" and job["started"] < current["started"]:
+                del self._jobs[job["id"]]
+                if self._versions.get(job["version"]) == job["id"]:
+                    del self._versions[job["version"]]
+                if os.path.exists(job["path"]):
+                    os.remove(job["path"])
@@ -0,0 +1,136 @@
+import asyncio
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from storage import INVENTORY_KEY
+
+# Point-in-time inventory, replayed from the transaction log.
+#
+# Inventory at a moment is the sum of Add minus Remove quantities of every transaction
+# before it, per (item_number, lot_number, exp_date, typ). So that a historical query
+# does not replay the whole log, the inventory at the start of every month is stored as
+# a checkpoint (inventory_checkpoints and inventory_checkpoint_rows) and a query replays
+# only the transactions between the nearest checkpoint and its moment.
+#
+# Checkpoints are built forward, a month of transactions at a time, from the latest one:
+# at startup and whenever a query needs one that does not exist yet. Editing or deleting a
+# transaction drops the checkpoints after it, and they are rebuilt the same way.
+
+CHECKPOINT_COLUMNS = INVENTORY_KEY + ["quantity"]
+CHECKPOINT_INSERT_BATCH = 1000
+
+# Checkpoints are built by one task at a time
+_build_lock = asyncio.Lock()
+
+
+# Inventory (item_number, lot_number, exp_date, typ, quantity) just before `when`, limited
+# to the rows matching filters on those columns
+async def inventory_as_of(storage, when, filters=(), workers=4):
+    when = pd.Timestamp(when)
+    await build_checkpoints(storage, min(when.date(), dt.date.today()), workers)
+
+    day = await latest_checkpoint(storage, when.date())
+    base = await checkpoint_rows(storage, day, filters, workers) if day else empty_inventory()
+    transactions = await transactions_between(storage, day, when, filters, workers)
+    return replay(base, transactions).sort_values(INVENTORY_KEY, ignore_index=True, na_position="first")
+
+
+# Store a checkpoint for every month start up to `until` that is missing after the latest one
+async def build_checkpoints(storage, until, workers=4):
+    async with _build_lock:
+        day = await latest_checkpoint(storage, until)
+        if day:
+            state = await checkpoint_rows(storage, day, (), workers)
+            boundary = next_month(day)
+        else:
+            first = await storage.aselect("transactions", columns="trans_date", order=[("trans_date", False)], limit=1)
+            if not first:
+                return
+            state = empty_inventory()
+            boundary = next_month(pd.Timestamp(first[0]["trans_date"]).date())
+
+        while boundary <= until:
+            state = replay(state, await transactions_between(storage, day, boundary, (), workers))
+            await save_checkpoint(storage, boundary, state)
+            day, boundary = boundary, next_month(boundary)
+
+
+# Drop the checkpoints that include a transaction dated trans_date, after it was edited or
+# deleted. Only the headers are deleted, which is enough to hide them; their rows are
+# replaced when the checkpoint is built again.
+async def invalidate_checkpoints(storage, trans_date):
+    async with _build_lock:
+        await storage.adelete("inventory_checkpoints", [("day", "gt", pd.Timestamp(trans_date).date().isoformat())])
+
+
+# Day of the latest checkpoint on or before `day` (None if there is none)
+async def latest_checkpoint(storage, day):
+    rows = await storage.aselect(
+        "inventory_checkpoints",
+        columns="day",
+        filters=[("day", "lte", day.isoformat())],
+        order=[("day", True)],
+        limit=1
+    )
+    return pd.Timestamp(rows[0]["day"]).date() if rows else None
+
+
+async def checkpoint_rows(storage, day, filters, workers):
+    rows = await storage.afetch_all(
+        "inventory_checkpoint_rows",
+        columns=", ".join(CHECKPOINT_COLUMNS),
+        filters=[("day", "eq", day.isoformat()), *filters],
+        order=[(column, False) for column in INVENTORY_KEY],
+        workers=workers
+    )
+    return rows
+
+
+# Transactions dated from `start` (None for the beginning) up to but not including `end`
+async def transactions_between(storage, start, end, filters, workers):
+    bounds = [("trans_date", "lt", pd.Timestamp(end).isoformat(sep=" "))]
+    if start:
+        bounds.append(("trans_date", "gte", pd.Timestamp(start).isoformat(sep=" ")))
+    return await storage.afetch_all(
+        "transactions",
+        columns="trans_id, " + ", ".join(INVENTORY_KEY) + ", add_remove, quantity",
+        filters=[*bounds, *filters],
+        order=[("trans_id", False)],
+        workers=workers
+    )
+
+
+# Rows first, then the header that makes the checkpoint visible, so a half-written
+# checkpoint is never read
+async def save_checkpoint(storage, day, state):
+    await storage.adelete("inventory_checkpoint_rows", [("day", "eq", day.isoformat())])
+    rows = state.astype(object).where(state.notna(), None).to_dict("records")
+    for start in range(0, len(rows), CHECKPOINT_INSERT_BATCH):
+        await storage.ainsert("inventory_checkpoint_rows", [
+            {"day": day.isoformat(), **row} for row in rows[start:start + CHECKPOINT_INSERT_BATCH]
+        ])
+    await storage.ainsert("inventory_checkpoints", [{"day": day.isoformat(), "created_at": str(pd.Timestamp.now())}])
+
+
+# Inventory after applying transactions to a base inventory: Add quantities count up,
+# Remove quantities down; groups left at zero or below are dropped
+def replay(base, transactions):
+    if transactions.empty:
+        return base[CHECKPOINT_COLUMNS].reset_index(drop=True)
+    sign = np.select([transactions["add_remove"] == "Add", transactions["add_remove"] == "Remove"], [1, -1], 0)
+    deltas = transactions[INVENTORY_KEY].assign(quantity=sign * pd.to_numeric(transactions["quantity"]).fillna(0).astype(int))
+    totals = (
+        pd.concat([base[CHECKPOINT_COLUMNS], deltas], ignore_index=True)
+        .groupby(INVENTORY_KEY, dropna=False, as_index=False)["quantity"].sum()
+    )
+    return totals[totals["quantity"] > 0].reset_index(drop=True)
+
+
+def empty_inventory():
+    return pd.DataFrame({column: pd.Series(dtype=object) for column in INVENTORY_KEY} | {"quantity": pd.Series(dtype=int)})
+
+
+def next_month(day):
+    return dt.date(day.year + day.month // 12, day.month % 12 + 1, 1)
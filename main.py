@@ -1,17 +1,40 @@
-from io import BytesIO
+import csv
+import asyncio
+import html
 import os
+import re
+import tempfile
 import pandas as pd
-from supabase import create_client
+from openpyxl import Workbook
 from dotenv import load_dotenv
 from fasthtml.common import *
 import datetime as dt
+from urllib.parse import urlencode
+from barcode_index import BarcodeIndex, ExpiryIndex
+from cache import BarcodeCache, DataVersion
+from export_jobs import ExportJobs
+from inventory_history import build_checkpoints, inventory_as_of, invalidate_checkpoints
+from metrics import InstrumentedStorage, Metrics, MetricsMiddleware
+from reconcile import queue_barcodes, reconcile
+from search_index import LATE_COMMIT_IDS, SEARCH_FIELDS, SearchIndex
+from storage import ROLLUP_DIMENSIONS, create_storage
 
 load_dotenv()
 
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "quality_inventory.db")
 PASSWORD = os.getenv("PASSWORD")
 SECRET_KEY = os.getenv("SECRET_KEY")
+BARCODE_CACHE_TTL = float(os.getenv("BARCODE_CACHE_TTL", "30"))
+BARCODE_CACHE_MAX_ROWS = int(os.getenv("BARCODE_CACHE_MAX_ROWS", "50000"))
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "4"))
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.5"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Also record the JSON size of storage results; costly for large reads, so off by default
+METRICS_PAYLOAD_BYTES = os.getenv("METRICS_PAYLOAD_BYTES", "0") == "1"
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "quality_inventory_exports"))
 
 BUTTON_STYLE = (
     "display: block; "
@@ -30,6 +53,28 @@ LABEL_STYLE = "width: 35%; font-weight: bold; padding-right: 10px; padding-botto
 INPUT_STYLE = "width: 65%; padding: 6px;"
 BACK_BUTTON_STYLE = BUTTON_STYLE + "background: #555;"
 SUBMIT_BUTTON_STYLE = BUTTON_STYLE + "background: #1e88e5;"
+INPUT_ERROR_STYLE = "border: 2px solid #d9534f;"
+LINK_STYLE = "color:#1e88e5; text-decoration:none;"
+PAGER_LINK_STYLE = "padding: 6px 14px; border-radius: 6px; background: #1e88e5; color: white; text-decoration: none;"
+
+# Page sizes offered on paged list pages
+PAGE_SIZES = [50, 100, 250, 500]
+DEFAULT_PAGE_SIZE = 100
+
+ITEM_TYPES = ["Vendor Damage", "Damage", "Expired", "Short Dated", "Return"]
+
+# Columns of a bulk-add row, in the order they are pasted
+BULK_ADD_COLUMNS = ["barcode", "item_number", "description", "lot_number", "exp_date", "item_type", "quantity"]
+# Most rows accepted by one bulk add or batch scan-out
+BULK_MAX_ROWS = 1000
+# Rows shown per table on the search page
+SEARCH_RESULTS = 50
+# Default window of the expiring report, in days from today
+EXPIRING_DAYS = 30
+# Default window of /analytics, in days up to today, and how many values it charts
+# for a dimension when no value is asked for
+ANALYTICS_DAYS = 90
+ANALYTICS_TOP = 20
 
 TABLE_STYLES = Style("""
 .data-table {
@@ -60,46 +105,618 @@ TABLE_STYLES = Style("""
 }
 """)
 
-SUPABASE = create_client(SUPABASE_URL, SUPABASE_KEY)
-app, rt = fast_app(hdrs=[TABLE_STYLES])
+METRICS = Metrics(slow_seconds=SLOW_QUERY_SECONDS)
+
+# Every storage call is timed by table and operation
+STORAGE = InstrumentedStorage(
+    create_storage(STORAGE_BACKEND, supabase_url=SUPABASE_URL, supabase_key=SUPABASE_KEY, sqlite_path=SQLITE_PATH),
+    METRICS,
+    payload_bytes=METRICS_PAYLOAD_BYTES
+)
+
+# Inventory delta for a barcode row: the quantity it adds to (sign=1) or takes from (sign=-1)
+# its inventory group. Removed barcodes are not counted in inventory.
+def inventory_delta(record, sign=1):
+    if int(record.get("remove") or 0) != 0:
+        return None
+    return {
+        "item_number": record.get("item_number"),
+        "lot_number": record.get("lot_number"),
+        "exp_date": record.get("exp_date"),
+        "typ": record.get("typ"),
+        "quantity": sign * int(record.get("quantity") or 0),
+    }
+
+# Apply inventory deltas in a single round trip
+async def apply_inventory_deltas(deltas):
+    deltas = [delta for delta in deltas if delta and delta["quantity"]]
+    if deltas:
+        await STORAGE.aapply_inventory_deltas(deltas)
+
+# Daily rollup delta for a transaction row: counting it in (sign=1) or taking it back (sign=-1)
+def rollup_delta(transaction, sign=1):
+    return {
+        "trans_date": str(transaction.get("trans_date")),
+        "typ": transaction.get("typ"),
+        "item_number": transaction.get("item_number"),
+        "employee": transaction.get("employee"),
+        "add_remove": transaction.get("add_remove"),
+        "transactions": sign,
+        "quantity": sign * int(transaction.get("quantity") or 0),
+    }
+
+# Apply daily rollup deltas in a single round trip
+async def apply_rollup_deltas(deltas):
+    if deltas:
+        await STORAGE.aapply_rollup_deltas(deltas)
+
+BARCODE_CACHE = BarcodeCache(ttl=BARCODE_CACHE_TTL, max_rows=BARCODE_CACHE_MAX_ROWS)
+DATA_VERSION = DataVersion()
+BARCODE_INDEX = BarcodeIndex()
+EXPIRY_INDEX = ExpiryIndex()
+SEARCH_INDEX = SearchIndex()
+EXPORT_JOBS = ExportJobs(EXPORT_DIR)
+
+# Barcode row by barcode, read through the cache (None if it does not exist)
+async def get_barcode(barcode):
+    async def load():
+        rows = await STORAGE.aselect("barcodes", filters=[("barcode", "eq", barcode)])
+        return rows[0] if rows else None
+    return await BARCODE_CACHE.aget_barcode(barcode, load)
+
+# Barcode row for a scan. A barcode the in-process index has as removed comes back from it,
+# with just its barcode and remove flag. Any other is read from the database, since another
+# process may have removed or changed it since the index saw it, and the fresh row is put
+# in the in-process copies.
+async def scan_barcode(barcode):
+    hit, record = BARCODE_INDEX.get(barcode)
+    if hit and int(record.get("remove") or 0) != 0:
+        return record
+    rows = await STORAGE.aselect("barcodes", filters=[("barcode", "eq", barcode)])
+    record = rows[0] if rows else None
+    barcodes_written({barcode: record})
+    return record
+
+# Bring the in-process copies of the barcodes up to date after a write. `records` maps
+# each written barcode to its new row (None if it was deleted).
+def barcodes_written(records):
+    BARCODE_CACHE.put_barcodes(records)
+    BARCODE_INDEX.put_barcodes(records)
+    EXPIRY_INDEX.put_barcodes(records)
+    SEARCH_INDEX.put("barcodes", records)
+
+# Bring the rollups, inventory checkpoints and in-process copies up to date after
+# transactions were edited or deleted, and queue their barcodes for reconciliation: `old`
+# are the rows before the write and `new` the rows after it (none for a delete). New
+# transactions are picked up by index_new_transactions().
+async def transactions_edited(old, new):
+    await apply_rollup_deltas([rollup_delta(row, sign=-1) for row in old] + [rollup_delta(row) for row in new])
+    for row in old:
+        await invalidate_checkpoints(STORAGE, row["trans_date"])
+    await queue_barcodes(STORAGE, [row.get("barcode") for row in old + new])
+    SEARCH_INDEX.put("transactions", {row["trans_id"]: None for row in old} | {row["trans_id"]: row for row in new})
+
+# Add the transactions written since the search index was last brought up to date, a page
+# at a time (one request when there are only a few). The last LATE_COMMIT_IDS ids already
+# passed are read again, for transactions that committed after a higher trans_id.
+async def index_new_transactions():
+    if not SEARCH_INDEX.ready:
+        return
+    rows = await STORAGE.afetch_all(
+        "transactions",
+        columns="trans_id, " + ", ".join(SEARCH_FIELDS["transactions"]),
+        filters=[("trans_id", "gt", max(SEARCH_INDEX.high_water - LATE_COMMIT_IDS, 0))],
+        order=[("trans_id", False)],
+        workers=1
+    )
+    SEARCH_INDEX.put("transactions", dict(zip(rows["trans_id"].tolist(), rows.to_dict("records"))))
+
+# Rows whose key column is one of keys (in no particular order)
+async def select_by_keys(table, column, keys):
+    if not keys:
+        return []
+    return await STORAGE.aselect(table, filters=[(column, "in_", keys)])
+
+# Fill the barcode, expiry and search indexes from the database; runs at startup before requests are served
+async def load_indexes():
+    barcodes, transactions = await asyncio.gather(
+        STORAGE.afetch_all("barcodes", order=[("barcode", False)], workers=FETCH_WORKERS),
+        STORAGE.afetch_all(
+            "transactions",
+            columns="trans_id, " + ", ".join(SEARCH_FIELDS["transactions"]),
+            order=[("trans_id", False)],
+            workers=FETCH_WORKERS
+        )
+    )
+    BARCODE_INDEX.load(barcodes)
+    EXPIRY_INDEX.load(barcodes)
+    SEARCH_INDEX.load(barcodes, transactions)
+
+# Store the inventory checkpoints for the months completed since the last start
+async def update_inventory_checkpoints():
+    await build_checkpoints(STORAGE, dt.date.today(), workers=FETCH_WORKERS)
+
+# Run a query whose result depends on barcodes through the cache, keyed by its description
+# and the data version, so after a write from any process it is read again
+async def cached_query(key, loader):
+    version = await STORAGE.adata_version()
+    return await BARCODE_CACHE.aget_or_load(("query", version, repr(key)), loader)
+
+# Stop the export workers of whichever ExportJobs is current at shutdown
+async def shutdown_export_jobs():
+    await EXPORT_JOBS.shutdown()
+
+app, rt = fast_app(
+    hdrs=[TABLE_STYLES],
+    on_startup=[STORAGE.setup, load_indexes, update_inventory_checkpoints],
+    on_shutdown=[shutdown_export_jobs]
+)
+app.add_middleware(MetricsMiddleware, metrics=METRICS, router=app.router)
 
 # Convert DataFrame to HTML table with clickable links
-def df_to_html_table(df, link_trans_id=False, link_barcode=False):
+def df_to_html_table(df, link_trans_id=False, link_barcode=False, header_links=None, extra_rows=""):
     if df.empty:
         return P("No data found.")
 
-    df = df.astype(str)
+    # Clickable column headers (e.g. to sort) for the columns given in header_links
+    header_links = header_links or {}
+    header = Thead(Tr(*[
+        Th(A(header_links[col][0], href=header_links[col][1], style="color:white; text-decoration:none;") if col in header_links else col)
+        for col in df.columns
+    ]))
 
-    header = Thead(Tr(*[Th(col) for col in df.columns]))
+    with METRICS.time("render_table"):
+        rows = html_table_rows(df, link_trans_id, link_barcode)
+    return Table(header, Tbody(NotStr(rows + extra_rows)), cls="data-table")
 
-    body_rows = []
-    for _, row in df.iterrows():
-        cells = []
+# Render DataFrame rows as <tr> markup. Cells are built a column at a time as escaped
+# strings rather than as one FastHTML component per cell, which is much cheaper on big tables.
+def html_table_rows(df, link_trans_id=False, link_barcode=False):
+    if df.empty:
+        return ""
 
-        for col in df.columns:
-            value = row[col]
+    rows = None
+    for col in df.columns:
+        raw = df[col].astype(str)
+        values = raw.map(lambda value: html.escape(value, quote=False))
 
-            # Clickable Trans ID ONLY if enabled
-            if col == "Trans ID" and link_trans_id:
-                value = A(
-                    value,
-                    href=f"/edit_transaction?trans_id={row['Trans ID']}",
-                    style="color:#1e88e5; text-decoration:none;"
-                )
+        # Clickable Trans ID ONLY if enabled
+        if col == "Trans ID" and link_trans_id:
+            cells = '<td><a href="/edit_transaction?trans_id=' + raw.map(html.escape) + f'" style="{LINK_STYLE}">' + values + "</a></td>"
 
-            # Clickable Barcode ONLY if enabled
-            elif col == "Barcode" and link_barcode:
-                value = A(
-                    value,
-                    href=f"/edit_barcode?barcode={row['Barcode']}",
-                    style="color:#1e88e5; text-decoration:none;"
-                )
+        # Clickable Barcode ONLY if enabled
+        elif col == "Barcode" and link_barcode:
+            cells = '<td><a href="/edit_barcode?barcode=' + raw.map(html.escape) + f'" style="{LINK_STYLE}">' + values + "</a></td>"
+
+        else:
+            cells = "<td>" + values + "</td>"
+
+        rows = cells if rows is None else rows + cells
+
+    return "".join(("<tr>" + rows + "</tr>").tolist())
+
+# Transactions rows as a DataFrame with the column headings the tables show
+def transactions_frame(rows):
+    df = pd.DataFrame(rows, columns=["trans_id", "barcode", "item_number", "description", "lot_number", "exp_date", "typ", "add_remove", "quantity", "trans_date", "employee"])
+    df.columns = ["Trans ID", "Barcode", "Item #", "Description", "Lot #", "Exp Date", "Type", "Add/Remove", "Quantity", "Trans Date", "Employee"]
+    df["Trans Date"] = pd.to_datetime(df["Trans Date"], format="ISO8601").dt.floor("s")
+    return df
+
+# Read a positive integer query parameter, falling back to a default
+def parse_int(value, default, minimum=1):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return value if value >= minimum else default
+
+# Read the requested page size, limited to the sizes offered in the UI
+def parse_page_size(page_size):
+    page_size = parse_int(page_size, DEFAULT_PAGE_SIZE)
+    return page_size if page_size in PAGE_SIZES else DEFAULT_PAGE_SIZE
+
+# Build a "contains" pattern for ilike, escaping the LIKE wildcards in user input
+def like_pattern(value):
+    value = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{value}%"
+
+# Turn a full or partial date ("2025", "2025-03", "2025-03-14") into a [start, end) range
+def date_prefix_range(value):
+    value = value.strip()
+    for fmt in ("%Y-%m-%d", "%Y-%m", "%Y"):
+        try:
+            start = dt.datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+        if fmt == "%Y-%m-%d":
+            end = start + dt.timedelta(days=1)
+        elif fmt == "%Y-%m":
+            end = (start.replace(day=28) + dt.timedelta(days=4)).replace(day=1)
+        else:
+            end = start.replace(year=start.year + 1)
+        return start.isoformat(), end.isoformat()
+    return None
+
+# Server-side filters for a list page: ilike for the text boxes, a date range for Exp Date
+def list_filters(contains, exp_date=None):
+    filters = []
+    input_errors = {}
+
+    # Case-insensitive "contains" filters
+    for column, value in contains:
+        if value:
+            filters.append((column, "ilike", like_pattern(value)))
+
+    # Exp Date matches a whole year, month or day
+    if exp_date:
+        date_range = date_prefix_range(exp_date)
+        if date_range:
+            filters.append(("exp_date", "gte", date_range[0]))
+            filters.append(("exp_date", "lt", date_range[1]))
+        else:
+            input_errors["exp_date"] = True
+
+    return filters, input_errors
+
+# Server-side filters for the transactions list
+def transaction_filters(
+    barcode=None,
+    item_number=None,
+    description=None,
+    lot_number=None,
+    exp_date=None,
+    item_type=None,
+    employee=None,
+    trans_date_begin=None,
+    trans_date_end=None
+):
+    filters, input_errors = list_filters([
+        ("barcode", barcode),
+        ("item_number", item_number),
+        ("description", description),
+        ("lot_number", lot_number),
+        ("typ", item_type),
+        ("employee", employee),
+    ], exp_date)
+
+    # Handle date filters with error highlighting
+    if trans_date_begin:
+        try:
+            filters.append(("trans_date", "gte", pd.to_datetime(trans_date_begin).isoformat(sep=" ")))
+        except Exception:
+            input_errors["trans_date_begin"] = True
+
+    if trans_date_end:
+        try:
+            filters.append(("trans_date", "lte", pd.to_datetime(trans_date_end).isoformat(sep=" ")))
+        except Exception:
+            input_errors["trans_date_end"] = True
+
+    return filters, input_errors
+
+# Previous/next page links for offset-paged lists
+def pager(path, params, page, has_next):
+    params = {key: value for key, value in params.items() if value}
+
+    def page_link(label, number):
+        return A(label, href=f"{path}?{urlencode({**params, 'page': number})}", style=PAGER_LINK_STYLE)
+
+    return Div(
+        page_link("Prev", page - 1) if page > 1 else Span(),
+        Span(f"Page {page}"),
+        page_link("Next", page + 1) if has_next else Span(),
+        style="display:flex; justify-content:center; align-items:center; gap:20px; margin-top:10px;"
+    )
+
+# Row at the end of a scrolling transactions table that, once scrolled into view, replaces
+# itself with the next chunk of rows (and the next such row, if there are more)
+def next_chunk_row(params, after, colspan):
+    params = {key: value for key, value in params.items() if value}
+    return to_xml(Tr(
+        Td("Loading more...", colspan=colspan, style="text-align:center; color:#888;"),
+        hx_get=f"/transactions_rows?{urlencode({**params, 'after': after})}",
+        hx_trigger="intersect once",
+        hx_swap="outerHTML"
+    ))
+
+# Keyset filter for the rows that come after (or before) a cursor row in the given sort order.
+# Ties on the sort column are broken by barcode, which is unique, and rows without a sort
+# value come last in either direction (see keyset_order).
+def keyset_filter(sort, descending, cursor_barcode, cursor_value, forward=True):
+    op = "lt" if descending == forward else "gt"
+    if sort == "barcode":
+        return ("barcode", op, cursor_barcode)
+    if cursor_value is None:
+        # The cursor is among the rows without a value; before it also come all the rows with one
+        groups = [[(sort, "is_", None), ("barcode", op, cursor_barcode)]]
+        if not forward:
+            groups.append([(sort, "not_is_", None)])
+    else:
+        groups = [
+            [(sort, op, cursor_value)],
+            [(sort, "eq", cursor_value), ("barcode", op, cursor_barcode)],
+        ]
+        if forward:
+            groups.append([(sort, "is_", None)])
+    return (None, "or_", groups)
+
+# Database order for reading a keyset page: the sort order (reversed when paging back),
+# with rows without a sort value last and barcode as the tiebreaker
+def keyset_order(sort, descending, forward=True):
+    order_desc = descending == forward
+    if sort == "barcode":
+        return [("barcode", order_desc)]
+    return [(sort, order_desc, not forward), ("barcode", order_desc)]
+
+# Previous/next page links for keyset-paged lists
+def cursor_pager(path, params, prev_cursor, next_cursor):
+    params = {key: value for key, value in params.items() if value}
+
+    def page_link(label, cursor_param, cursor):
+        return A(label, href=f"{path}?{urlencode({**params, cursor_param: cursor})}", style=PAGER_LINK_STYLE)
+
+    return Div(
+        page_link("Prev", "before", prev_cursor) if prev_cursor else Span(),
+        page_link("Next", "after", next_cursor) if next_cursor else Span(),
+        style="display:flex; justify-content:center; align-items:center; gap:20px; margin-top:10px;"
+    )
+
+# htmx attributes for a list page's filter form. Typing (debounced) or changing a filter
+# fetches only the #results fragment and swaps it in, keeping the URL in step; the form's
+# own POST still works without JavaScript.
+def live_filter_attrs(path):
+    return {
+        "hx_get": path,
+        "hx_trigger": "input delay:300ms, change, submit",
+        "hx_target": "#results",
+        "hx_swap": "outerHTML",
+        "hx_push_url": "true",
+        "hx_sync": "this:replace",
+    }
 
-            cells.append(Td(value))
+# True for an htmx request that only wants the #results fragment (history restores
+# still get the whole page)
+def wants_results_fragment(req):
+    return (
+        req.headers.get("HX-Request") == "true"
+        and req.headers.get("HX-Target") == "results"
+        and req.headers.get("HX-History-Restore-Request") != "true"
+    )
 
-        body_rows.append(Tr(*cells))
+# The table (in its scrolling box) and pager that a filter change replaces
+def results_fragment(table, pager_row=None, height="65vh"):
+    return Div(
+        Div(
+            table,
+            style=(
+                f"height: {height}; "
+                "overflow-y: auto; "
+                "border: 1px solid #444; "
+                "padding: 10px; "
+                "border-radius: 8px; margin-top:10px;"
+            )
+        ),
+        pager_row or "",
+        id="results"
+    )
 
-    return Table(header, Tbody(*body_rows), cls="data-table")
+# ETag for a GET of a data view: the data version plus the path, the query string and
+# whether only the #results fragment was asked for. None for other methods.
+async def view_etag(req):
+    if req.method != "GET":
+        return None
+    version = await STORAGE.adata_version()
+    return DATA_VERSION.etag(version, req.url.path, sorted(req.query_params.multi_items()), wants_results_fragment(req))
+
+# True if the client's copy (If-None-Match) is still current
+def not_modified(req, etag):
+    if etag is None:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in req.headers.get("If-None-Match", "").split(",")]
+    return etag in tags or "*" in tags
+
+# Headers that make browsers revalidate a view with its ETag on every load
+def etag_headers(etag):
+    if etag is None:
+        return {}
+    return {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "HX-Request, HX-Target"}
+
+# The same headers as FastHTML header components, to return alongside a page
+def etag_header_tags(etag):
+    return [HttpHeader(name, value) for name, value in etag_headers(etag).items()]
+
+def not_modified_response(etag):
+    return Response(status_code=304, headers=etag_headers(etag))
+
+# Validation errors for a new item's values (the duplicate check is done by the caller)
+def item_errors(values):
+    errors = []
+    barcode = parse_int(values["barcode"], None, minimum=100000)
+    if barcode is None or barcode > 999999:
+        errors.append("Barcode must be between 100000 and 999999.")
+    if len(values["item_number"]) > 50:
+        errors.append("Item # cannot exceed 50 characters.")
+    if len(values["description"]) > 100:
+        errors.append("Description cannot exceed 100 characters.")
+    if len(values["lot_number"]) > 50:
+        errors.append("Lot # cannot exceed 50 characters.")
+    if len(values["item_type"]) > 50:
+        errors.append("Type cannot exceed 50 characters.")
+    if len(values["employee"]) > 50:
+        errors.append("Employee cannot exceed 50 characters.")
+    if parse_int(values["quantity"], None) is None:
+        errors.append("Quantity must be greater than 0.")
+    if values["exp_date"]:
+        try:
+            dt.date.fromisoformat(values["exp_date"])
+        except ValueError:
+            errors.append("Exp Date must be a date (YYYY-MM-DD).")
+
+    if not all(values.values()):
+        errors.append("All fields are required.")
+
+    return errors
+
+# Transaction and barcode rows for a new item
+def new_item_records(values, trans_date):
+    transaction = {
+        "barcode": values["barcode"],
+        "item_number": values["item_number"],
+        "description": values["description"],
+        "lot_number": values["lot_number"],
+        "exp_date": values["exp_date"],
+        "typ": values["item_type"],
+        "add_remove": "Add",
+        "trans_date": trans_date,
+        "quantity" : values["quantity"],
+        "employee": values["employee"]
+    }
+    barcode = {
+        "barcode": values["barcode"],
+        "item_number": values["item_number"],
+        "description": values["description"],
+        "lot_number": values["lot_number"],
+        "typ": values["item_type"],
+        "quantity" : values["quantity"],
+        "exp_date": values["exp_date"]
+    }
+    return transaction, barcode
+
+# Parse pasted bulk-add text: one item per line, tab-separated (pasted from a spreadsheet)
+# or comma-separated (scanned or typed), with the columns in BULK_ADD_COLUMNS order
+def parse_bulk_rows(text):
+    items = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        cells = line.split("\t") if "\t" in line else next(csv.reader([line]))
+        items.append(dict(zip(BULK_ADD_COLUMNS, [cell.strip() for cell in cells])))
+    return items
+
+# Validate many new items together and add them in one batch call, which inserts each
+# barcode row before its Add transaction and reports the barcodes that already exist by
+# their primary key conflict. Returns a list of (row number, message) errors; nothing is
+# written unless every row is valid.
+async def bulk_add_items(items, employee=None):
+    if not items:
+        return [(None, "No rows to add.")]
+    if len(items) > BULK_MAX_ROWS:
+        return [(None, f"At most {BULK_MAX_ROWS} rows can be added at once.")]
+
+    errors = []
+    rows = []
+    first_row = {}
+    for number, item in enumerate(items, start=1):
+        values = {column: str(item.get(column) or "").strip() for column in BULK_ADD_COLUMNS}
+        values["employee"] = str(item.get("employee") or employee or "").strip()
+
+        # Store the barcode as scanning looks it up, so "+100000" is "100000"
+        barcode = parse_int(values["barcode"], None, minimum=100000)
+        if barcode is not None:
+            values["barcode"] = str(barcode)
+
+        # Accept the type in any case, stored as it is spelled in the add form
+        item_type = next((text for text in ITEM_TYPES if text.lower() == values["item_type"].lower()), None)
+        if values["item_type"] and not item_type:
+            errors.append((number, f"Type must be one of: {', '.join(ITEM_TYPES)}."))
+        values["item_type"] = item_type or ""
+
+        errors += [(number, message) for message in item_errors(values)]
+        if values["barcode"] in first_row:
+            errors.append((number, f"Barcode is repeated (first in row {first_row[values['barcode']]})."))
+        else:
+            first_row[values["barcode"]] = number
+        rows.append(values)
+
+    if errors:
+        return sorted(errors, key=lambda error: error[0] or 0)
+
+    trans_date = str(pd.Timestamp.now())
+    records = [new_item_records(values, trans_date) for values in rows]
+    results = await STORAGE.aadd_barcodes([{"transaction": transaction, "barcode": barcode} for transaction, barcode in records])
+    errors = [(number, "Barcode already exists.") for number, result in enumerate(results, start=1) if result["status"] != "ok"]
+    # The rows of a rejected batch were rolled back; only the existing ones are current
+    barcodes_written({
+        values["barcode"]: result["barcode"]
+        for values, result in zip(rows, results)
+        if result["status"] != "ok" or not errors
+    })
+    return errors
+
+# Parse scanned scan-out lines: a barcode, optionally followed by the quantity to remove
+# (separated by a tab, comma or spaces). Without a quantity the whole barcode is removed.
+def parse_scan_rows(text):
+    items = []
+    for line in text.splitlines():
+        cells = [cell for cell in re.split(r"[\s,;]+", line.strip()) if cell]
+        if cells:
+            items.append({"barcode": cells[0], "quantity": cells[1] if len(cells) > 1 else ""})
+    return items
+
+# Message for a remove_barcode result that is not "ok"
+def removal_error(result):
+    current = result["barcode"] or {}
+    return {
+        "not_found": "This barcode does not exist.",
+        "removed": "This barcode has already been removed.",
+        "insufficient": f"Quantity must be less than or equal to {current.get("quantity")}",
+    }[result["status"]]
+
+# Validate a batch of removals and write them in one batch call, which takes each quantity
+# with the same conditional decrement as remove_barcode. Returns a list of (row number,
+# message) errors, including the rows the decrement rejected; nothing is written unless
+# every row is valid.
+async def bulk_remove_items(items, employee):
+    if not items:
+        return [(None, "No barcodes to remove.")]
+    if len(items) > BULK_MAX_ROWS:
+        return [(None, f"At most {BULK_MAX_ROWS} barcodes can be removed at once.")]
+
+    errors = []
+    if not employee:
+        errors.append((None, "Employee is required before removing items."))
+    elif len(employee) > 50:
+        errors.append((None, "Employee cannot exceed 50 characters."))
+
+    first_row = {}
+    for number, item in enumerate(items, start=1):
+        value = parse_int(str(item.get("barcode") or "").strip(), None, minimum=100000)
+        if value is None or value > 999999:
+            errors.append((number, "Barcode must be between 100000 and 999999."))
+        elif str(value) in first_row:
+            errors.append((number, f"Barcode is repeated (first in row {first_row[str(value)]})."))
+        else:
+            first_row[str(value)] = number
+
+    # A barcode without a quantity is removed whole: one fetch for their quantities now,
+    # which the decrement re-checks
+    whole = [barcode for barcode, number in first_row.items() if not str(items[number - 1].get("quantity") or "").strip()]
+    available = {}
+    if whole:
+        rows = await STORAGE.aselect("barcodes", columns="barcode, quantity", filters=[("barcode", "in_", whole)])
+        available = {str(row["barcode"]): int(row.get("quantity") or 0) for row in rows}
+
+    removals = []
+    for barcode, number in first_row.items():
+        quantity = str(items[number - 1].get("quantity") or "").strip()
+        quantity = parse_int(quantity, None) if quantity else available.get(barcode, 0)
+        if quantity is None:
+            errors.append((number, "Quantity must be greater than 0."))
+        else:
+            removals.append((number, {"barcode": barcode, "quantity": quantity}))
+
+    if errors:
+        return sorted(errors, key=lambda error: error[0] or 0)
+
+    results = await STORAGE.aremove_barcodes([removal for _, removal in removals], employee, str(pd.Timestamp.now()))
+    errors = [(number, removal_error(result)) for (number, _), result in zip(removals, results) if result["status"] != "ok"]
+    # The rows of a rejected batch were rolled back; only the rejected ones are current
+    barcodes_written({
+        removal["barcode"]: result["barcode"]
+        for (_, removal), result in zip(removals, results)
+        if result["status"] != "ok" or not errors
+    })
+    return sorted(errors, key=lambda error: error[0])
 
 # Login page
 @rt("/", methods=["GET", "POST"])
@@ -144,10 +761,14 @@ def home(req):
         H1("Quality Inventory", cls="mb-4", style="width: 97%; text-align:center;"),
         Div(
             A("Add New Item", href="/add_item", style=BUTTON_STYLE),
+            A("Bulk Add Items", href="/bulk_add", style=BUTTON_STYLE),
             A("Remove Item", href="/remove_item", style=BUTTON_STYLE),
+            A("Batch Scan-Out", href="/bulk_remove", style=BUTTON_STYLE),
             A("Transactions", href="/transactions", style=BUTTON_STYLE),
             A("Barcodes", href="/barcodes", style=BUTTON_STYLE),
             A("Inventory", href="/inventory", style=BUTTON_STYLE),
+            A("Expiring Soon", href="/expiring", style=BUTTON_STYLE),
+            A("Search", href="/search", style=BUTTON_STYLE),
             A("Export Data To Excel", href="/export_excel", target="_blank", style=BUTTON_STYLE),
             style="max-width: 260px; margin: auto; margin-top: 40px;"
         )
@@ -156,7 +777,7 @@ def home(req):
 
 # Form to add new item into inventory
 @rt("/add_item", methods=["GET", "POST"])
-def add_item(
+async def add_item(
             req,
             values: dict | None = None,
             error_message: str | None = None,
@@ -212,7 +833,7 @@ def add_item(
                         Select(
                             *[Option(text, value=text,
                                      selected=(values and values.get("item_type") == text))
-                              for text in ["Vendor Damage", "Damage", "Expired", "Short Dated", "Return"]],
+                              for text in ITEM_TYPES],
                             name="item_type", required=True, style=INPUT_STYLE),
                         style="display:flex; align-items:center; margin-bottom: 15px;"),
                     Div(Label("Quantity", style=LABEL_STYLE),
@@ -248,64 +869,95 @@ def add_item(
     }
 
     # Check user input for errors
-    errors = []
-    if int(values["barcode"]) < 100000 or int(values["barcode"]) > 999999:
-        errors.append("Barcode must be between 100000 and 999999.")
-    if len(values["item_number"]) > 50:
-        errors.append("Item # cannot exceed 50 characters.")
-    if len(values["description"]) > 100:
-        errors.append("Description cannot exceed 100 characters.")
-    if len(values["lot_number"]) > 50:
-        errors.append("Lot # cannot exceed 50 characters.")
-    if len(values["item_type"]) > 50:
-        errors.append("Type cannot exceed 50 characters.")
-    if len(values["employee"]) > 50:
-        errors.append("Employee cannot exceed 50 characters.")
-    if int(values["quantity"]) <= 0:
-        errors.append("Quantity must be greater than 0.")
+    errors = item_errors(values)
+    if errors:
+        # Re-render form with error
+        return await add_item(req=req, values=values, error_message=errors[0])
 
-    response = SUPABASE.table("barcodes").select("barcode").eq("barcode", values["barcode"]).execute()
-    if response.data:
-        errors.append("Barcode already exists.")
+    # Insert both rows and adjust inventory in one atomic call; a duplicate barcode is
+    # reported by the insert's conflict rather than a separate lookup
+    data, bc_data = new_item_records(values, str(pd.Timestamp.now()))
+    result = await STORAGE.aadd_barcode(data, bc_data)
+    barcodes_written({values["barcode"]: result["barcode"]})
+    if result["status"] == "exists":
+        return await add_item(req=req, values=values, error_message="Barcode already exists.")
 
-    if not all(values.values()):
-        errors.append("All fields are required.")
+    return Redirect("/home")
 
-    if errors:
-        # Re-render form with error
-        return add_item(req=req, values=values, error_message=errors[0])
+# Form to add many items at once, pasted from a spreadsheet or scanned one per line
+@rt("/bulk_add", methods=["GET", "POST"])
+async def bulk_add(req, rows: str | None = None, employee: str | None = None):
+    # Check if the user is logged in by verifying the session cookie
+    if req.cookies.get("session") != SECRET_KEY:
+        return Redirect("/")
 
-    # Insert into Supabase
-    data = {
-        "barcode": values["barcode"],
-        "item_number": values["item_number"],
-        "description": values["description"],
-        "lot_number": values["lot_number"],
-        "exp_date": values["exp_date"],
-        "typ": values["item_type"],
-        "add_remove": "Add",
-        "trans_date": str(pd.Timestamp.now()),
-        "quantity" : values["quantity"],
-        "employee": values["employee"]
-    }
-    bc_data = {
-        "barcode": values["barcode"],
-        "item_number": values["item_number"],
-        "description": values["description"],
-        "lot_number": values["lot_number"],
-        "typ": values["item_type"],
-        "quantity" : values["quantity"],
-        "exp_date": values["exp_date"]
-    }
+    errors = []
+    message = None
+    if rows is not None:
+        items = parse_bulk_rows(rows)
+        errors = await bulk_add_items(items, employee)
+        if not errors:
+            message = f"Added {len(items)} items."
+            rows = ""
+
+    return Title("Bulk Add Items"), Titled(
+        Div(
+            H2("Bulk Add Items", style="text-align:center; margin-bottom:20px;"),
+            P("One item per line: Barcode, Item #, Description, Lot #, Exp Date (YYYY-MM-DD), Type, Quantity. "
+              "Paste cells from a spreadsheet or separate the values with commas.",
+              style="text-align:center;"),
+            Ul(
+                *[Li(f"Row {number}: {error}" if number else error) for number, error in errors],
+                style="color:red; margin-bottom:15px;"
+            ) if errors else Div(),
+            P(message, style="color:#2e7d32; text-align:center; margin-bottom:15px;") if message else Div(),
+            Form(
+                Div(Label("Employee", style=LABEL_STYLE),
+                    Input(type="text", name="employee", required=True, value=employee or "", style=INPUT_STYLE),
+                    style="display:flex; align-items:center; margin-bottom: 15px;"),
+                Textarea(
+                    rows or "",
+                    name="rows",
+                    rows=15,
+                    required=True,
+                    placeholder="123456, ITEM-1, Widget, L0001, 2026-01-31, Damage, 5",
+                    style="width:100%; padding:6px; font-family:monospace;"
+                ),
+                Div(
+                    A("Back", href="/home", style=BACK_BUTTON_STYLE + "text-align:center; text-decoration:none; display:inline-block;"),
+                    Button("Submit", type="submit", style=SUBMIT_BUTTON_STYLE),
+                    style="display:flex; justify-content: space-between; margin-top: 20px;"
+                ),
+                method="POST", action="/bulk_add"
+            ),
+            style="max-width: 800px; margin: auto;"
+        )
+    )
 
-    SUPABASE.table("transactions").insert(data).execute()
-    SUPABASE.table("barcodes").insert(bc_data).execute()
+# Add many items from JSON: {"employee": "...", "items": [{"barcode": ..., "item_number": ..., ...}]}.
+# Items use the BULK_ADD_COLUMNS keys and may set their own "employee".
+@rt("/api/bulk_add", methods=["POST"])
+async def api_bulk_add(req):
+    # Check if the user is logged in by verifying the session cookie
+    if req.cookies.get("session") != SECRET_KEY:
+        return JSONResponse({"error": "Not logged in."}, status_code=401)
 
-    return Redirect("/home")
+    try:
+        body = await req.json()
+    except ValueError:
+        return JSONResponse({"error": "Request body must be JSON."}, status_code=400)
+    items = body.get("items") if isinstance(body, dict) else None
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return JSONResponse({"error": "\"items\" must be a list of objects."}, status_code=400)
+
+    errors = await bulk_add_items(items, body.get("employee"))
+    if errors:
+        return JSONResponse({"errors": [{"row": number, "error": error} for number, error in errors]}, status_code=400)
+    return JSONResponse({"added": len(items)})
 
 # Form to remove item from inventory
 @rt("/remove_item", methods=["GET", "POST"])
-def remove_item(
+async def remove_item(
     req,
     barcode: str | None = None,
     employee: str | None = None,
@@ -324,17 +976,15 @@ def remove_item(
         if int(barcode) < 100000 or int(barcode) > 999999:
             error_message = "Barcode must be between 100000 and 999999."
         else:
-            response = SUPABASE.table("barcodes").select("*").eq("barcode", barcode).execute()
+            record = await scan_barcode(barcode)
 
-            if not response.data:
+            if not record:
                 error_message = "This barcode does not exist."
-            else:
-                record = response.data[0]
 
-                # Already removed
-                if record.get("remove") == 1:
-                    error_message = "This barcode has already been removed."
-                    record = None
+            # Already removed
+            elif record.get("remove") == 1:
+                error_message = "This barcode has already been removed."
+                record = None
 
             if quantity and int(quantity) <= 0:
                 error_message = "Quantity must be greater than 0."
@@ -348,26 +998,14 @@ def remove_item(
         elif int(quantity) <= 0:
             error_message = "Quantity must be greater than 0."
         if error_message:
-            return remove_item(req=req, barcode=barcode, error_message=error_message)
-    
-        data = {
-            "barcode": record.get("barcode"),
-            "item_number": record.get("item_number"),
-            "description": record.get("description"),
-            "lot_number": record.get("lot_number"),
-            "exp_date": record.get("exp_date"),
-            "typ": record.get("typ"),
-            "add_remove": "Remove",
-            "quantity": int(quantity),
-            "trans_date": str(pd.Timestamp.now()),
-            "employee": employee
-        }
-
-        # Add the remove transaction and mark barcode as removed
-        SUPABASE.table("transactions").insert(data).execute()
-        if int(record.get("quantity")) - int(quantity) == 0:
-            SUPABASE.table("barcodes").update({"remove": 1}).eq("barcode", record.get("barcode")).execute()
-        SUPABASE.table("barcodes").update({"quantity": int(record.get("quantity")) - int(quantity)}).eq("barcode", record.get("barcode")).execute()
+            return await remove_item(req=req, barcode=barcode, error_message=error_message)
+
+        # Decrement, flag, log and adjust inventory in one atomic call. It re-checks the
+        # quantity against the database, so a concurrent scan cannot remove it twice.
+        result = await STORAGE.aremove_barcode(record.get("barcode"), int(quantity), employee, str(pd.Timestamp.now()))
+        barcodes_written({record.get("barcode"): result["barcode"]})
+        if result["status"] != "ok":
+            return await remove_item(req=req, barcode=barcode, error_message=removal_error(result))
         return Redirect("/home")
 
     # Render page
@@ -472,9 +1110,60 @@ def remove_item(
 )
 
 
+# Batch scan-out: remove a list of scanned barcodes in one submit
+@rt("/bulk_remove", methods=["GET", "POST"])
+async def bulk_remove(req, rows: str | None = None, employee: str | None = None):
+    # Check if the user is logged in by verifying the session cookie
+    if req.cookies.get("session") != SECRET_KEY:
+        return Redirect("/")
+
+    errors = []
+    message = None
+    if rows is not None:
+        items = parse_scan_rows(rows)
+        errors = await bulk_remove_items(items, (employee or "").strip())
+        if not errors:
+            message = f"Removed {len(items)} items."
+            rows = ""
+
+    return Title("Batch Scan-Out"), Titled(
+        Div(
+            H2("Batch Scan-Out", style="text-align:center; margin-bottom:20px;"),
+            P("Scan one barcode per line, optionally followed by the quantity to remove. "
+              "Barcodes without a quantity are removed completely.",
+              style="text-align:center;"),
+            Ul(
+                *[Li(f"Row {number}: {error}" if number else error) for number, error in errors],
+                style="color:red; margin-bottom:15px;"
+            ) if errors else Div(),
+            P(message, style="color:#2e7d32; text-align:center; margin-bottom:15px;") if message else Div(),
+            Form(
+                Div(Label("Employee", style=LABEL_STYLE),
+                    Input(type="text", name="employee", required=True, value=employee or "", style=INPUT_STYLE),
+                    style="display:flex; align-items:center; margin-bottom: 15px;"),
+                Textarea(
+                    rows or "",
+                    name="rows",
+                    rows=15,
+                    required=True,
+                    autofocus=True,
+                    placeholder="123456\n123457, 2",
+                    style="width:100%; padding:6px; font-family:monospace;"
+                ),
+                Div(
+                    A("Back", href="/home", style=BACK_BUTTON_STYLE + "text-align:center; text-decoration:none; display:inline-block;"),
+                    Button("Remove", type="submit", style=SUBMIT_BUTTON_STYLE),
+                    style="display:flex; justify-content: space-between; margin-top: 20px;"
+                ),
+                method="POST", action="/bulk_remove"
+            ),
+            style="max-width: 800px; margin: auto;"
+        )
+    )
+
 # Form to view, edit, and filter transactions
 @rt("/transactions", methods=["GET", "POST"])
-def transactions(
+async def transactions(
     req,
     barcode: str | None = None,
     item_number: str | None = None,
@@ -485,47 +1174,62 @@ def transactions(
     quantity: str | None = None,
     trans_date_begin: str | None = None,
     trans_date_end: str | None = None,
-    employee: str | None = None
+    employee: str | None = None,
+    page: str | None = None,
+    page_size: str | None = None,
+    view: str | None = None
 ):
     
     # Check if the user is logged in by verifying the session cookie
     if req.cookies.get("session") != SECRET_KEY:
         return Redirect("/")
 
-    # Track input errors
-    input_errors = {}
-
-    # Read Supabase table and reformat
-    response = SUPABASE.table("transactions").select("*").execute()
-    df = pd.DataFrame(response.data)
-    df = df[["trans_id", "barcode", "item_number", "description", "lot_number", "exp_date", "typ", "add_remove", "quantity", "trans_date", "employee"]]
-    df.columns = ["Trans ID", "Barcode", "Item #", "Description", "Lot #", "Exp Date", "Type", "Add/Remove", "Quantity", "Trans Date", "Employee"]
-    df["Trans Date"] = pd.to_datetime(df["Trans Date"]).dt.floor("s")
-    df.sort_values(by="Trans ID", ascending=False, inplace=True)
-
-    # Apply filters
-    if barcode: df = df[df["Barcode"].str.contains(barcode, case=False, na=False)]
-    if item_number: df = df[df["Item #"].str.contains(item_number, case=False, na=False)]
-    if description: df = df[df["Description"].str.contains(description, case=False, na=False)]
-    if lot_number: df = df[df["Lot #"].str.contains(lot_number, case=False, na=False)]
-    if exp_date: df = df[df["Exp Date"].astype(str).str.contains(exp_date, na=False)]
-    if item_type: df = df[df["Type"].str.contains(item_type, case=False, na=False)]
-    if employee: df = df[df["Employee"].str.contains(employee, case=False, na=False)]
-
-    # Handle date filters with error highlighting
-    if trans_date_begin:
-        try:
-            df = df[df["Trans Date"] >= pd.to_datetime(trans_date_begin)]
-        except Exception as e:
-            input_errors["trans_date_begin"] = True
+    page = parse_int(page, 1)
+    page_size = parse_page_size(page_size)
+    scroll = view == "scroll"
+
+    # Build the filters as server-side predicates
+    filters, input_errors = transaction_filters(
+        barcode=barcode,
+        item_number=item_number,
+        description=description,
+        lot_number=lot_number,
+        exp_date=exp_date,
+        item_type=item_type,
+        employee=employee,
+        trans_date_begin=trans_date_begin,
+        trans_date_end=trans_date_end
+    )
 
-    if trans_date_end:
-        try:
-            df = df[df["Trans Date"] <= pd.to_datetime(trans_date_end)]
-        except Exception as e:
-            input_errors["trans_date_end"] = True
+    params = {
+        "barcode": barcode,
+        "item_number": item_number,
+        "description": description,
+        "lot_number": lot_number,
+        "exp_date": exp_date,
+        "item_type": item_type,
+        "trans_date_begin": trans_date_begin,
+        "trans_date_end": trans_date_end,
+        "employee": employee,
+        "page_size": page_size
+    }
 
-    table = df_to_html_table(df, link_trans_id=True, link_barcode=False)
+    # Read one page (plus one row to detect a next page) and reformat. The scrolling view
+    # always starts at the newest row and loads the rest in chunks from /transactions_rows.
+    start = 0 if scroll else (page - 1) * page_size
+    data = await STORAGE.aselect("transactions", filters=filters, order=[("trans_id", True)], limit=page_size + 1, offset=start)
+    rows = data[:page_size]
+    has_next = len(data) > page_size
+    df = transactions_frame(rows)
+
+    if scroll:
+        more = next_chunk_row(params, rows[-1]["trans_id"], len(df.columns)) if has_next else ""
+        results = results_fragment(df_to_html_table(df, link_trans_id=True, extra_rows=more))
+    else:
+        table = df_to_html_table(df, link_trans_id=True, link_barcode=False)
+        results = results_fragment(table, pager("/transactions", params, page, has_next))
+    if wants_results_fragment(req):
+        return results
 
     # Filter row above table
     filter_row = Form(
@@ -563,7 +1267,7 @@ def transactions(
                 name="exp_date",
                 placeholder="Exp Date",
                 value=exp_date or "",
-                style="width:160px; margin-right:5px; margin-top:15px;"
+                style="width:160px; margin-right:5px; margin-top:15px;" + (INPUT_ERROR_STYLE if input_errors.get("exp_date") else "")
             ),
             Input(
                 type="text",
@@ -577,14 +1281,14 @@ def transactions(
                 name="trans_date_begin",
                 placeholder="Trans Date Begin",
                 value=trans_date_begin or "",
-                style="width:160px; margin-right:5px; margin-top:15px;"
+                style="width:160px; margin-right:5px; margin-top:15px;" + (INPUT_ERROR_STYLE if input_errors.get("trans_date_begin") else "")
             ),
             Input(
                 type="text",
                 name="trans_date_end",
                 placeholder="Trans Date End",
                 value=trans_date_end or "",
-                style="width:160px; margin-right:5px; margin-top:15px;"
+                style="width:160px; margin-right:5px; margin-top:15px;" + (INPUT_ERROR_STYLE if input_errors.get("trans_date_end") else "")
             ),
             Input(
                 type="text",
@@ -593,10 +1297,22 @@ def transactions(
                 value=employee or "",
                 style="width:120px; margin-right:5px; margin-top:15px;"
             ),
+            Select(
+                *[Option(f"{size} rows", value=str(size), selected=(size == page_size)) for size in PAGE_SIZES],
+                name="page_size",
+                style="width:120px; margin-right:5px; margin-top:15px;"
+            ),
+            Select(
+                Option("Pages", value="pages", selected=not scroll),
+                Option("Scroll", value="scroll", selected=scroll),
+                name="view",
+                style="width:100px; margin-right:5px; margin-top:15px;"
+            ),
             Button("Filter", type="submit", style=SUBMIT_BUTTON_STYLE),
             style="display:flex; flex-wrap: nowrap; overflow-x:auto; align-items:center;"
         ),
-        method="POST"
+        method="POST",
+        **live_filter_attrs("/transactions")
     )
 
     # Render page
@@ -604,16 +1320,7 @@ def transactions(
         Div(
             H2("Transactions", style="text-align:center; margin-bottom:20px;"),
             filter_row,
-            Div(
-                table,
-                style=(
-                    "height: 65vh; "
-                    "overflow-y: auto; "
-                    "border: 1px solid #444; "
-                    "padding: 10px; "
-                    "border-radius: 8px; margin-top:10px;"
-                )
-            ),
+            results,
             # Buttons
             Div(
                 A("Back", href="/home", style=BACK_BUTTON_STYLE + "text-align:center; text-decoration:none; display:inline-block;"),
@@ -624,9 +1331,71 @@ def transactions(
         )
     )
 
+# The next chunk of rows for the scrolling transactions view: the rows after the `after`
+# trans_id, followed by the row that loads the chunk after that. Only <tr> markup is
+# returned, so htmx appends it to the table already on the page.
+@rt("/transactions_rows")
+async def transactions_rows(
+    req,
+    after: str,
+    barcode: str | None = None,
+    item_number: str | None = None,
+    description: str | None = None,
+    lot_number: str | None = None,
+    exp_date: str | None = None,
+    item_type: str | None = None,
+    trans_date_begin: str | None = None,
+    trans_date_end: str | None = None,
+    employee: str | None = None,
+    page_size: str | None = None
+):
+
+    # A redirect would be followed by htmx and swap the login page into the table
+    if req.cookies.get("session") != SECRET_KEY:
+        return Response(status_code=401)
+
+    after = parse_int(after, None)
+    if after is None:
+        return HTMLResponse("")
+    page_size = parse_page_size(page_size)
+
+    filters, _ = transaction_filters(
+        barcode=barcode,
+        item_number=item_number,
+        description=description,
+        lot_number=lot_number,
+        exp_date=exp_date,
+        item_type=item_type,
+        employee=employee,
+        trans_date_begin=trans_date_begin,
+        trans_date_end=trans_date_end
+    )
+    filters.append(("trans_id", "lt", after))
+
+    data = await STORAGE.aselect("transactions", filters=filters, order=[("trans_id", True)], limit=page_size + 1)
+    rows = data[:page_size]
+    df = transactions_frame(rows)
+
+    with METRICS.time("render_table"):
+        markup = html_table_rows(df, link_trans_id=True, link_barcode=False)
+    if len(data) > page_size:
+        markup += next_chunk_row({
+            "barcode": barcode,
+            "item_number": item_number,
+            "description": description,
+            "lot_number": lot_number,
+            "exp_date": exp_date,
+            "item_type": item_type,
+            "trans_date_begin": trans_date_begin,
+            "trans_date_end": trans_date_end,
+            "employee": employee,
+            "page_size": page_size
+        }, rows[-1]["trans_id"], len(df.columns))
+    return HTMLResponse(markup)
+
 # Form to edit existing transaction
 @rt("/edit_transaction", methods=["GET", "POST"])
-def edit_transaction(
+async def edit_transaction(
     req,
     trans_id: str,
     barcode: str | None = None,
@@ -650,15 +1419,16 @@ def edit_transaction(
 
     # If DELETE button clicked, delete the record
     if delete == "DO_DELETE":
-        SUPABASE.table("transactions").delete().eq("trans_id", trans_id).execute()
+        deleted = await STORAGE.adelete("transactions", [("trans_id", "eq", trans_id)])
+        await transactions_edited(deleted, [])
         return Redirect("/transactions")
 
     # Fetch record from Supabase
-    response = SUPABASE.table("transactions").select("*").eq("trans_id", trans_id).execute()
-    if not response.data:
+    rows = await STORAGE.aselect("transactions", filters=[("trans_id", "eq", trans_id)])
+    if not rows:
         return Titled(P("Record not found.", style="color:red; text-align:center;"))
 
-    record = response.data[0]
+    record = rows[0]
 
     # If POST, update the record
     if barcode or item_number or description or lot_number or exp_date or item_type or employee:
@@ -692,10 +1462,11 @@ def edit_transaction(
         if new_values["quantity"] and int(new_values["quantity"]) <= 0:
             errors.append("Quantity must be greater than 0.")
         if errors:
-            return edit_transaction(req=req, trans_id=trans_id, error_message=errors[0], values=new_values)
+            return await edit_transaction(req=req, trans_id=trans_id, error_message=errors[0], values=new_values)
 
         # Update Supabase with new values
-        SUPABASE.table("transactions").update(new_values).eq("trans_id", trans_id).execute()
+        updated = await STORAGE.aupdate("transactions", new_values, [("trans_id", "eq", trans_id)])
+        await transactions_edited([record] if updated else [], updated)
         return Redirect("/transactions")
 
     # If GET, render the page
@@ -823,36 +1594,105 @@ def edit_transaction(
 
 # Form to view and filter barcodes
 @rt("/barcodes", methods=["GET", "POST"])
-def barcodes(
+async def barcodes(
     req,
     barcode: str | None = None,
     item_number: str | None = None,
     description: str | None = None,
     lot_number: str | None = None,
     exp_date: str | None = None,
-    item_type: str | None = None
+    item_type: str | None = None,
+    sort: str | None = None,
+    dir: str | None = None,
+    after: str | None = None,
+    before: str | None = None,
+    page_size: str | None = None
 ):
     
     # Check if the user is logged in by verifying the session cookie
     if req.cookies.get("session") != SECRET_KEY:
         return Redirect("/")
 
-    # Read Supabase table and reformat
-    response = SUPABASE.table("barcodes").select("*").execute()
-    df = pd.DataFrame(response.data)
-    df = df[["barcode", "item_number", "description", "lot_number", "exp_date", "typ", "quantity", "remove"]]
-    df.columns = ["Barcode", "Item #", "Description", "Lot #", "Exp Date", "Type", "Quantity", "Remove"]
-    df.sort_values(by="Barcode", ascending=False, inplace=True)
-
-    # Apply filters
-    if barcode: df = df[df["Barcode"].str.contains(barcode, case=False, na=False)]
-    if item_number: df = df[df["Item #"].str.contains(item_number, case=False, na=False)]
-    if description: df = df[df["Description"].str.contains(description, case=False, na=False)]
-    if lot_number: df = df[df["Lot #"].str.contains(lot_number, case=False, na=False)]
-    if exp_date: df = df[df["Exp Date"].astype(str).str.contains(exp_date, na=False)]
-    if item_type: df = df[df["Type"].str.contains(item_type, case=False, na=False)]
-
-    table = df_to_html_table(df, link_trans_id=False, link_barcode=True)
+    # Nothing has changed since the client's copy: skip the query and rendering
+    etag = await view_etag(req)
+    if not_modified(req, etag):
+        return not_modified_response(etag)
+
+    columns = {
+        "Barcode": "barcode",
+        "Item #": "item_number",
+        "Description": "description",
+        "Lot #": "lot_number",
+        "Exp Date": "exp_date",
+        "Type": "typ",
+        "Quantity": "quantity",
+        "Remove": "remove",
+    }
+    sort = sort if sort in columns.values() else "barcode"
+    dir = "asc" if dir == "asc" else "desc"
+    descending = dir == "desc"
+    page_size = parse_page_size(page_size)
+
+    # Build the filters as server-side predicates
+    filters, input_errors = list_filters([
+        ("barcode", barcode),
+        ("item_number", item_number),
+        ("description", description),
+        ("lot_number", lot_number),
+        ("typ", item_type),
+    ], exp_date)
+
+    # Continue from the cursor barcode; for other sort columns look up its sort value
+    cursor = after or before
+    forward = not before
+    cursor_value = cursor
+    if cursor and sort != "barcode":
+        cursor_record = await get_barcode(cursor)
+        cursor_value = cursor_record[sort] if cursor_record else None
+        cursor = cursor if cursor_record else None
+    if cursor:
+        filters.append(keyset_filter(sort, descending, cursor, cursor_value, forward))
+
+    # Read one page (plus one row to detect more) sorted in the database, with barcode as tiebreaker
+    order = keyset_order(sort, descending, forward)
+    data = await cached_query(("barcodes", filters, order, page_size + 1), lambda: STORAGE.aselect("barcodes", filters=filters, order=order, limit=page_size + 1))
+    rows = data[:page_size]
+    has_more = len(data) > page_size
+    if not forward:
+        rows.reverse()
+
+    # Cursors for the neighbouring pages
+    if forward:
+        has_prev, has_next = bool(cursor), has_more
+    else:
+        has_prev, has_next = has_more, True
+    prev_cursor = rows[0]["barcode"] if rows and has_prev else None
+    next_cursor = rows[-1]["barcode"] if rows and has_next else None
+
+    df = pd.DataFrame(rows, columns=list(columns.values()))
+    df.columns = list(columns.keys())
+
+    # Column headers sort in the database; clicking the current sort column flips the direction
+    params = {
+        "barcode": barcode,
+        "item_number": item_number,
+        "description": description,
+        "lot_number": lot_number,
+        "exp_date": exp_date,
+        "item_type": item_type,
+        "page_size": page_size,
+    }
+    header_links = {}
+    for label, column in columns.items():
+        new_dir = ("asc" if descending else "desc") if column == sort else "asc"
+        arrow = (" \u25BC" if descending else " \u25B2") if column == sort else ""
+        link_params = {key: value for key, value in {**params, "sort": column, "dir": new_dir}.items() if value}
+        header_links[label] = (label + arrow, f"/barcodes?{urlencode(link_params)}")
+
+    table = df_to_html_table(df, link_trans_id=False, link_barcode=True, header_links=header_links)
+    results = results_fragment(table, cursor_pager("/barcodes", {**params, "sort": sort, "dir": dir}, prev_cursor, next_cursor))
+    if wants_results_fragment(req):
+        return results, *etag_header_tags(etag)
 
     # Filter row above table
     filter_row = Form(
@@ -890,7 +1730,7 @@ def barcodes(
                 name="exp_date",
                 placeholder="Exp Date",
                 value=exp_date or "",
-                style="width:160px; margin-right:5px; margin-top:15px;"
+                style="width:160px; margin-right:5px; margin-top:15px;" + (INPUT_ERROR_STYLE if input_errors.get("exp_date") else "")
             ),
             Input(
                 type="text",
@@ -899,10 +1739,18 @@ def barcodes(
                 value=item_type or "",
                 style="width:120px; margin-right:5px; margin-top:15px;"
             ),
+            Select(
+                *[Option(f"{size} rows", value=str(size), selected=(size == page_size)) for size in PAGE_SIZES],
+                name="page_size",
+                style="width:120px; margin-right:5px; margin-top:15px;"
+            ),
+            Input(type="hidden", name="sort", value=sort),
+            Input(type="hidden", name="dir", value=dir),
             Button("Filter", type="submit", style=SUBMIT_BUTTON_STYLE),
             style="display:flex; flex-wrap: nowrap; overflow-x:auto; align-items:center;"
         ),
-        method="POST"
+        method="POST",
+        **live_filter_attrs("/barcodes")
     )
 
     # Render page
@@ -910,16 +1758,7 @@ def barcodes(
         Div(
             H2("Barcodes", style="text-align:center; margin-bottom:20px;"),
             filter_row,
-            Div(
-                table,
-                style=(
-                    "height: 65vh; "
-                    "overflow-y: auto; "
-                    "border: 1px solid #444; "
-                    "padding: 10px; "
-                    "border-radius: 8px; margin-top:10px;"
-                )
-            ),
+            results,
             # Buttons
             Div(
                 A("Back", href="/home", style=BACK_BUTTON_STYLE + "text-align:center; text-decoration:none; display:inline-block;"),
@@ -928,11 +1767,11 @@ def barcodes(
             ),
             style="max-width: 125%; margin:auto;"
         )
-    )
+    ), *etag_header_tags(etag)
 
 # Form to edit existing barcode
 @rt("/edit_barcode", methods=["GET", "POST"])
-def edit_barcode(
+async def edit_barcode(
     req,
     barcode: str | None = None,
     item_number: str | None = None,
@@ -953,28 +1792,33 @@ def edit_barcode(
 
     # If DELETE button clicked, delete the record
     if delete == "DO_DELETE":
-        SUPABASE.table("barcodes").delete().eq("barcode", barcode).execute()
+        deleted = await STORAGE.adelete("barcodes", [("barcode", "eq", barcode)])
+        await apply_inventory_deltas([inventory_delta(record, sign=-1) for record in deleted])
+        barcodes_written({barcode: None})
         return Redirect("/barcodes")
 
     # Get record from Supabase
-    response = SUPABASE.table("barcodes").select("*").eq("barcode", barcode).execute()
-    if not response.data:
+    record = await get_barcode(barcode)
+    if not record:
         return Titled(P("Record not found.", style="color:red; text-align:center;"))
 
-    record = response.data[0]
-
     # If POST, update the record with user input
     if item_number or description or lot_number or exp_date or item_type or remove:
-        # Use the provided values if present, otherwise fallback to the current record
-        new_values = {
-            "item_number": item_number if item_number not in (None, "", "nan") else record.get("item_number"),
-            "description": description if description not in (None, "", "nan") else record.get("description"),
-            "lot_number": lot_number if lot_number not in (None, "", "nan") else record.get("lot_number"),
-            "exp_date": exp_date if exp_date not in (None, "", "nan") else record.get("exp_date"),
-            "typ": item_type if item_type not in (None, "", "nan") else record.get("typ"),
-            "remove": remove if remove not in (None, "", "nan") else record.get("remove"),
-            "quantity": int(quantity) if quantity not in (None, "", "nan") else int(record.get("quantity")),
+        # Only the provided values are written; the others keep what the row has when it is updated
+        given = {
+            "item_number": item_number,
+            "description": description,
+            "lot_number": lot_number,
+            "exp_date": exp_date,
+            "typ": item_type,
+            "remove": remove,
+            "quantity": quantity,
         }
+        given = {column: value for column, value in given.items() if value not in (None, "", "nan")}
+        if "quantity" in given:
+            given["quantity"] = int(given["quantity"])
+        new_values = {column: record.get(column) for column in ["item_number", "description", "lot_number", "exp_date", "typ", "remove"]}
+        new_values = {**new_values, "quantity": int(record.get("quantity")), **given}
 
         # Validate user input
         errors = []
@@ -989,10 +1833,12 @@ def edit_barcode(
         if int(new_values["quantity"]) is not None and int(new_values["quantity"]) <= 0:
             errors.append("Quantity must be greater than 0.")
         if errors:
-            return edit_barcode(req=req, barcode=barcode, error_message=errors[0], values=new_values)
+            return await edit_barcode(req=req, barcode=barcode, error_message=errors[0], values=new_values)
 
-        # Update Supabase
-        SUPABASE.table("barcodes").update(new_values).eq("barcode", barcode).execute()
+        # Update the row and move its inventory from the old values to the new ones in one
+        # atomic call, taking the old values from the row itself rather than the cached copy
+        result = await STORAGE.aupdate_barcode(barcode, given)
+        barcodes_written({barcode: result["barcode"]})
         return Redirect("/barcodes")
 
     # If GET, render the page
@@ -1098,26 +1944,333 @@ def edit_barcode(
         )
     )
 
+# Search barcodes and transactions by item #, description, lot # and employee
+@rt("/search")
+async def search(req, q: str | None = None):
+
+    # Check if the user is logged in by verifying the session cookie
+    if req.cookies.get("session") != SECRET_KEY:
+        return Redirect("/")
+
+    # Rank the matches in the index, then read just those rows by key
+    await index_new_transactions()
+    with METRICS.time("search"):
+        matches = SEARCH_INDEX.search(q or "", limit=SEARCH_RESULTS)
+    barcode_keys = [str(key) for key, _ in matches["barcodes"]]
+    trans_ids = [key for key, _ in matches["transactions"]]
+    barcode_rows, transaction_rows = await asyncio.gather(
+        select_by_keys("barcodes", "barcode", barcode_keys),
+        select_by_keys("transactions", "trans_id", trans_ids)
+    )
+
+    # Back in rank order
+    rank = {key: i for i, key in enumerate(barcode_keys)}
+    barcode_rows.sort(key=lambda row: rank.get(str(row["barcode"]), len(rank)))
+    rank = {key: i for i, key in enumerate(trans_ids)}
+    transaction_rows.sort(key=lambda row: rank.get(row["trans_id"], len(rank)))
+
+    barcodes_df = pd.DataFrame(barcode_rows, columns=["barcode", "item_number", "description", "lot_number", "exp_date", "typ", "quantity", "remove"])
+    barcodes_df.columns = ["Barcode", "Item #", "Description", "Lot #", "Exp Date", "Type", "Quantity", "Remove"]
+    results = results_fragment(Div(
+        H3(f"Barcodes ({len(barcode_rows)})"),
+        df_to_html_table(barcodes_df, link_barcode=True),
+        H3(f"Transactions ({len(transaction_rows)})", style="margin-top:20px;"),
+        df_to_html_table(transactions_frame(transaction_rows), link_trans_id=True)
+    ) if q else P("Type an item #, description, lot # or employee."), height="70vh")
+    if wants_results_fragment(req):
+        return results
+
+    search_box = Form(
+        Div(
+            Input(
+                type="search",
+                name="q",
+                placeholder="Item #, description, lot # or employee",
+                value=q or "",
+                autofocus=True,
+                style="width:400px; margin-right:5px; margin-top:15px;"
+            ),
+            Button("Search", type="submit", style=SUBMIT_BUTTON_STYLE),
+            style="display:flex; justify-content:center; align-items:center;"
+        ),
+        method="GET",
+        **live_filter_attrs("/search")
+    )
+
+    # Render page
+    return Title("Search"), Titled(
+        Div(
+            H2("Search", style="text-align:center; margin-bottom:20px;"),
+            search_box,
+            results,
+            Div(
+                A("Back", href="/home", style=BACK_BUTTON_STYLE),
+                style="margin-top: 20px; text-align:center;"
+            ),
+            style="max-width: 125%; margin:auto;"
+        )
+    )
+
+# Expiry date range ("YYYY-MM-DD" strings or None) for the expiring report: the given
+# start and end dates, or by default everything (already expired included) that expires
+# within `days` days from today
+def expiry_range(days, start, end):
+    input_errors = {}
+    dates = {}
+    for name, value in (("start", start), ("end", end)):
+        if value:
+            try:
+                dates[name] = pd.to_datetime(value).strftime("%Y-%m-%d")
+            except Exception:
+                input_errors[name] = True
+    if not start and not end:
+        dates["end"] = (dt.date.today() + dt.timedelta(days=parse_int(days, EXPIRING_DAYS, minimum=0))).isoformat()
+    return dates.get("start"), dates.get("end"), input_errors
+
+# A page of the active barcodes expiring in a date range, in expiry order, read from the
+# in-process indexes. Each row gets the days left until it expires.
+def expiring_barcodes(start, end, offset=0, limit=None):
+    total, barcodes = EXPIRY_INDEX.between(start, end, offset, limit)
+    today = dt.date.today()
+    rows = []
+    for barcode in barcodes:
+        _, record = BARCODE_INDEX.get(barcode)
+        if record:
+            record["days_left"] = (pd.to_datetime(record["exp_date"]).date() - today).days
+            rows.append(record)
+    return total, rows
+
+# Report of the stock expiring soon (or in a date range), soonest first
+@rt("/expiring", methods=["GET", "POST"])
+async def expiring(
+    req,
+    days: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    page: str | None = None,
+    page_size: str | None = None
+):
+
+    # Check if the user is logged in by verifying the session cookie
+    if req.cookies.get("session") != SECRET_KEY:
+        return Redirect("/")
+
+    page = parse_int(page, 1)
+    page_size = parse_page_size(page_size)
+    range_start, range_end, input_errors = expiry_range(days, start, end)
+    total, rows = expiring_barcodes(range_start, range_end, (page - 1) * page_size, page_size)
+
+    df = pd.DataFrame(rows, columns=["barcode", "item_number", "description", "lot_number", "exp_date", "days_left", "typ", "quantity"])
+    df.columns = ["Barcode", "Item #", "Description", "Lot #", "Exp Date", "Days Left", "Type", "Quantity"]
+    summary = P(
+        f"{total} barcodes expiring " + (f"from {range_start} " if range_start else "") + (f"by {range_end}" if range_end else "onwards"),
+        style="text-align:center; margin-top:10px;"
+    )
+    results = results_fragment(Div(summary, df_to_html_table(df, link_barcode=True)), pager("/expiring", {
+        "days": days,
+        "start": start,
+        "end": end,
+        "page_size": page_size
+    }, page, total > page * page_size))
+    if wants_results_fragment(req):
+        return results
+
+    # Filter row above table
+    filter_row = Form(
+        Div(
+            Input(
+                type="number",
+                name="days",
+                placeholder=f"Days ({EXPIRING_DAYS})",
+                value=days or "",
+                min="0",
+                style="width:120px; margin-right:5px; margin-top:15px;"
+            ),
+            Input(
+                type="text",
+                name="start",
+                placeholder="Exp Date From",
+                value=start or "",
+                style="width:160px; margin-right:5px; margin-top:15px;" + (INPUT_ERROR_STYLE if input_errors.get("start") else "")
+            ),
+            Input(
+                type="text",
+                name="end",
+                placeholder="Exp Date To",
+                value=end or "",
+                style="width:160px; margin-right:5px; margin-top:15px;" + (INPUT_ERROR_STYLE if input_errors.get("end") else "")
+            ),
+            Select(
+                *[Option(f"{size} rows", value=str(size), selected=(size == page_size)) for size in PAGE_SIZES],
+                name="page_size",
+                style="width:120px; margin-right:5px; margin-top:15px;"
+            ),
+            Button("Filter", type="submit", style=SUBMIT_BUTTON_STYLE),
+            style="display:flex; flex-wrap: nowrap; overflow-x:auto; align-items:center;"
+        ),
+        method="POST",
+        **live_filter_attrs("/expiring")
+    )
+
+    # Render page
+    return Title("Expiring Soon"), Titled(
+        Div(
+            H2("Expiring Soon", style="text-align:center; margin-bottom:20px;"),
+            filter_row,
+            results,
+            Div(
+                A("Back", href="/home", style=BACK_BUTTON_STYLE),
+                style="margin-top: 20px; text-align:center;"
+            ),
+            style="max-width: 125%; margin:auto;"
+        )
+    )
+
+# The expiring report as JSON, with the same parameters as /expiring
+@rt("/api/expiring")
+def api_expiring(
+    req,
+    days: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    page: str | None = None,
+    page_size: str | None = None
+):
+    # Check if the user is logged in by verifying the session cookie
+    if req.cookies.get("session") != SECRET_KEY:
+        return JSONResponse({"error": "Not logged in."}, status_code=401)
+
+    page = parse_int(page, 1)
+    page_size = parse_page_size(page_size)
+    range_start, range_end, input_errors = expiry_range(days, start, end)
+    if input_errors:
+        return JSONResponse({"error": f"Invalid date: {', '.join(input_errors)}."}, status_code=400)
+
+    total, rows = expiring_barcodes(range_start, range_end, (page - 1) * page_size, page_size)
+    return JSONResponse({
+        "start": range_start,
+        "end": range_end,
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "items": rows,
+    })
+
+# Daily transaction counts and quantities from the transaction_daily rollups, as time
+# series per value of a dimension (total, typ, item_number or employee) and add/remove.
+# Without a value, only the `top` values with the most transactions are returned.
+@rt("/analytics")
+async def analytics(
+    req,
+    dimension: str | None = None,
+    value: str | None = None,
+    add_remove: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    top: str | None = None
+):
+    # Check if the user is logged in by verifying the session cookie
+    if req.cookies.get("session") != SECRET_KEY:
+        return JSONResponse({"error": "Not logged in."}, status_code=401)
+
+    # Nothing has changed since the client's copy: skip the query
+    etag = await view_etag(req)
+    if not_modified(req, etag):
+        return not_modified_response(etag)
+
+    dimension = dimension or "total"
+    if dimension not in ROLLUP_DIMENSIONS:
+        return JSONResponse({"error": f"dimension must be one of: {', '.join(ROLLUP_DIMENSIONS)}."}, status_code=400)
+    try:
+        end = pd.to_datetime(end).date() if end else dt.date.today()
+        start = pd.to_datetime(start).date() if start else end - dt.timedelta(days=ANALYTICS_DAYS)
+    except Exception:
+        return JSONResponse({"error": "start and end must be dates."}, status_code=400)
+
+    filters = [("dimension", "eq", dimension), ("day", "gte", start.isoformat()), ("day", "lte", end.isoformat())]
+    if value is not None:
+        filters.append(("value", "eq", value))
+    if add_remove:
+        filters.append(("add_remove", "eq", add_remove))
+    df = await STORAGE.afetch_all(
+        "transaction_daily",
+        columns="day, value, add_remove, transactions, quantity",
+        filters=filters,
+        order=[("day", False), ("value", False), ("add_remove", False)],
+        workers=FETCH_WORKERS
+    )
+
+    if value is None and not df.empty:
+        busiest = df.groupby("value")["transactions"].sum().nlargest(parse_int(top, ANALYTICS_TOP))
+        df = df[df["value"].isin(busiest.index)]
+
+    series = [
+        {
+            "value": group_value,
+            "add_remove": group_add_remove,
+            "days": [str(day)[:10] for day in group["day"]],
+            "transactions": group["transactions"].astype(int).tolist(),
+            "quantity": group["quantity"].astype(int).tolist(),
+        }
+        for (group_value, group_add_remove), group in df.groupby(["value", "add_remove"], sort=True)
+    ]
+    return JSONResponse({
+        "dimension": dimension,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "series": series,
+    }, headers=etag_headers(etag))
+
 # Form to view current inventory with filters
 @rt("/inventory")
-def inventory(
+async def inventory(
     req,
     item_number: str | None = None,
     lot_number: str | None = None,
     exp_date: str | None = None,
-    item_type: str | None = None
+    item_type: str | None = None,
+    as_of: str | None = None
 ):
     
     # Check if the user is logged in by verifying the session cookie
     if req.cookies.get("session") != SECRET_KEY:
         return Redirect("/")
 
-    # Read Supabase table
-    response = SUPABASE.table("barcodes").select("*").execute()
-    df = pd.DataFrame(response.data)
+    # Nothing has changed since the client's copy: skip the query and rendering
+    etag = await view_etag(req)
+    if not_modified(req, etag):
+        return not_modified_response(etag)
+
+    # Build the filters as server-side predicates
+    filters, input_errors = list_filters([
+        ("item_number", item_number),
+        ("lot_number", lot_number),
+        ("typ", item_type),
+    ], exp_date)
+
+    # Inventory at the end of a past day, replayed from the transaction log
+    as_of_day = None
+    if as_of:
+        try:
+            as_of_day = pd.to_datetime(as_of).date()
+        except Exception:
+            input_errors["as_of"] = True
+
+    if as_of_day:
+        grouped = await inventory_as_of(STORAGE, as_of_day + dt.timedelta(days=1), filters, workers=FETCH_WORKERS)
+    else:
+        # Read the whole maintained inventory aggregate; its key columns give a stable order
+        order = [("item_number", False), ("lot_number", False), ("exp_date", False), ("typ", False)]
+        grouped = await cached_query(("inventory_totals", filters), lambda: STORAGE.afetch_all(
+            "inventory_totals",
+            columns="item_number, lot_number, exp_date, typ, quantity",
+            filters=filters,
+            order=order,
+            workers=FETCH_WORKERS
+        ))
 
     # Render message if no inventory
-    if df.empty:
+    if grouped.empty and not filters and not as_of:
         return Title("Inventory"), Titled(
             Div(
                 H2("Inventory", style="text-align:center; margin-bottom:20px;"),
@@ -1125,56 +2278,16 @@ def inventory(
                 A("Back", href="/", style=BACK_BUTTON_STYLE),
                 style="max-width:600px; margin:auto;"
             )
-        )
-
-    # Calculate current inventory
-    df = df[df["remove"] == 0]
-
-    # Group your data
-    grouped = (
-        df.groupby(["item_number", "lot_number", "exp_date", "typ"])
-        .agg(quantity=("quantity", "sum"))
-        .reset_index()
-    )
-
-    # Delete all rows
-    SUPABASE.rpc("exec_sql", {
-        "sql": "DROP TABLE IF EXISTS inventory"
-    }).execute()
-
-    SUPABASE.rpc("exec_sql", {
-        "sql": """
-            CREATE TABLE public.inventory (
-                id SERIAL PRIMARY KEY,
-                item_number VARCHAR(20) DEFAULT '',
-                lot_number VARCHAR(20) DEFAULT '',
-                exp_date DATE DEFAULT CURRENT_DATE,
-                typ VARCHAR(20) DEFAULT '',
-                quantity INT DEFAULT 0
-            );
-        """
-    }).execute()
-
-    # Force PostgREST to reload schema
-    SUPABASE.rpc("exec_sql", {
-        "sql": "ALTER TABLE inventory OWNER TO postgres;"
-    }).execute()
-
-    # Give the API a moment to update
-    import time
-    time.sleep(2)
-
-    SUPABASE.table("inventory").insert(grouped.to_dict(orient="records")).execute()
+        ), *etag_header_tags(etag)
 
     grouped.columns = ["Item #", "Lot #", "Exp Date", "Type", "Quantity"]
 
-    # Apply filters
-    if item_number: grouped = grouped[grouped["Item #"].str.contains(item_number, case=False, na=False)]
-    if lot_number: grouped = grouped[grouped["Lot #"].str.contains(lot_number, case=False, na=False)]
-    if exp_date: grouped = grouped[grouped["Exp Date"].astype(str).str.contains(exp_date, na=False)]
-    if item_type: grouped = grouped[grouped["Type"].str.contains(item_type, case=False, na=False)]
-
     table = df_to_html_table(grouped)
+    if as_of_day:
+        table = Div(P(f"Inventory at the end of {as_of_day.isoformat()}", style="text-align:center;"), table)
+    results = results_fragment(table, height="70vh")
+    if wants_results_fragment(req):
+        return results, *etag_header_tags(etag)
 
     # Filter row above table
     filter_row = Form(
@@ -1198,7 +2311,7 @@ def inventory(
                 name="exp_date",
                 placeholder="Exp Date",
                 value=exp_date or "",
-                style="width:160px; margin-right:5px; margin-top:15px;"
+                style="width:160px; margin-right:5px; margin-top:15px;" + (INPUT_ERROR_STYLE if input_errors.get("exp_date") else "")
             ),
             Input(
                 type="text",
@@ -1207,10 +2320,18 @@ def inventory(
                 value=item_type or "",
                 style="width:120px; margin-right:5px; margin-top:15px;"
             ),
+            Input(
+                type="text",
+                name="as_of",
+                placeholder="As Of Date",
+                value=as_of or "",
+                style="width:160px; margin-right:5px; margin-top:15px;" + (INPUT_ERROR_STYLE if input_errors.get("as_of") else "")
+            ),
             Button("Filter", type="submit", style=SUBMIT_BUTTON_STYLE),
             style="display:flex; flex-wrap: nowrap; overflow-x:auto; align-items:center;"
         ),
-        method="POST"
+        method="POST",
+        **live_filter_attrs("/inventory")
     )
 
     # Render page
@@ -1218,16 +2339,7 @@ def inventory(
         Div(
             H2("Inventory", style="text-align:center; margin-bottom:20px;"),
             filter_row,
-            Div(
-                table,
-                style=(
-                    "height: 70vh; "
-                    "overflow-y: auto; "
-                    "border: 1px solid #444; "
-                    "padding: 10px; "
-                    "border-radius: 8px; margin-top:10px;"
-                )
-            ),
+            results,
 
             Div(
                 A("Back", href="/home", style=BACK_BUTTON_STYLE),
@@ -1236,46 +2348,231 @@ def inventory(
 
             style="max-width: 125%; margin:auto;"
         )
+    ), *etag_header_tags(etag)
+
+# Check barcode quantities against the transaction log (see reconcile.py). Checks the
+# barcodes with transactions since the last run unless full is set; repair sets the
+# mismatched quantities to the logged ones.
+@rt("/reconcile", methods=["POST"])
+async def reconcile_barcodes(req, full: str | None = None, repair: str | None = None):
+    # Check if the user is logged in by verifying the session cookie
+    if req.cookies.get("session") != SECRET_KEY:
+        return JSONResponse({"error": "Not logged in."}, status_code=401)
+
+    report = await reconcile(STORAGE, full=full in ("1", "true"), repair=repair in ("1", "true"), workers=FETCH_WORKERS)
+    if report["repaired"]:
+        barcodes_written({row["barcode"]: row for row in report["repaired"]})
+    return JSONResponse(report)
+
+# Barcode cache hit/miss counters and index sizes
+@rt("/cache_stats")
+def cache_stats(req):
+    # Check if the user is logged in by verifying the session cookie
+    if req.cookies.get("session") != SECRET_KEY:
+        return Redirect("/")
+
+    return JSONResponse({**BARCODE_CACHE.stats(), "barcode_index": BARCODE_INDEX.stats(), "expiry_index": EXPIRY_INDEX.stats(), "search_index": SEARCH_INDEX.stats(), "export_jobs": EXPORT_JOBS.stats()})
+
+# Route and query metrics in the Prometheus text format. Scrapers send
+# "Authorization: Bearer <METRICS_TOKEN>"; logged-in users can open it in the browser.
+@rt("/metrics")
+def metrics(req):
+    authorized = req.cookies.get("session") == SECRET_KEY
+    if METRICS_TOKEN and req.headers.get("authorization") == f"Bearer {METRICS_TOKEN}":
+        authorized = True
+    if not authorized:
+        return Response("Unauthorized", status_code=401)
+
+    return Response(METRICS.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Columns written to each export sheet
+EXPORT_TRANSACTION_COLUMNS = ["trans_id", "barcode", "item_number", "description", "lot_number", "exp_date", "typ", "add_remove", "quantity", "trans_date", "employee"]
+EXPORT_BARCODE_COLUMNS = ["barcode", "item_number", "description", "lot_number", "exp_date", "typ", "quantity", "remove"]
+EXPORT_INVENTORY_COLUMNS = ["item_number", "lot_number", "exp_date", "typ", "quantity"]
+EXPORT_PAGE_SIZE = 1000
+
+# Read a whole table one page at a time, paging by keyset on a unique key column
+async def iter_table_pages(table, columns, key, desc=True, page_size=EXPORT_PAGE_SIZE):
+    last = None
+    while True:
+        filters = [(key, "lt" if desc else "gt", last)] if last is not None else []
+        rows = await STORAGE.aselect(table, columns=", ".join(columns), filters=filters, order=[(key, desc)], limit=page_size)
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][key]
+
+# Append a page of rows to a worksheet, in the given column order
+def append_rows(sheet, columns, rows):
+    for row in rows:
+        sheet.append([row[col] for col in columns])
+
+# Write the export workbook into a file (a path or a file object). The transactions and barcodes tables are read
+# concurrently, each streamed page by page into its own write-only worksheet, and the
+# inventory sheet is summed from the barcode pages as they pass. Pages are appended on a
+# worker thread, one at a time, so the event loop is not blocked while a large export runs.
+# `job`, if given, is an export job whose row counts are kept up to date.
+async def write_export_workbook(file, job=None):
+    workbook = Workbook(write_only=True)
+    transactions_sheet = workbook.create_sheet("Transactions")
+    barcodes_sheet = workbook.create_sheet("Barcodes")
+    inventory_sheet = workbook.create_sheet("Inventory")
+    transactions_sheet.append(EXPORT_TRANSACTION_COLUMNS)
+    barcodes_sheet.append(EXPORT_BARCODE_COLUMNS)
+    inventory_sheet.append(EXPORT_INVENTORY_COLUMNS)
+
+    workbook_lock = asyncio.Lock()
+    inventory_totals = {}
+
+    def add_inventory(rows):
+        for row in rows:
+            if row["remove"] == 0:
+                key = (row["item_number"], row["lot_number"], row["exp_date"], row["typ"])
+                inventory_totals[key] = inventory_totals.get(key, 0) + int(row["quantity"] or 0)
+
+    async def copy_table(table, columns, key, sheet, on_page=None):
+        async for rows in iter_table_pages(table, columns, key):
+            async with workbook_lock:
+                await run_to_completion(append_rows, sheet, columns, rows)
+            if on_page:
+                on_page(rows)
+            if job:
+                job["rows"] += len(rows)
+
+    if job:
+        job["expected"] = await export_row_estimate()
+
+    def finish():
+        for key in sorted(inventory_totals, key=lambda key: tuple(str(value) for value in key)):
+            inventory_sheet.append([*key, inventory_totals[key]])
+        workbook.save(file)
+
+    try:
+        # A task group, unlike gather, waits for both copies to stop before passing on a failure
+        async with asyncio.TaskGroup() as copies:
+            copies.create_task(copy_table("transactions", EXPORT_TRANSACTION_COLUMNS, "trans_id", transactions_sheet))
+            copies.create_task(copy_table("barcodes", EXPORT_BARCODE_COLUMNS, "barcode", barcodes_sheet, add_inventory))
+        await run_to_completion(finish)
+    except BaseException:
+        # Close the worksheets' temporary files rather than leaving them to the garbage collector
+        for sheet in workbook.worksheets:
+            if not sheet.closed:
+                sheet.close()
+        raise
+
+# Run a blocking call on a worker thread. If the caller is cancelled meanwhile, wait for
+# the call to return before passing the cancellation on, so nothing it is writing to is
+# closed under it.
+async def run_to_completion(func, *args):
+    call = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(call)
+    except asyncio.CancelledError:
+        await asyncio.wait([call])
+        raise
+
+# Rows an export will write: the highest trans_id (deleted transactions make it an
+# overestimate) plus the barcodes in the barcode index
+async def export_row_estimate():
+    last = await STORAGE.aselect("transactions", columns="trans_id", order=[("trans_id", True)], limit=1)
+    barcodes = BARCODE_INDEX.stats()
+    return (int(last[0]["trans_id"]) if last else 0) + barcodes["active"] + barcodes["removed"]
+
+# Build the export workbook of an export job at path
+async def build_export(path, job):
+    await write_export_workbook(path, job)
+
+# Start (or join) the export job for the current data
+async def start_export():
+    return EXPORT_JOBS.start(DATA_VERSION.tag(await STORAGE.adata_version()), build_export)
+
+# The finished export file of a job, as a download
+def export_file_response(job, etag=None):
+    return FileResponse(
+        job["path"],
+        filename=f"quality_inv_data_{dt.datetime.fromtimestamp(job['finished']).strftime('%Y%m%d_%H%M%S')}.xlsx",
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers=etag_headers(etag) if etag else None
+    )
+
+# Progress of an export job, polled by the export page until its file is ready
+def export_progress(job):
+    if job["status"] == "done":
+        return Div(
+            P("Export ready.", style="text-align:center;"),
+            A("Download", href=f"/export_jobs/{job['id']}/file", style=SUBMIT_BUTTON_STYLE + "margin: 25px auto;"),
+            id="export-progress"
+        )
+    if job["status"] == "failed":
+        return Div(P(f"Export failed: {job['error']}", style="color:red; text-align:center;"), id="export-progress")
+    progress = EXPORT_JOBS.describe(job)["progress"]
+    return Div(
+        P(f"Building export... {job['rows']:,} rows written ({progress:.0%})", style="text-align:center;"),
+        id="export-progress",
+        hx_get=f"/export_jobs/{job['id']}",
+        hx_trigger="every 1s",
+        hx_swap="outerHTML"
     )
 
 # Export data to Excel
 @rt("/export_excel")
-def export_excel(req):
+async def export_excel(req):
     # Check if the user is logged in by verifying the session cookie
     if req.cookies.get("session") != SECRET_KEY:
         return Redirect("/")
 
-    # Fetch data from Supabase and reformat
-    df_transactions = pd.DataFrame(SUPABASE.table("transactions").select("*").execute().data)
-    df_transactions = df_transactions[["trans_id", "barcode", "item_number", "description", "lot_number", "exp_date", "typ", "add_remove", "quantity", "trans_date", "employee"]]
-    df_transactions.sort_values(by="trans_id", ascending=False, inplace=True)
-    df_barcodes = pd.DataFrame(SUPABASE.table("barcodes").select("*").execute().data)
-    df_barcodes = df_barcodes[["barcode", "item_number", "description", "lot_number", "exp_date", "typ", "quantity", "remove"]]
-    df_barcodes.sort_values(by="barcode", ascending=False, inplace=True)
-
-    # Create inventory sheet
-    if not df_barcodes.empty:
-        df_inventory = df_barcodes[df_barcodes["remove"] == 0].groupby(
-            ["item_number", "lot_number", "exp_date", "typ"], as_index=False
-        ).agg({"quantity": "sum"})
-    else:
-        df_inventory = pd.DataFrame()
-
-    # Write Excel file
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df_transactions.to_excel(writer, sheet_name="Transactions", index=False)
-        df_barcodes.to_excel(writer, sheet_name="Barcodes", index=False)
-        df_inventory.to_excel(writer, sheet_name="Inventory", index=False)
-    output.seek(0)
-
-    today = dt.datetime.now().strftime("%Y%m%d_%H%M%S")
-    return Response(
-        output.read(),
-        headers={
-            "Content-Disposition": f"attachment; filename=quality_inv_data_{today}.xlsx",
-            "Content-Type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        }
+    # Nothing has changed since the client's copy: skip building the workbook
+    etag = await view_etag(req)
+    if not_modified(req, etag):
+        return not_modified_response(etag)
+
+    # Serve the file already built for this data, or start building it in the background
+    # and show its progress
+    job = await start_export()
+    if job["status"] == "done":
+        return export_file_response(job, etag)
+
+    return Title("Export Data To Excel"), Titled(
+        Div(
+            H2("Export Data To Excel", style="text-align:center;"),
+            export_progress(job),
+            style="max-width: 600px; margin: auto;"
+        )
     )
 
+# Start an export job (or join the one for the current data); returns its id and progress
+@rt("/export_jobs", methods=["POST"])
+async def start_export_job(req):
+    # Check if the user is logged in by verifying the session cookie
+    if req.cookies.get("session") != SECRET_KEY:
+        return JSONResponse({"error": "Not logged in."}, status_code=401)
+
+    return JSONResponse(EXPORT_JOBS.describe(await start_export()), status_code=202)
+
+# Progress of an export job: JSON, or the progress fragment for the export page
+@rt("/export_jobs/{job_id}")
+async def export_job(req, job_id: str):
+    # Check if the user is logged in by verifying the session cookie
+    if req.cookies.get("session") != SECRET_KEY:
+        return JSONResponse({"error": "Not logged in."}, status_code=401)
+
+    job = EXPORT_JOBS.get(job_id)
+    if req.headers.get("HX-Request") == "true":
+        return export_progress(job) if job else P("Export not found.", style="color:red; text-align:center;")
+    if not job:
+        return JSONResponse({"error": "Export not found."}, status_code=404)
+    return JSONResponse({**EXPORT_JOBS.describe(job), "file": f"/export_jobs/{job_id}/file" if job["status"] == "done" else None})
+
+# The finished file of an export job
+@rt("/export_jobs/{job_id}/file")
+async def export_job_file(req, job_id: str):
+    # Check if the user is logged in by verifying the session cookie
+    if req.cookies.get("session") != SECRET_KEY:
+        return Redirect("/")
+
+    job = EXPORT_JOBS.get(job_id)
+    if not job or job["status"] != "done" or not os.path.exists(job["path"]):
+        return Response("Export not found.", status_code=404)
+    return export_file_response(job)
+
 serve()
\ No newline at end of file
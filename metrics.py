@@ -0,0 +1,254 @@
+import json
+import logging
+import threading
+import time
+
+from starlette.routing import Match
+
+# Request and query metrics, exposed in the Prometheus text format.
+#
+#   MetricsMiddleware     times every HTTP request by route, method and status
+#   InstrumentedStorage   wraps a Storage backend and times every call by table and operation,
+#                         with the rows it returned (and, if payload_bytes is set, their JSON
+#                         size); calls slower than slow_seconds are logged with the shape of
+#                         the query
+#   Metrics.time(section) times a block of app code (e.g. table rendering)
+#
+# Everything is kept in process; /metrics renders it with Metrics.render().
+
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+ROWS_BUCKETS = [0, 1, 10, 100, 1000, 10000, 100000]
+BYTES_BUCKETS = [100, 1000, 10000, 100000, 1000000, 10000000, 100000000]
+
+logger = logging.getLogger("quality_inventory.metrics")
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, label_values, value):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._series.items()):
+            labels = format_labels(self.labels, label_values)
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{labels}}} {series[-1]}")
+        return lines
+
+
+class Metrics:
+    def __init__(self, slow_seconds=0.5):
+        self.slow_seconds = slow_seconds
+        self._lock = threading.Lock()
+        self.request_seconds = Histogram(
+            "http_request_duration_seconds", "Time to serve an HTTP request, including the response body.",
+            ["route", "method", "status"], LATENCY_BUCKETS)
+        self.response_bytes = Histogram(
+            "http_response_size_bytes", "Size of HTTP response bodies.",
+            ["route", "method"], BYTES_BUCKETS)
+        self.query_seconds = Histogram(
+            "db_query_duration_seconds", "Time spent in storage calls.",
+            ["table", "operation"], LATENCY_BUCKETS)
+        self.query_rows = Histogram(
+            "db_query_rows", "Rows returned by storage calls.",
+            ["table", "operation"], ROWS_BUCKETS)
+        self.query_bytes = Histogram(
+            "db_query_payload_bytes", "JSON size of the rows returned by storage calls.",
+            ["table", "operation"], BYTES_BUCKETS)
+        self.section_seconds = Histogram(
+            "app_section_duration_seconds", "Time spent in timed sections of app code.",
+            ["section"], LATENCY_BUCKETS)
+
+    def observe_request(self, route, method, status, seconds, size):
+        with self._lock:
+            self.request_seconds.observe((route, method, str(status)), seconds)
+            self.response_bytes.observe((route, method), size)
+
+    # size is None when payload sizes are not measured
+    def observe_query(self, table, operation, seconds, rows, size, shape=None):
+        with self._lock:
+            self.query_seconds.observe((table, operation), seconds)
+            self.query_rows.observe((table, operation), rows)
+            if size is not None:
+                self.query_bytes.observe((table, operation), size)
+        if seconds >= self.slow_seconds:
+            logger.warning("Slow %s on %s took %.3fs: %s", operation, table, seconds, shape)
+
+    # Time a block of code: `with METRICS.time("render_table"): ...`
+    def time(self, section):
+        return SectionTimer(self, section)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for histogram in (self.request_seconds, self.response_bytes, self.query_seconds,
+                              self.query_rows, self.query_bytes, self.section_seconds):
+                lines += histogram.render()
+        return "\n".join(lines) + "\n"
+
+
+class SectionTimer:
+    def __init__(self, metrics, section):
+        self.metrics = metrics
+        self.section = section
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        with self.metrics._lock:
+            self.metrics.section_seconds.observe((self.section,), seconds)
+
+
+def format_labels(names, values):
+    return ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# ASGI middleware timing every HTTP request, labelled with the path template of the route
+# that matched (e.g. /export_jobs/{job_id}). Paths that match no route are grouped under
+# "other" so unknown URLs cannot grow the number of series.
+class MetricsMiddleware:
+    def __init__(self, app, metrics, router):
+        self.app = app
+        self.metrics = metrics
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_and_measure(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_measure)
+        finally:
+            self.metrics.observe_request(self.route_label(scope), scope["method"], status, time.perf_counter() - start, size)
+
+    def route_label(self, scope):
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match != Match.NONE and hasattr(route, "path"):
+                return route.path
+        return "other"
+
+
+# Storage calls that do not name their table, and the table they work on
+STORAGE_CALL_TABLES = {
+    "apply_inventory_deltas": "inventory_totals",
+    "rebuild_inventory": "inventory_totals",
+    "apply_rollup_deltas": "transaction_daily",
+    "rebuild_rollups": "transaction_daily",
+    "add_barcode": "barcodes",
+    "remove_barcode": "barcodes",
+    "add_barcodes": "barcodes",
+    "remove_barcodes": "barcodes",
+    "update_barcode": "barcodes",
+    "data_version": "data_version",
+}
+STORAGE_TABLE_CALLS = {"select", "fetch_all", "insert", "update", "delete", "upsert"}
+
+
+# Wraps a Storage backend, timing every call by table and operation. Async calls
+# (aselect, ...) are recorded under the same operation as their sync counterpart.
+# Measuring payload sizes serializes every result to JSON, which costs seconds for large
+# frames, so it is off unless payload_bytes is set.
+class InstrumentedStorage:
+    def __init__(self, storage, metrics, payload_bytes=False):
+        self.storage = storage
+        self.metrics = metrics
+        self.payload_bytes = payload_bytes
+
+    def __getattr__(self, name):
+        attribute = getattr(self.storage, name)
+        operation = name[1:] if name.startswith("a") and name[1:] in STORAGE_TABLE_CALLS | set(STORAGE_CALL_TABLES) else name
+        if operation not in STORAGE_TABLE_CALLS and operation not in STORAGE_CALL_TABLES:
+            return attribute
+
+        def describe(args, kwargs):
+            if operation in STORAGE_TABLE_CALLS:
+                table = args[0] if args else kwargs.get("table")
+                return table, query_shape(operation, args[1:], kwargs)
+            return STORAGE_CALL_TABLES[operation], operation
+
+        def record(args, kwargs, start, result):
+            seconds = time.perf_counter() - start
+            table, shape = describe(args, kwargs)
+            rows, size = result_size(result, self.payload_bytes)
+            self.metrics.observe_query(table, operation, seconds, rows, size, shape)
+
+        if name != operation:
+            async def timed_async(*args, **kwargs):
+                start = time.perf_counter()
+                result = await attribute(*args, **kwargs)
+                record(args, kwargs, start, result)
+                return result
+            return timed_async
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            result = attribute(*args, **kwargs)
+            record(args, kwargs, start, result)
+            return result
+        return timed
+
+
+# The shape of a storage call for the slow-call log: its columns and operators, without values
+def query_shape(operation, args, kwargs):
+    if operation not in ("select", "fetch_all"):
+        return operation
+    names = ["columns", "filters", "order", "limit", "offset"]
+    call = {**dict(zip(names, args)), **kwargs}
+    filters = [filter_shape(f) for f in call.get("filters") or ()]
+    order = [f"{column} {'desc' if desc else 'asc'}" for column, desc, *_ in call.get("order") or ()]
+    return f"{operation} {call.get('columns', '*')} where={filters} order={order} limit={call.get('limit')}"
+
+
+def filter_shape(condition):
+    column, op, value = condition
+    if op == "or_":
+        return [[(c, o) for c, o, _ in group] for group in value]
+    return (column, op)
+
+
+# Rows and JSON size of what a storage call returned; the size is None unless payload_bytes is set
+def result_size(result, payload_bytes=False):
+    if result is None:
+        return 0, 0 if payload_bytes else None
+    rows = 1 if isinstance(result, (dict, int)) else len(result)
+    if not payload_bytes:
+        return rows, None
+    if hasattr(result, "to_json"):  # DataFrame
+        return rows, len(result.to_json(orient="records", date_format="iso"))
+    return rows, len(json.dumps(result, default=str))
@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from storage import INVENTORY_KEY, create_storage, pages_frame
+
+# Reconciliation of barcodes.quantity against the transaction log.
+#
+# A barcode's quantity should be its Add quantities minus its Remove quantities in
+# transactions. Editing or deleting a transaction changes the log without touching the
+# barcode, so the two can drift apart; a run computes the net quantity per barcode with a
+# pandas groupby, diffs it against the barcodes table and reports (or repairs) mismatches.
+#
+# Runs are incremental: reconcile_state keeps the highest trans_id seen, and a run only
+# checks the barcodes of transactions logged after it, plus the barcodes queued in
+# reconcile_pending: those of edited or deleted transactions, and mismatches an earlier
+# run reported without repairing. A full run checks every barcode.
+#
+# trans_ids come from a sequence before the transaction commits, so a slow write can
+# commit a lower trans_id after a run has moved past it. Each incremental run therefore
+# also checks the LATE_COMMIT_IDS ids below the high-water mark.
+#
+# Repairs write barcodes and inventory_totals, which the app keeps copies of in process,
+# so they only run inside the app (POST /reconcile with repair=1). The command reports:
+#
+#   python reconcile.py [--full]
+
+STATE_NAME = "barcodes"
+BARCODE_COLUMNS = "barcode, item_number, description, lot_number, exp_date, typ, quantity, remove"
+TRANSACTION_COLUMNS = "trans_id, barcode, add_remove, quantity"
+# Most keys sent in one "in" filter
+KEY_BATCH = 500
+# trans_ids below the high-water mark that an incremental run checks again
+LATE_COMMIT_IDS = 1000
+
+# Runs happen one at a time
+_run_lock = asyncio.Lock()
+
+
+# Reconcile barcodes against the log; returns the report, with the repaired barcode rows
+# (after the update) under "repaired" and the barcodes that changed before they could be
+# repaired under "skipped"
+async def reconcile(storage, full=False, repair=False, workers=4):
+    async with _run_lock:
+        return await _reconcile(storage, full, repair, workers)
+
+
+async def _reconcile(storage, full, repair, workers):
+    state = await storage.aselect("reconcile_state", filters=[("name", "eq", STATE_NAME)])
+    high_water = 0 if full or not state else int(state[0]["high_water"])
+    start = max(high_water - LATE_COMMIT_IDS, 0)
+    last = await storage.aselect("transactions", columns="trans_id", order=[("trans_id", True)], limit=1)
+    top = int(last[0]["trans_id"]) if last else 0
+    pending = [row["barcode"] for row in await storage.aselect("reconcile_pending", columns="barcode")]
+
+    if high_water == 0:
+        transactions = await storage.afetch_all("transactions", columns=TRANSACTION_COLUMNS, order=[("trans_id", False)], workers=workers)
+        barcodes = await storage.afetch_all("barcodes", columns=BARCODE_COLUMNS, order=[("barcode", False)], workers=workers)
+    else:
+        new = await storage.afetch_all(
+            "transactions",
+            columns="trans_id, barcode",
+            filters=[("trans_id", "gt", start), ("trans_id", "lte", top)],
+            order=[("trans_id", False)],
+            workers=workers
+        )
+        touched = sorted(set(new["barcode"].dropna().astype(str)) | set(map(str, pending)))
+        transactions = await fetch_batches(storage, "transactions", TRANSACTION_COLUMNS, "trans_id", touched, workers)
+        barcodes = await fetch_batches(storage, "barcodes", BARCODE_COLUMNS, "barcode", touched, workers)
+
+    mismatches = diff_quantities(barcodes, net_quantities(transactions))
+    repaired, skipped = await repair_barcodes(storage, barcodes, mismatches) if repair else ([], [])
+
+    await storage.aupsert("reconcile_state", [{
+        "name": STATE_NAME,
+        "high_water": top,
+        "checked_at": str(pd.Timestamp.now()),
+    }], on_conflict="name")
+    for start in range(0, len(pending), KEY_BATCH):
+        await storage.adelete("reconcile_pending", [("barcode", "in_", pending[start:start + KEY_BATCH])])
+    # Keep the mismatches left in place for the next run, so a later repair still sees them
+    repaired_barcodes = {str(row["barcode"]) for row in repaired}
+    await queue_barcodes(storage, [
+        barcode for barcode in mismatches.loc[mismatches["status"] == "mismatch", "barcode"]
+        if barcode not in repaired_barcodes
+    ])
+
+    return {
+        "full": high_water == 0,
+        "from_trans_id": start,
+        "to_trans_id": top,
+        "checked": int(len(set(barcodes["barcode"].astype(str)) | set(transactions["barcode"].dropna().astype(str)))),
+        "mismatches": mismatches.to_dict("records"),
+        "repaired": repaired,
+        "skipped": skipped,
+    }
+
+
+# Queue barcodes for the next run, after transactions of theirs were edited or deleted
+async def queue_barcodes(storage, barcodes):
+    rows = [{"barcode": str(barcode)} for barcode in set(barcodes) if barcode]
+    if rows:
+        await storage.aupsert("reconcile_pending", rows, on_conflict="barcode")
+
+
+# Net quantity per barcode: Add quantities count up, Remove quantities down
+def net_quantities(transactions):
+    transactions = transactions[transactions["barcode"].notna()]
+    sign = np.select([transactions["add_remove"] == "Add", transactions["add_remove"] == "Remove"], [1, -1], 0)
+    quantity = sign * pd.to_numeric(transactions["quantity"], errors="coerce").fillna(0).astype(int)
+    return quantity.groupby(transactions["barcode"].astype(str)).sum()
+
+
+# One row per barcode whose recorded quantity differs from its net quantity: barcode,
+# quantity, net_quantity, difference and status ("mismatch", or "missing" for a barcode
+# that is in the log but not in the barcodes table)
+def diff_quantities(barcodes, net):
+    recorded = pd.to_numeric(barcodes["quantity"], errors="coerce").fillna(0).astype(int)
+    recorded.index = barcodes["barcode"].astype(str)
+    frame = pd.concat([recorded.rename("quantity"), net.rename("net_quantity")], axis=1)
+    frame["net_quantity"] = frame["net_quantity"].fillna(0).astype(int)
+    frame["status"] = np.where(frame["quantity"].isna(), "missing", "mismatch")
+    frame = frame[frame["quantity"].isna() | (frame["quantity"] != frame["net_quantity"])].copy()
+    frame["difference"] = frame["net_quantity"] - frame["quantity"].fillna(0).astype(int)
+    frame = frame.rename_axis("barcode").reset_index().sort_values("barcode", ignore_index=True)
+    frame["quantity"] = frame["quantity"].astype(object).where(frame["quantity"].notna(), None)
+    return frame[["barcode", "quantity", "net_quantity", "difference", "status"]]
+
+
+# Set each mismatched barcode's quantity to its net quantity, flagging it removed when that
+# is zero or less, and move the difference in inventory_totals. A row is only updated while
+# its quantity and remove flag are still as read, so a write made since the read is not
+# overwritten; those barcodes are skipped (and stay queued for the next run). Returns the
+# updated rows and the skipped barcodes.
+async def repair_barcodes(storage, barcodes, mismatches):
+    records = {str(row["barcode"]): row for row in barcodes.to_dict("records")}
+    repaired = []
+    skipped = []
+    deltas = []
+    for mismatch in mismatches[mismatches["status"] == "mismatch"].to_dict("records"):
+        record = records[mismatch["barcode"]]
+        values = {"quantity": int(mismatch["net_quantity"])}
+        if values["quantity"] <= 0:
+            values["remove"] = 1
+        updated = await storage.aupdate("barcodes", values, [
+            ("barcode", "eq", record["barcode"]),
+            ("quantity", "eq", int(record["quantity"])),
+            ("remove", "eq", int(record["remove"] or 0)),
+        ])
+        if updated:
+            deltas += [inventory_delta(record, -1), inventory_delta(updated[0], 1)]
+            repaired += updated
+        else:
+            skipped.append(mismatch["barcode"])
+
+    deltas = [delta for delta in deltas if delta and delta["quantity"]]
+    if deltas:
+        await storage.aapply_inventory_deltas(deltas)
+    return repaired, skipped
+
+
+# What a barcode row counts in its inventory group (None for a removed barcode)
+def inventory_delta(record, sign):
+    if int(record.get("remove") or 0) != 0:
+        return None
+    return {**{column: record.get(column) for column in INVENTORY_KEY}, "quantity": sign * int(record.get("quantity") or 0)}
+
+
+# Rows of a table whose barcode is one of barcodes, as a DataFrame. Each batch of barcodes
+# is paged in order of the table's unique key, as it may match more rows than one response holds.
+async def fetch_batches(storage, table, columns, key, barcodes, workers):
+    frames = [
+        await storage.afetch_all(
+            table,
+            columns=columns,
+            filters=[("barcode", "in_", barcodes[start:start + KEY_BATCH])],
+            order=[(key, False)],
+            workers=workers
+        )
+        for start in range(0, len(barcodes), KEY_BATCH)
+    ]
+    return pd.concat(frames, ignore_index=True) if frames else pages_frame([], columns)
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description="Check barcode quantities against the transaction log.",
+        epilog="Mismatches are repaired through the app: POST /reconcile with repair=1."
+    )
+    parser.add_argument("--full", action="store_true", help="check every barcode, not just those with new transactions")
+    args = parser.parse_args()
+
+    load_dotenv()
+    storage = create_storage(
+        os.getenv("STORAGE_BACKEND", "supabase"),
+        supabase_url=os.getenv("SUPABASE_URL"),
+        supabase_key=os.getenv("SUPABASE_KEY"),
+        sqlite_path=os.getenv("SQLITE_PATH", "quality_inventory.db")
+    )
+    report = asyncio.run(reconcile(storage, full=args.full, workers=int(os.getenv("FETCH_WORKERS", "4"))))
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    run()
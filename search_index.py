@@ -0,0 +1,189 @@
+import bisect
+import heapq
+import itertools
+import operator
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Fields searched per table, and how much a match in each counts towards a row's rank
+SEARCH_FIELDS = {
+    "barcodes": ["item_number", "description", "lot_number"],
+    "transactions": ["item_number", "description", "lot_number", "employee"],
+}
+FIELD_WEIGHTS = {"item_number": 4, "lot_number": 3, "description": 2, "employee": 1}
+KEY_COLUMNS = {"barcodes": "barcode", "transactions": "trans_id"}
+# trans_ids come from a sequence before the transaction commits, so a lower one can commit
+# after a higher one was indexed; catching up re-reads this many ids below the high-water mark
+LATE_COMMIT_IDS = 200
+
+
+# In-process trigram index for free-text search over barcodes and transactions.
+#
+# The searched columns repeat a lot (many rows share an item, lot or employee), so the
+# index is built over distinct lowercased values rather than rows:
+#   trigram -> ids of the values containing it
+#   (table, field, value id) -> sorted keys (barcode or trans_id) of the rows with that value
+# A query intersects the value sets of its trigrams, checks the survivors really contain
+# it, and ranks the rows of the matching values: an exact match beats a prefix match,
+# which beats a match inside the value, weighted by field (see FIELD_WEIGHTS). Ties go
+# to the highest key, so the newest transactions come first. Only the `limit` key lists
+# with the highest keys can hold a score's top rows, so just those are merged and a query
+# matching most rows stays cheap.
+#
+# Rows are added and replaced one at a time as they are written; `high_water` is the
+# highest trans_id indexed, for catching up on new transactions (see LATE_COMMIT_IDS).
+class SearchIndex:
+    def __init__(self):
+        self.ready = False
+        self.high_water = 0
+        self._value_ids = {}   # lowercased value -> value id
+        self._values = []      # value id -> lowercased value
+        self._grams = {}       # trigram -> set of value ids
+        self._postings = {}    # (table, field, value id) -> sorted list of row keys
+        self._rows = {}        # (table, key) -> value ids of the row's fields (-1 if empty)
+        self._lock = threading.Lock()
+
+    # Replace the index with the rows of a barcodes and a transactions DataFrame
+    def load(self, barcodes, transactions):
+        with self._lock:
+            self._value_ids, self._values, self._grams, self._postings, self._rows = {}, [], {}, {}, {}
+            for table, frame in (("barcodes", barcodes), ("transactions", transactions)):
+                self._load_frame(table, frame)
+            if not transactions.empty:
+                self.high_water = int(transactions["trans_id"].max())
+            self.ready = True
+
+    # Index (or re-index) rows after a write; `records` maps each key to its row (None if deleted)
+    def put(self, table, records):
+        with self._lock:
+            for key, record in records.items():
+                key = int(key)
+                self._drop(table, key)
+                if record is not None:
+                    self._add(table, key, record)
+                if table == "transactions" and record is not None:
+                    self.high_water = max(self.high_water, key)
+
+    # Ranked keys of the rows matching the query, up to `limit` per table
+    def search(self, query, limit=50):
+        query = " ".join(str(query).lower().split())
+        if not query:
+            return {table: [] for table in SEARCH_FIELDS}
+
+        with self._lock:
+            matches = self._matching_values(query)
+            # Group the posting lists of every matching (field, value) by the score they give
+            levels = {table: {} for table in SEARCH_FIELDS}
+            for value_id in matches:
+                value = self._values[value_id]
+                quality = 3 if value == query else 2 if value.startswith(query) else 1
+                for table, fields in SEARCH_FIELDS.items():
+                    for field in fields:
+                        keys = self._postings.get((table, field, value_id))
+                        if keys:
+                            levels[table].setdefault(quality * FIELD_WEIGHTS[field], []).append(keys)
+
+            # Fill each table's results from the best score down, highest keys first
+            results = {}
+            for table, by_score in levels.items():
+                ranked = []
+                seen = set()
+                for score in sorted(by_score, reverse=True):
+                    if len(ranked) >= limit:
+                        break
+                    lists = heapq.nlargest(limit, by_score[score], key=operator.itemgetter(-1))
+                    for key in heapq.merge(*[reversed(keys) for keys in lists], reverse=True):
+                        if len(ranked) >= limit:
+                            break
+                        if key not in seen:
+                            ranked.append((key, score))
+                            seen.add(key)
+                results[table] = ranked
+            return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "values": len(self._values),
+                "trigrams": len(self._grams),
+                "rows": len(self._rows),
+                "high_water": self.high_water,
+            }
+
+    # Ids of the distinct values containing the query
+    def _matching_values(self, query):
+        grams = trigrams(query)
+        if not grams:
+            # Too short for a trigram: check every distinct value
+            return [value_id for value_id, value in enumerate(self._values) if query in value]
+        sets = sorted((self._grams.get(gram, set()) for gram in grams), key=len)
+        candidates = set.intersection(*sets) if sets[0] else set()
+        return [value_id for value_id in candidates if query in self._values[value_id]]
+
+    def _value_id(self, value):
+        value_id = self._value_ids.get(value)
+        if value_id is None:
+            value_id = self._value_ids[value] = len(self._values)
+            self._values.append(value)
+            for gram in trigrams(value):
+                self._grams.setdefault(gram, set()).add(value_id)
+        return value_id
+
+    def _add(self, table, key, record):
+        value_ids = []
+        for field in SEARCH_FIELDS[table]:
+            value = normalize(record.get(field))
+            value_id = self._value_id(value) if value else -1
+            if value_id >= 0:
+                bisect.insort(self._postings.setdefault((table, field, value_id), []), key)
+            value_ids.append(value_id)
+        self._rows[(table, key)] = tuple(value_ids)
+
+    def _drop(self, table, key):
+        value_ids = self._rows.pop((table, key), None)
+        for field, value_id in zip(SEARCH_FIELDS[table], value_ids or ()):
+            keys = self._postings.get((table, field, value_id))
+            if keys:
+                i = bisect.bisect_left(keys, key)
+                if i < len(keys) and keys[i] == key:
+                    del keys[i]
+                if not keys:
+                    del self._postings[(table, field, value_id)]
+
+    # Bulk version of _add for a whole table, grouping row keys by value with numpy
+    def _load_frame(self, table, frame):
+        if frame.empty:
+            return
+        keys = pd.to_numeric(frame[KEY_COLUMNS[table]], errors="coerce")
+        frame = frame[keys.notna()]
+        keys = keys[keys.notna()].astype(np.int64).to_numpy()
+        columns = []
+        for field in SEARCH_FIELDS[table]:
+            # Normalize each distinct value once; the trailing -1 is what missing values (code -1) map to
+            codes, uniques = pd.factorize(frame[field])
+            value_ids = np.array([self._value_id(value) if value else -1 for value in map(normalize, uniques)] + [-1], dtype=np.int64)
+            row_value_ids = value_ids[codes]
+            columns.append(row_value_ids)
+
+            order = np.lexsort((keys, row_value_ids))
+            sorted_ids = row_value_ids[order]
+            bounds = np.flatnonzero(np.diff(sorted_ids)) + 1
+            for group_keys, group_ids in zip(np.split(keys[order], bounds), np.split(sorted_ids, bounds)):
+                if len(group_ids) and group_ids[0] >= 0:
+                    self._postings[(table, field, int(group_ids[0]))] = group_keys.tolist()
+
+        self._rows.update(zip(zip(itertools.repeat(table), keys.tolist()), zip(*[column.tolist() for column in columns])))
+
+
+# Lowercased, whitespace-collapsed text of a field value ("" for missing values)
+def normalize(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    return " ".join(str(value).lower().split())
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
@@ -0,0 +1,1230 @@
+import asyncio
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# Storage backends for the app.
+#
+# Every database operation the routes use goes through a Storage object:
+#   select(table, columns, filters, order, limit, offset)  -> list of row dicts
+#   fetch_all(table, columns, filters, order)              -> DataFrame of every row
+#   insert(table, rows) / update(table, values, filters) / delete(table, filters)
+#   upsert(table, rows, on_conflict)                       -> the rows written
+#   apply_inventory_deltas(deltas) / rebuild_inventory()   -> the inventory aggregate
+#   apply_rollup_deltas(deltas) / rebuild_rollups()        -> the daily transaction rollups
+#   add_barcode(transaction, barcode)                      -> {"status", "barcode"}
+#   remove_barcode(barcode, quantity, employee, trans_date) -> {"status", "barcode"}
+#   add_barcodes(items) / remove_barcodes(items, employee, trans_date) -> one of those per item
+#   update_barcode(barcode, values)                        -> {"status", "barcode"}
+#   data_version()                                         -> counter bumped by every write
+#
+# Filters are (column, operator, value) tuples with the PostgREST operator names
+# eq, ilike, gt, gte, lt, lte and in_, plus is_ and not_is_ (value None) for IS NULL and
+# IS NOT NULL. An (None, "or_", groups) filter matches when any of its AND-groups of
+# (column, operator, value) tuples matches.
+# Order is a list of (column, descending) tuples; a third element, nulls_first, places
+# NULLs explicitly (otherwise each backend uses its default).
+#
+# Each operation also has an async counterpart with an "a" prefix (aselect, ainsert, ...)
+# for the async route handlers.
+
+INVENTORY_KEY = ["item_number", "lot_number", "exp_date", "typ"]
+# Columns of the transaction_daily rollups: every transaction is counted once under each
+# dimension, with the value it has for it ("" for the total)
+ROLLUP_DIMENSIONS = ["total", "typ", "item_number", "employee"]
+
+
+# Current inventory is kept as an aggregate of active barcodes keyed on
+# (item_number, lot_number, exp_date, typ). Write routes adjust it by delta
+# through inventory_apply_deltas; it is rebuilt from barcodes once at startup.
+SUPABASE_SETUP_SQL = [
+    # Replaced by inventory_totals (it was dropped and recreated on every page view)
+    "DROP TABLE IF EXISTS public.inventory",
+    """
+        CREATE TABLE IF NOT EXISTS public.inventory_totals (
+            item_number TEXT,
+            lot_number TEXT,
+            exp_date DATE,
+            typ TEXT,
+            quantity INT NOT NULL DEFAULT 0,
+            UNIQUE NULLS NOT DISTINCT (item_number, lot_number, exp_date, typ)
+        )
+    """,
+    """
+        CREATE OR REPLACE FUNCTION public.inventory_apply_deltas(deltas JSONB)
+        RETURNS VOID
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            emptied TID[];
+        BEGIN
+            WITH applied AS (
+                INSERT INTO public.inventory_totals AS t (item_number, lot_number, exp_date, typ, quantity)
+                SELECT d.item_number, d.lot_number, d.exp_date, d.typ, SUM(d.quantity)
+                FROM jsonb_to_recordset(deltas) AS d(item_number TEXT, lot_number TEXT, exp_date DATE, typ TEXT, quantity INT)
+                GROUP BY d.item_number, d.lot_number, d.exp_date, d.typ
+                ON CONFLICT (item_number, lot_number, exp_date, typ)
+                DO UPDATE SET quantity = t.quantity + EXCLUDED.quantity
+                RETURNING t.ctid, t.quantity
+            )
+            SELECT array_agg(ctid) INTO emptied FROM applied WHERE quantity <= 0;
+
+            -- Only the rows these deltas left empty. The upsert holds their row locks until
+            -- commit, so they are still where it left them.
+            DELETE FROM public.inventory_totals WHERE ctid = ANY(emptied);
+        END;
+        $$
+    """,
+    """
+        CREATE OR REPLACE FUNCTION public.inventory_rebuild()
+        RETURNS VOID
+        LANGUAGE sql
+        AS $$
+            LOCK TABLE public.inventory_totals IN SHARE ROW EXCLUSIVE MODE;
+            DELETE FROM public.inventory_totals;
+            INSERT INTO public.inventory_totals (item_number, lot_number, exp_date, typ, quantity)
+            SELECT item_number, lot_number, exp_date, typ, SUM(quantity)
+            FROM public.barcodes
+            WHERE remove = 0
+            GROUP BY item_number, lot_number, exp_date, typ;
+        $$
+    """,
+    # Remove part or all of a barcode in one statement: the conditional decrement, the
+    # remove flag, the transaction log and the inventory and rollup deltas commit together,
+    # so two stations scanning the same barcode cannot both take the same quantity.
+    """
+        CREATE OR REPLACE FUNCTION public.remove_barcode(
+            p_barcode public.barcodes.barcode%TYPE,
+            p_quantity INT,
+            p_employee TEXT,
+            p_trans_date public.transactions.trans_date%TYPE
+        )
+        RETURNS JSONB
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            updated public.barcodes;
+            existing public.barcodes;
+        BEGIN
+            UPDATE public.barcodes
+            SET quantity = quantity - p_quantity,
+                remove = CASE WHEN quantity = p_quantity THEN 1 ELSE remove END
+            WHERE barcode = p_barcode AND remove = 0 AND p_quantity > 0 AND quantity >= p_quantity
+            RETURNING * INTO updated;
+
+            IF NOT FOUND THEN
+                SELECT * INTO existing FROM public.barcodes WHERE barcode = p_barcode;
+                RETURN jsonb_build_object(
+                    'status', CASE WHEN NOT FOUND THEN 'not_found' WHEN existing.remove <> 0 THEN 'removed' ELSE 'insufficient' END,
+                    'barcode', CASE WHEN FOUND THEN to_jsonb(existing) END
+                );
+            END IF;
+
+            INSERT INTO public.transactions (barcode, item_number, description, lot_number, exp_date, typ, add_remove, quantity, trans_date, employee)
+            VALUES (updated.barcode, updated.item_number, updated.description, updated.lot_number, updated.exp_date, updated.typ, 'Remove', p_quantity, p_trans_date, p_employee);
+
+            PERFORM public.rollup_apply_deltas(jsonb_build_array(jsonb_build_object(
+                'trans_date', p_trans_date,
+                'typ', updated.typ,
+                'item_number', updated.item_number,
+                'employee', p_employee,
+                'add_remove', 'Remove',
+                'transactions', 1,
+                'quantity', p_quantity
+            )));
+
+            PERFORM public.inventory_apply_deltas(jsonb_build_array(jsonb_build_object(
+                'item_number', updated.item_number,
+                'lot_number', updated.lot_number,
+                'exp_date', updated.exp_date,
+                'typ', updated.typ,
+                'quantity', -p_quantity
+            )));
+
+            RETURN jsonb_build_object('status', 'ok', 'barcode', to_jsonb(updated));
+        END;
+        $$
+    """,
+    # Add a new barcode with its Add transaction in one statement. A duplicate barcode is
+    # detected by the primary key conflict itself, so there is no check-then-insert race.
+    """
+        CREATE OR REPLACE FUNCTION public.add_barcode(p_transaction JSONB, p_barcode JSONB)
+        RETURNS JSONB
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            new_row public.barcodes := jsonb_populate_record(NULL::public.barcodes, p_barcode);
+            inserted public.barcodes;
+            logged public.transactions;
+        BEGIN
+            INSERT INTO public.barcodes (barcode, item_number, description, lot_number, exp_date, typ, quantity)
+            VALUES (new_row.barcode, new_row.item_number, new_row.description, new_row.lot_number, new_row.exp_date, new_row.typ, new_row.quantity)
+            ON CONFLICT (barcode) DO NOTHING
+            RETURNING * INTO inserted;
+
+            IF NOT FOUND THEN
+                RETURN jsonb_build_object(
+                    'status', 'exists',
+                    'barcode', (SELECT to_jsonb(b) FROM public.barcodes b WHERE b.barcode = new_row.barcode)
+                );
+            END IF;
+
+            INSERT INTO public.transactions (barcode, item_number, description, lot_number, exp_date, typ, add_remove, quantity, trans_date, employee)
+            SELECT barcode, item_number, description, lot_number, exp_date, typ, add_remove, quantity, trans_date, employee
+            FROM jsonb_populate_record(NULL::public.transactions, p_transaction)
+            RETURNING * INTO logged;
+
+            PERFORM public.rollup_apply_deltas(jsonb_build_array(jsonb_build_object(
+                'trans_date', logged.trans_date,
+                'typ', logged.typ,
+                'item_number', logged.item_number,
+                'employee', logged.employee,
+                'add_remove', logged.add_remove,
+                'transactions', 1,
+                'quantity', logged.quantity
+            )));
+
+            PERFORM public.inventory_apply_deltas(jsonb_build_array(jsonb_build_object(
+                'item_number', inserted.item_number,
+                'lot_number', inserted.lot_number,
+                'exp_date', inserted.exp_date,
+                'typ', inserted.typ,
+                'quantity', inserted.quantity
+            )));
+
+            RETURN jsonb_build_object('status', 'ok', 'barcode', to_jsonb(inserted));
+        END;
+        $$
+    """,
+    # Edit a barcode row and move its old and new quantities in inventory_totals in one
+    # statement. The deltas come from the row as locked by the update, so a concurrent
+    # remove or a stale copy of the row cannot make them wrong.
+    """
+        CREATE OR REPLACE FUNCTION public.update_barcode(p_barcode public.barcodes.barcode%TYPE, p_values JSONB)
+        RETURNS JSONB
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            old public.barcodes;
+            new_row public.barcodes;
+            updated public.barcodes;
+        BEGIN
+            SELECT * INTO old FROM public.barcodes WHERE barcode = p_barcode FOR UPDATE;
+            IF NOT FOUND THEN
+                RETURN jsonb_build_object('status', 'not_found', 'barcode', NULL);
+            END IF;
+
+            new_row := jsonb_populate_record(old, p_values);
+            UPDATE public.barcodes
+            SET item_number = new_row.item_number,
+                description = new_row.description,
+                lot_number = new_row.lot_number,
+                exp_date = new_row.exp_date,
+                typ = new_row.typ,
+                quantity = new_row.quantity,
+                remove = new_row.remove
+            WHERE barcode = p_barcode
+            RETURNING * INTO updated;
+
+            PERFORM public.inventory_apply_deltas((
+                SELECT coalesce(jsonb_agg(d.delta), '[]'::jsonb)
+                FROM (VALUES
+                    (CASE WHEN old.remove = 0 THEN jsonb_build_object(
+                        'item_number', old.item_number, 'lot_number', old.lot_number,
+                        'exp_date', old.exp_date, 'typ', old.typ, 'quantity', -old.quantity
+                    ) END),
+                    (CASE WHEN updated.remove = 0 THEN jsonb_build_object(
+                        'item_number', updated.item_number, 'lot_number', updated.lot_number,
+                        'exp_date', updated.exp_date, 'typ', updated.typ, 'quantity', updated.quantity
+                    ) END)
+                ) AS d(delta)
+                WHERE d.delta IS NOT NULL
+            ));
+
+            RETURN jsonb_build_object('status', 'ok', 'barcode', to_jsonb(updated));
+        END;
+        $$
+    """,
+    # Batches of add_barcode and remove_barcode calls in one transaction. Every item gets
+    # its result; when any of them is not "ok" the block's writes are rolled back (local
+    # variables keep their values), so a batch is written in full or not at all.
+    """
+        CREATE OR REPLACE FUNCTION public.add_barcodes(p_items JSONB)
+        RETURNS JSONB
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            item JSONB;
+            results JSONB := '[]'::jsonb;
+        BEGIN
+            BEGIN
+                FOR item IN SELECT value FROM jsonb_array_elements(p_items) LOOP
+                    results := results || jsonb_build_array(public.add_barcode(item -> 'transaction', item -> 'barcode'));
+                END LOOP;
+                IF jsonb_path_exists(results, '$[*] ? (@.status != "ok")') THEN
+                    RAISE EXCEPTION USING ERRCODE = 'QI001';
+                END IF;
+            EXCEPTION WHEN SQLSTATE 'QI001' THEN
+                NULL;
+            END;
+            RETURN results;
+        END;
+        $$
+    """,
+    """
+        CREATE OR REPLACE FUNCTION public.remove_barcodes(
+            p_items JSONB,
+            p_employee TEXT,
+            p_trans_date public.transactions.trans_date%TYPE
+        )
+        RETURNS JSONB
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            item JSONB;
+            item_barcode public.barcodes.barcode%TYPE;
+            results JSONB := '[]'::jsonb;
+        BEGIN
+            BEGIN
+                FOR item IN SELECT value FROM jsonb_array_elements(p_items) LOOP
+                    item_barcode := item ->> 'barcode';
+                    results := results || jsonb_build_array(public.remove_barcode(
+                        item_barcode, (item ->> 'quantity')::INT, p_employee, p_trans_date
+                    ));
+                END LOOP;
+                IF jsonb_path_exists(results, '$[*] ? (@.status != "ok")') THEN
+                    RAISE EXCEPTION USING ERRCODE = 'QI001';
+                END IF;
+            EXCEPTION WHEN SQLSTATE 'QI001' THEN
+                NULL;
+            END;
+            RETURN results;
+        END;
+        $$
+    """,
+    # Daily transaction counts and quantities, rolled up per (day, dimension, value,
+    # add_remove) for each dimension in ROLLUP_DIMENSIONS. Write routes adjust it by delta
+    # through rollup_apply_deltas, with one delta per transaction written or taken back;
+    # it is rebuilt from transactions once at startup.
+    """
+        CREATE TABLE IF NOT EXISTS public.transaction_daily (
+            day DATE NOT NULL,
+            dimension TEXT NOT NULL,
+            value TEXT,
+            add_remove TEXT,
+            transactions INT NOT NULL DEFAULT 0,
+            quantity INT NOT NULL DEFAULT 0,
+            UNIQUE NULLS NOT DISTINCT (dimension, day, value, add_remove)
+        )
+    """,
+    "CREATE INDEX IF NOT EXISTS transaction_daily_value ON public.transaction_daily (dimension, value, day)",
+    """
+        CREATE OR REPLACE FUNCTION public.rollup_apply_deltas(deltas JSONB)
+        RETURNS VOID
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            emptied TID[];
+        BEGIN
+            WITH applied AS (
+                INSERT INTO public.transaction_daily AS t (day, dimension, value, add_remove, transactions, quantity)
+                SELECT d.trans_date::date, v.dimension, v.value, d.add_remove, SUM(d.transactions), SUM(d.quantity)
+                FROM jsonb_to_recordset(deltas) AS d(trans_date TIMESTAMP, typ TEXT, item_number TEXT, employee TEXT, add_remove TEXT, transactions INT, quantity INT)
+                CROSS JOIN LATERAL (VALUES ('total', ''), ('typ', d.typ), ('item_number', d.item_number), ('employee', d.employee)) AS v(dimension, value)
+                GROUP BY 1, 2, 3, 4
+                ON CONFLICT (dimension, day, value, add_remove)
+                DO UPDATE SET transactions = t.transactions + EXCLUDED.transactions, quantity = t.quantity + EXCLUDED.quantity
+                RETURNING t.ctid, t.transactions
+            )
+            SELECT array_agg(ctid) INTO emptied FROM applied WHERE transactions <= 0;
+
+            -- Only the rows these deltas left empty, as in inventory_apply_deltas
+            DELETE FROM public.transaction_daily WHERE ctid = ANY(emptied);
+        END;
+        $$
+    """,
+    """
+        CREATE OR REPLACE FUNCTION public.rollup_rebuild()
+        RETURNS VOID
+        LANGUAGE sql
+        AS $$
+            LOCK TABLE public.transaction_daily IN SHARE ROW EXCLUSIVE MODE;
+            DELETE FROM public.transaction_daily;
+            INSERT INTO public.transaction_daily (day, dimension, value, add_remove, transactions, quantity)
+            SELECT t.trans_date::date, v.dimension, v.value, t.add_remove, COUNT(*), SUM(t.quantity)
+            FROM public.transactions t
+            CROSS JOIN LATERAL (VALUES ('total', ''), ('typ', t.typ), ('item_number', t.item_number), ('employee', t.employee)) AS v(dimension, value)
+            GROUP BY 1, 2, 3, 4;
+        $$
+    """,
+    # Monthly checkpoints of the inventory for point-in-time queries (see inventory_history.py):
+    # the rows are the inventory just before `day`, and the header row makes them visible
+    """
+        CREATE TABLE IF NOT EXISTS public.inventory_checkpoints (
+            day DATE PRIMARY KEY,
+            created_at TIMESTAMP
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS public.inventory_checkpoint_rows (
+            day DATE NOT NULL,
+            item_number TEXT,
+            lot_number TEXT,
+            exp_date DATE,
+            typ TEXT,
+            quantity INT NOT NULL
+        )
+    """,
+    "CREATE INDEX IF NOT EXISTS inventory_checkpoint_rows_day ON public.inventory_checkpoint_rows (day, item_number, lot_number, exp_date, typ)",
+    # Reconciliation of barcode quantities against the log (see reconcile.py): the highest
+    # trans_id checked, and barcodes whose transactions were edited since
+    """
+        CREATE TABLE IF NOT EXISTS public.reconcile_state (
+            name TEXT PRIMARY KEY,
+            high_water BIGINT NOT NULL,
+            checked_at TIMESTAMP
+        )
+    """,
+    "CREATE TABLE IF NOT EXISTS public.reconcile_pending (barcode TEXT PRIMARY KEY)",
+    # A counter bumped in the same transaction as every write to barcodes or transactions,
+    # whichever process or tool makes it, for validating cached views (see data_version())
+    """
+        CREATE TABLE IF NOT EXISTS public.data_version (
+            name TEXT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )
+    """,
+    "INSERT INTO public.data_version (name, version) VALUES ('data', 0) ON CONFLICT (name) DO NOTHING",
+    """
+        CREATE OR REPLACE FUNCTION public.data_version_bump()
+        RETURNS TRIGGER
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            UPDATE public.data_version SET version = version + 1 WHERE name = 'data';
+            RETURN NULL;
+        END;
+        $$
+    """,
+    """
+        CREATE OR REPLACE TRIGGER barcodes_data_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.barcodes
+        FOR EACH STATEMENT EXECUTE FUNCTION public.data_version_bump()
+    """,
+    """
+        CREATE OR REPLACE TRIGGER transactions_data_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.transactions
+        FOR EACH STATEMENT EXECUTE FUNCTION public.data_version_bump()
+    """,
+    "CREATE INDEX IF NOT EXISTS transactions_barcode ON public.transactions (barcode)",
+]
+
+
+class Storage:
+    def setup(self):
+        raise NotImplementedError
+
+    def select(self, table, columns="*", filters=(), order=(), limit=None, offset=0):
+        raise NotImplementedError
+
+    # Read every row of a query into a DataFrame. A single select is capped by the
+    # server's max-rows setting (PostgREST), so this reads limit/offset ranges of
+    # page_size rows instead, `workers` at a time on a thread pool, until a short page
+    # marks the end. `order` must end in a unique column (or columns) so the ranges
+    # neither overlap nor skip rows.
+    def fetch_all(self, table, columns="*", filters=(), order=(), page_size=1000, workers=4):
+        pages = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            start = 0
+            while True:
+                window = [
+                    pool.submit(self.select, table, columns, filters, order, page_size, start + i * page_size)
+                    for i in range(workers)
+                ]
+                window = [future.result() for future in window]
+                pages += window
+                if any(len(page) < page_size for page in window):
+                    break
+                start += workers * page_size
+
+        return pages_frame(pages, columns)
+
+    def insert(self, table, rows):
+        raise NotImplementedError
+
+    def update(self, table, values, filters):
+        raise NotImplementedError
+
+    def delete(self, table, filters):
+        raise NotImplementedError
+
+    # Insert rows, or update every given column of the rows whose on_conflict column matches
+    def upsert(self, table, rows, on_conflict):
+        raise NotImplementedError
+
+    def apply_inventory_deltas(self, deltas):
+        raise NotImplementedError
+
+    def rebuild_inventory(self):
+        raise NotImplementedError
+
+    # Adjust the daily rollups by transaction deltas: {"trans_date", "typ", "item_number",
+    # "employee", "add_remove", "transactions", "quantity"}, with transactions 1 for a
+    # transaction written and -1 for one taken back
+    def apply_rollup_deltas(self, deltas):
+        raise NotImplementedError
+
+    def rebuild_rollups(self):
+        raise NotImplementedError
+
+    # Atomically insert a new barcode row and its Add transaction and adjust inventory and rollups.
+    # Returns {"status", "barcode"}: "ok" with the new row, or "exists" with the row that
+    # already has this barcode.
+    def add_barcode(self, transaction, barcode):
+        raise NotImplementedError
+
+    # Atomically take quantity from an active barcode, flag it removed when it reaches zero,
+    # log the Remove transaction and adjust inventory and rollups. Returns {"status", "barcode"}, where
+    # status is "ok", "not_found", "removed" or "insufficient" and barcode is the row after
+    # the call (None if it does not exist).
+    def remove_barcode(self, barcode, quantity, employee, trans_date):
+        raise NotImplementedError
+
+    # add_barcode for each of items ({"transaction", "barcode"}) in one transaction, which
+    # is committed only if every result is "ok". Returns the results in the order of items.
+    def add_barcodes(self, items):
+        raise NotImplementedError
+
+    # remove_barcode for each of items ({"barcode", "quantity"}) in one transaction, which
+    # is committed only if every result is "ok". Returns the results in the order of items.
+    def remove_barcodes(self, items, employee, trans_date):
+        raise NotImplementedError
+
+    # Atomically set the given columns of a barcode row and move its quantity in inventory
+    # from the old row to the new one. Returns {"status", "barcode"}: "ok" with the row after
+    # the update, or "not_found".
+    def update_barcode(self, barcode, values):
+        raise NotImplementedError
+
+    # A counter that triggers on barcodes and transactions bump in the same transaction as
+    # every write to them, from any process, so a view read after it is at least that new
+    def data_version(self):
+        rows = self.select("data_version", columns="version", filters=[("name", "eq", "data")])
+        return int(rows[0]["version"]) if rows else 0
+
+    # Async counterparts. By default they run the blocking call on a worker thread;
+    # backends with an async client override them.
+    async def aselect(self, table, columns="*", filters=(), order=(), limit=None, offset=0):
+        return await asyncio.to_thread(self.select, table, columns, filters, order, limit, offset)
+
+    # Same ranges as fetch_all, with each window of pages requested concurrently
+    async def afetch_all(self, table, columns="*", filters=(), order=(), page_size=1000, workers=4):
+        pages = []
+        start = 0
+        while True:
+            window = await asyncio.gather(*[
+                self.aselect(table, columns, filters, order, page_size, start + i * page_size)
+                for i in range(workers)
+            ])
+            pages += window
+            if any(len(page) < page_size for page in window):
+                break
+            start += workers * page_size
+        return pages_frame(pages, columns)
+
+    async def ainsert(self, table, rows):
+        return await asyncio.to_thread(self.insert, table, rows)
+
+    async def aupdate(self, table, values, filters):
+        return await asyncio.to_thread(self.update, table, values, filters)
+
+    async def adelete(self, table, filters):
+        return await asyncio.to_thread(self.delete, table, filters)
+
+    async def aupsert(self, table, rows, on_conflict):
+        return await asyncio.to_thread(self.upsert, table, rows, on_conflict)
+
+    async def aapply_inventory_deltas(self, deltas):
+        return await asyncio.to_thread(self.apply_inventory_deltas, deltas)
+
+    async def aapply_rollup_deltas(self, deltas):
+        return await asyncio.to_thread(self.apply_rollup_deltas, deltas)
+
+    async def aadd_barcode(self, transaction, barcode):
+        return await asyncio.to_thread(self.add_barcode, transaction, barcode)
+
+    async def aremove_barcode(self, barcode, quantity, employee, trans_date):
+        return await asyncio.to_thread(self.remove_barcode, barcode, quantity, employee, trans_date)
+
+    async def aadd_barcodes(self, items):
+        return await asyncio.to_thread(self.add_barcodes, items)
+
+    async def aremove_barcodes(self, items, employee, trans_date):
+        return await asyncio.to_thread(self.remove_barcodes, items, employee, trans_date)
+
+    async def aupdate_barcode(self, barcode, values):
+        return await asyncio.to_thread(self.update_barcode, barcode, values)
+
+    async def adata_version(self):
+        rows = await self.aselect("data_version", columns="version", filters=[("name", "eq", "data")])
+        return int(rows[0]["version"]) if rows else 0
+
+
+# Rows from a list of pages as a DataFrame, with the selected columns even when empty
+def pages_frame(pages, columns):
+    names = None if columns.strip() == "*" else [column.strip() for column in columns.split(",")]
+    return pd.DataFrame([row for page in pages for row in page], columns=names)
+
+
+# Supabase (PostgREST) backend. Sync calls use the blocking client and async calls the
+# async client, which is created on first use inside the event loop.
+class SupabaseStorage(Storage):
+    def __init__(self, url, key):
+        from supabase import create_client
+        self.url = url
+        self.key = key
+        self.client = create_client(url, key)
+        self._async_client = None
+
+    # Create the inventory aggregate and rollups if needed and resync them
+    def setup(self):
+        for sql in SUPABASE_SETUP_SQL:
+            self.exec_sql(sql)
+        self.rebuild_inventory()
+        self.rebuild_rollups()
+
+        # Let PostgREST pick up the new table and functions
+        self.exec_sql("NOTIFY pgrst, 'reload schema'")
+
+    def exec_sql(self, sql):
+        self.client.rpc("exec_sql", {"sql": sql}).execute()
+
+    def select(self, table, columns="*", filters=(), order=(), limit=None, offset=0):
+        query = apply_filters(self.client.table(table).select(columns), filters)
+        for column, desc, nulls_first in order_terms(order):
+            query = query.order(column, desc=desc, nullsfirst=nulls_first)
+        if limit is not None:
+            query = query.range(offset, offset + limit - 1)
+        return query.execute().data
+
+    def insert(self, table, rows):
+        return self.client.table(table).insert(rows).execute().data
+
+    def update(self, table, values, filters):
+        return apply_filters(self.client.table(table).update(values), filters).execute().data
+
+    def delete(self, table, filters):
+        return apply_filters(self.client.table(table).delete(), filters).execute().data
+
+    def upsert(self, table, rows, on_conflict):
+        return self.client.table(table).upsert(rows, on_conflict=on_conflict).execute().data
+
+    def apply_inventory_deltas(self, deltas):
+        self.client.rpc("inventory_apply_deltas", {"deltas": deltas}).execute()
+
+    # Runs through exec_sql so it does not wait on PostgREST's schema cache at startup
+    def rebuild_inventory(self):
+        self.exec_sql("SELECT public.inventory_rebuild()")
+
+    def apply_rollup_deltas(self, deltas):
+        self.client.rpc("rollup_apply_deltas", {"deltas": deltas}).execute()
+
+    def rebuild_rollups(self):
+        self.exec_sql("SELECT public.rollup_rebuild()")
+
+    def add_barcode(self, transaction, barcode):
+        return self.client.rpc("add_barcode", {"p_transaction": transaction, "p_barcode": barcode}).execute().data
+
+    def remove_barcode(self, barcode, quantity, employee, trans_date):
+        return self.client.rpc("remove_barcode", {
+            "p_barcode": barcode,
+            "p_quantity": quantity,
+            "p_employee": employee,
+            "p_trans_date": trans_date,
+        }).execute().data
+
+    def add_barcodes(self, items):
+        return self.client.rpc("add_barcodes", {"p_items": items}).execute().data
+
+    def remove_barcodes(self, items, employee, trans_date):
+        return self.client.rpc("remove_barcodes", {
+            "p_items": items,
+            "p_employee": employee,
+            "p_trans_date": trans_date,
+        }).execute().data
+
+    def update_barcode(self, barcode, values):
+        return self.client.rpc("update_barcode", {"p_barcode": barcode, "p_values": values}).execute().data
+
+    async def async_client(self):
+        if self._async_client is None:
+            from supabase import acreate_client
+            self._async_client = await acreate_client(self.url, self.key)
+        return self._async_client
+
+    async def aselect(self, table, columns="*", filters=(), order=(), limit=None, offset=0):
+        client = await self.async_client()
+        query = apply_filters(client.table(table).select(columns), filters)
+        for column, desc, nulls_first in order_terms(order):
+            query = query.order(column, desc=desc, nullsfirst=nulls_first)
+        if limit is not None:
+            query = query.range(offset, offset + limit - 1)
+        return (await query.execute()).data
+
+    async def ainsert(self, table, rows):
+        client = await self.async_client()
+        return (await client.table(table).insert(rows).execute()).data
+
+    async def aupdate(self, table, values, filters):
+        client = await self.async_client()
+        return (await apply_filters(client.table(table).update(values), filters).execute()).data
+
+    async def adelete(self, table, filters):
+        client = await self.async_client()
+        return (await apply_filters(client.table(table).delete(), filters).execute()).data
+
+    async def aupsert(self, table, rows, on_conflict):
+        client = await self.async_client()
+        return (await client.table(table).upsert(rows, on_conflict=on_conflict).execute()).data
+
+    async def aapply_inventory_deltas(self, deltas):
+        client = await self.async_client()
+        await client.rpc("inventory_apply_deltas", {"deltas": deltas}).execute()
+
+    async def aapply_rollup_deltas(self, deltas):
+        client = await self.async_client()
+        await client.rpc("rollup_apply_deltas", {"deltas": deltas}).execute()
+
+    async def aadd_barcode(self, transaction, barcode):
+        client = await self.async_client()
+        return (await client.rpc("add_barcode", {"p_transaction": transaction, "p_barcode": barcode}).execute()).data
+
+    async def aremove_barcode(self, barcode, quantity, employee, trans_date):
+        client = await self.async_client()
+        return (await client.rpc("remove_barcode", {
+            "p_barcode": barcode,
+            "p_quantity": quantity,
+            "p_employee": employee,
+            "p_trans_date": trans_date,
+        }).execute()).data
+
+    async def aadd_barcodes(self, items):
+        client = await self.async_client()
+        return (await client.rpc("add_barcodes", {"p_items": items}).execute()).data
+
+    async def aremove_barcodes(self, items, employee, trans_date):
+        client = await self.async_client()
+        return (await client.rpc("remove_barcodes", {
+            "p_items": items,
+            "p_employee": employee,
+            "p_trans_date": trans_date,
+        }).execute()).data
+
+    async def aupdate_barcode(self, barcode, values):
+        client = await self.async_client()
+        return (await client.rpc("update_barcode", {"p_barcode": barcode, "p_values": values}).execute()).data
+
+
+# Quote a value for use inside a PostgREST or=(...) filter
+def postgrest_value(value):
+    value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{value}"'
+
+
+# Apply filters to a PostgREST query as server-side predicates
+def apply_filters(query, filters):
+    for column, op, value in filters:
+        if op == "or_":
+            groups = []
+            for group in value:
+                conditions = ",".join(postgrest_condition(c, o, v) for c, o, v in group)
+                groups.append(f"and({conditions})" if len(group) > 1 else conditions)
+            query = query.or_(",".join(groups))
+        elif op == "is_":
+            query = query.is_(column, "null")
+        elif op == "not_is_":
+            query = query.not_.is_(column, "null")
+        else:
+            query = getattr(query, op)(column, value)
+    return query
+
+
+# One condition of a PostgREST or=(...) filter
+def postgrest_condition(column, op, value):
+    if op == "is_":
+        return f"{column}.is.null"
+    if op == "not_is_":
+        return f"{column}.not.is.null"
+    return f"{column}.{op}.{postgrest_value(value)}"
+
+
+# (column, descending, nulls_first) for each order tuple, with nulls_first None when unset
+def order_terms(order):
+    return [(column, desc, rest[0] if rest else None) for column, desc, *rest in order]
+
+
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS transactions (
+        trans_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        barcode TEXT,
+        item_number TEXT,
+        description TEXT,
+        lot_number TEXT,
+        exp_date TEXT,
+        typ TEXT,
+        add_remove TEXT,
+        quantity INTEGER,
+        trans_date TEXT,
+        employee TEXT
+    );
+    CREATE INDEX IF NOT EXISTS transactions_barcode ON transactions (barcode);
+    CREATE INDEX IF NOT EXISTS transactions_trans_date ON transactions (trans_date);
+    CREATE INDEX IF NOT EXISTS transactions_exp_date ON transactions (exp_date);
+
+    CREATE TABLE IF NOT EXISTS barcodes (
+        barcode TEXT PRIMARY KEY,
+        item_number TEXT,
+        description TEXT,
+        lot_number TEXT,
+        exp_date TEXT,
+        typ TEXT,
+        quantity INTEGER,
+        remove INTEGER NOT NULL DEFAULT 0
+    );
+    -- One index per sortable /barcodes column, with barcode as the keyset tiebreaker
+    CREATE INDEX IF NOT EXISTS barcodes_item_number ON barcodes (item_number, barcode);
+    CREATE INDEX IF NOT EXISTS barcodes_description ON barcodes (description, barcode);
+    CREATE INDEX IF NOT EXISTS barcodes_lot_number ON barcodes (lot_number, barcode);
+    CREATE INDEX IF NOT EXISTS barcodes_exp_date ON barcodes (exp_date, barcode);
+    CREATE INDEX IF NOT EXISTS barcodes_typ ON barcodes (typ, barcode);
+    CREATE INDEX IF NOT EXISTS barcodes_quantity ON barcodes (quantity, barcode);
+    CREATE INDEX IF NOT EXISTS barcodes_remove ON barcodes (remove, barcode);
+
+    CREATE TABLE IF NOT EXISTS inventory_totals (
+        item_number TEXT NOT NULL DEFAULT '',
+        lot_number TEXT NOT NULL DEFAULT '',
+        exp_date TEXT NOT NULL DEFAULT '',
+        typ TEXT NOT NULL DEFAULT '',
+        quantity INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (item_number, lot_number, exp_date, typ)
+    );
+
+    CREATE TABLE IF NOT EXISTS transaction_daily (
+        day TEXT NOT NULL,
+        dimension TEXT NOT NULL,
+        value TEXT NOT NULL DEFAULT '',
+        add_remove TEXT NOT NULL DEFAULT '',
+        transactions INTEGER NOT NULL DEFAULT 0,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, day, value, add_remove)
+    );
+    CREATE INDEX IF NOT EXISTS transaction_daily_value ON transaction_daily (dimension, value, day);
+
+    CREATE TABLE IF NOT EXISTS inventory_checkpoints (
+        day TEXT PRIMARY KEY,
+        created_at TEXT
+    );
+    CREATE TABLE IF NOT EXISTS inventory_checkpoint_rows (
+        day TEXT NOT NULL,
+        item_number TEXT,
+        lot_number TEXT,
+        exp_date TEXT,
+        typ TEXT,
+        quantity INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS inventory_checkpoint_rows_day ON inventory_checkpoint_rows (day, item_number, lot_number, exp_date, typ);
+
+    CREATE TABLE IF NOT EXISTS reconcile_state (
+        name TEXT PRIMARY KEY,
+        high_water INTEGER NOT NULL,
+        checked_at TEXT
+    );
+    CREATE TABLE IF NOT EXISTS reconcile_pending (
+        barcode TEXT PRIMARY KEY
+    );
+
+    CREATE TABLE IF NOT EXISTS data_version (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    );
+    INSERT OR IGNORE INTO data_version (name, version) VALUES ('data', 0);
+    CREATE TRIGGER IF NOT EXISTS barcodes_insert_data_version AFTER INSERT ON barcodes
+    BEGIN
+        UPDATE data_version SET version = version + 1 WHERE name = 'data';
+    END;
+    CREATE TRIGGER IF NOT EXISTS barcodes_update_data_version AFTER UPDATE ON barcodes
+    BEGIN
+        UPDATE data_version SET version = version + 1 WHERE name = 'data';
+    END;
+    CREATE TRIGGER IF NOT EXISTS barcodes_delete_data_version AFTER DELETE ON barcodes
+    BEGIN
+        UPDATE data_version SET version = version + 1 WHERE name = 'data';
+    END;
+    CREATE TRIGGER IF NOT EXISTS transactions_insert_data_version AFTER INSERT ON transactions
+    BEGIN
+        UPDATE data_version SET version = version + 1 WHERE name = 'data';
+    END;
+    CREATE TRIGGER IF NOT EXISTS transactions_update_data_version AFTER UPDATE ON transactions
+    BEGIN
+        UPDATE data_version SET version = version + 1 WHERE name = 'data';
+    END;
+    CREATE TRIGGER IF NOT EXISTS transactions_delete_data_version AFTER DELETE ON transactions
+    BEGIN
+        UPDATE data_version SET version = version + 1 WHERE name = 'data';
+    END;
+"""
+
+SQLITE_OPERATORS = {"eq": "=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+IDENTIFIER = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+# Local SQLite backend, for running, profiling and load-testing without Supabase.
+# One connection is shared by all request threads behind a lock.
+class SQLiteStorage(Storage):
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.lock = threading.RLock()
+
+    def setup(self):
+        with self.lock:
+            self.connection.executescript(SQLITE_SCHEMA)
+        self.rebuild_inventory()
+        self.rebuild_rollups()
+
+    def select(self, table, columns="*", filters=(), order=(), limit=None, offset=0):
+        sql = f"SELECT {sqlite_columns(columns)} FROM {sqlite_identifier(table)}"
+        where, params = sqlite_where(filters)
+        sql += where
+        if order:
+            sql += " ORDER BY " + ", ".join(
+                f"{sqlite_identifier(column)} {'DESC' if desc else 'ASC'}"
+                + ("" if nulls_first is None else " NULLS FIRST" if nulls_first else " NULLS LAST")
+                for column, desc, nulls_first in order_terms(order)
+            )
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        with self.lock:
+            return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def insert(self, table, rows):
+        if isinstance(rows, dict):
+            rows = [rows]
+        inserted = []
+        with self.lock, self.transaction():
+            for row in rows:
+                columns = ", ".join(sqlite_identifier(column) for column in row)
+                placeholders = ", ".join("?" for _ in row)
+                sql = f"INSERT INTO {sqlite_identifier(table)} ({columns}) VALUES ({placeholders}) RETURNING *"
+                inserted += [dict(r) for r in self.connection.execute(sql, list(row.values()))]
+        return inserted
+
+    def update(self, table, values, filters):
+        assignments = ", ".join(f"{sqlite_identifier(column)} = ?" for column in values)
+        where, params = sqlite_where(filters)
+        sql = f"UPDATE {sqlite_identifier(table)} SET {assignments}{where} RETURNING *"
+        with self.lock, self.transaction():
+            return [dict(row) for row in self.connection.execute(sql, list(values.values()) + params)]
+
+    def delete(self, table, filters):
+        where, params = sqlite_where(filters)
+        sql = f"DELETE FROM {sqlite_identifier(table)}{where} RETURNING *"
+        with self.lock, self.transaction():
+            return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def upsert(self, table, rows, on_conflict):
+        upserted = []
+        with self.lock, self.transaction():
+            for row in rows:
+                columns = ", ".join(sqlite_identifier(column) for column in row)
+                placeholders = ", ".join("?" for _ in row)
+                assignments = ", ".join(f"{sqlite_identifier(column)} = excluded.{sqlite_identifier(column)}" for column in row)
+                sql = (
+                    f"INSERT INTO {sqlite_identifier(table)} ({columns}) VALUES ({placeholders}) "
+                    f"ON CONFLICT ({sqlite_identifier(on_conflict)}) DO UPDATE SET {assignments} RETURNING *"
+                )
+                upserted += [dict(r) for r in self.connection.execute(sql, list(row.values()))]
+        return upserted
+
+    def apply_inventory_deltas(self, deltas):
+        with self.lock, self.transaction():
+            self._apply_inventory_deltas(deltas)
+
+    # Inside an open transaction
+    def _apply_inventory_deltas(self, deltas):
+        self.connection.executemany(
+            """
+                INSERT INTO inventory_totals (item_number, lot_number, exp_date, typ, quantity)
+                VALUES (coalesce(?, ''), coalesce(?, ''), coalesce(?, ''), coalesce(?, ''), ?)
+                ON CONFLICT (item_number, lot_number, exp_date, typ)
+                DO UPDATE SET quantity = quantity + excluded.quantity
+            """,
+            [[delta[column] for column in INVENTORY_KEY] + [delta["quantity"]] for delta in deltas]
+        )
+        # Only the groups these deltas touched can have been left empty; each is one primary key lookup
+        self.connection.executemany(
+            """
+                DELETE FROM inventory_totals
+                WHERE item_number = coalesce(?, '') AND lot_number = coalesce(?, '') AND exp_date = coalesce(?, '')
+                    AND typ = coalesce(?, '') AND quantity <= 0
+            """,
+            list({tuple(delta[column] for column in INVENTORY_KEY) for delta in deltas})
+        )
+
+    def rebuild_inventory(self):
+        with self.lock, self.transaction():
+            self.connection.execute("DELETE FROM inventory_totals")
+            self.connection.execute("""
+                INSERT INTO inventory_totals (item_number, lot_number, exp_date, typ, quantity)
+                SELECT coalesce(item_number, ''), coalesce(lot_number, ''), coalesce(exp_date, ''), coalesce(typ, ''), SUM(quantity)
+                FROM barcodes
+                WHERE remove = 0
+                GROUP BY 1, 2, 3, 4
+            """)
+
+    def apply_rollup_deltas(self, deltas):
+        with self.lock, self.transaction():
+            self._apply_rollup_deltas(deltas)
+
+    # Inside an open transaction
+    def _apply_rollup_deltas(self, deltas):
+        rows = [
+            [delta["trans_date"], dimension, "" if dimension == "total" else delta[dimension],
+             delta["add_remove"], delta["transactions"], delta["quantity"]]
+            for delta in deltas
+            for dimension in ROLLUP_DIMENSIONS
+        ]
+        self.connection.executemany(
+            """
+                INSERT INTO transaction_daily (day, dimension, value, add_remove, transactions, quantity)
+                VALUES (date(?), ?, coalesce(?, ''), coalesce(?, ''), ?, ?)
+                ON CONFLICT (dimension, day, value, add_remove)
+                DO UPDATE SET transactions = transactions + excluded.transactions, quantity = quantity + excluded.quantity
+            """,
+            rows
+        )
+        # Only the rollup rows these deltas touched can have been left empty
+        self.connection.executemany(
+            """
+                DELETE FROM transaction_daily
+                WHERE dimension = ? AND day = date(?) AND value = coalesce(?, '') AND add_remove = coalesce(?, '')
+                    AND transactions <= 0
+            """,
+            list({(dimension, trans_date, value, add_remove) for trans_date, dimension, value, add_remove, _, _ in rows})
+        )
+
+    def rebuild_rollups(self):
+        with self.lock, self.transaction():
+            self.connection.execute("DELETE FROM transaction_daily")
+            for dimension in ROLLUP_DIMENSIONS:
+                value = "''" if dimension == "total" else f"coalesce({sqlite_identifier(dimension)}, '')"
+                self.connection.execute(f"""
+                    INSERT INTO transaction_daily (day, dimension, value, add_remove, transactions, quantity)
+                    SELECT date(trans_date), '{dimension}', {value}, coalesce(add_remove, ''), COUNT(*), SUM(quantity)
+                    FROM transactions
+                    GROUP BY 1, 3, 4
+                """)
+
+    # Same statements as the Supabase add_barcode function, in one transaction
+    def add_barcode(self, transaction, barcode):
+        with self.lock, self.transaction():
+            return self._add_barcode(transaction, barcode)
+
+    def add_barcodes(self, items):
+        return self._all_or_nothing(lambda: [self._add_barcode(item["transaction"], item["barcode"]) for item in items])
+
+    # Inside an open transaction
+    def _add_barcode(self, transaction, barcode):
+        columns = ", ".join(sqlite_identifier(column) for column in barcode)
+        placeholders = ", ".join("?" for _ in barcode)
+        inserted = self.connection.execute(
+            f"INSERT INTO barcodes ({columns}) VALUES ({placeholders}) ON CONFLICT (barcode) DO NOTHING RETURNING *",
+            list(barcode.values())
+        ).fetchone()
+
+        if inserted is None:
+            existing = self.connection.execute("SELECT * FROM barcodes WHERE barcode = ?", [barcode["barcode"]]).fetchone()
+            return {"status": "exists", "barcode": dict(existing) if existing else None}
+
+        inserted = dict(inserted)
+        columns = ", ".join(sqlite_identifier(column) for column in transaction)
+        placeholders = ", ".join("?" for _ in transaction)
+        logged = dict(self.connection.execute(
+            f"INSERT INTO transactions ({columns}) VALUES ({placeholders}) RETURNING *",
+            list(transaction.values())
+        ).fetchone())
+        self._apply_inventory_deltas([{column: inserted[column] for column in INVENTORY_KEY + ["quantity"]}])
+        self._apply_rollup_deltas([{**logged, "transactions": 1}])
+        return {"status": "ok", "barcode": inserted}
+
+    # Same statements as the Supabase remove_barcode function, in one transaction
+    def remove_barcode(self, barcode, quantity, employee, trans_date):
+        with self.lock, self.transaction():
+            return self._remove_barcode(barcode, quantity, employee, trans_date)
+
+    def remove_barcodes(self, items, employee, trans_date):
+        return self._all_or_nothing(lambda: [
+            self._remove_barcode(item["barcode"], item["quantity"], employee, trans_date) for item in items
+        ])
+
+    # Inside an open transaction
+    def _remove_barcode(self, barcode, quantity, employee, trans_date):
+        updated = self.connection.execute(
+            """
+                UPDATE barcodes
+                SET quantity = quantity - :quantity,
+                    remove = CASE WHEN quantity = :quantity THEN 1 ELSE remove END
+                WHERE barcode = :barcode AND remove = 0 AND :quantity > 0 AND quantity >= :quantity
+                RETURNING *
+            """,
+            {"barcode": barcode, "quantity": quantity}
+        ).fetchone()
+
+        if updated is None:
+            existing = self.connection.execute("SELECT * FROM barcodes WHERE barcode = ?", [barcode]).fetchone()
+            if existing is None:
+                return {"status": "not_found", "barcode": None}
+            return {"status": "removed" if existing["remove"] != 0 else "insufficient", "barcode": dict(existing)}
+
+        updated = dict(updated)
+        self.connection.execute(
+            """
+                INSERT INTO transactions (barcode, item_number, description, lot_number, exp_date, typ, add_remove, quantity, trans_date, employee)
+                VALUES (?, ?, ?, ?, ?, ?, 'Remove', ?, ?, ?)
+            """,
+            [updated["barcode"], updated["item_number"], updated["description"], updated["lot_number"],
+             updated["exp_date"], updated["typ"], quantity, trans_date, employee]
+        )
+        self._apply_inventory_deltas([{**{column: updated[column] for column in INVENTORY_KEY}, "quantity": -quantity}])
+        self._apply_rollup_deltas([{
+            "trans_date": trans_date,
+            "typ": updated["typ"],
+            "item_number": updated["item_number"],
+            "employee": employee,
+            "add_remove": "Remove",
+            "transactions": 1,
+            "quantity": quantity,
+        }])
+        return {"status": "ok", "barcode": updated}
+
+    # Same statements as the Supabase update_barcode function, in one transaction
+    def update_barcode(self, barcode, values):
+        with self.lock, self.transaction():
+            old = self.connection.execute("SELECT * FROM barcodes WHERE barcode = ?", [barcode]).fetchone()
+            if old is None:
+                return {"status": "not_found", "barcode": None}
+            assignments = ", ".join(f"{sqlite_identifier(column)} = ?" for column in values)
+            updated = dict(self.connection.execute(
+                f"UPDATE barcodes SET {assignments} WHERE barcode = ? RETURNING *",
+                list(values.values()) + [barcode]
+            ).fetchone())
+            deltas = [barcode_inventory_delta(dict(old), -1), barcode_inventory_delta(updated, 1)]
+            self._apply_inventory_deltas([delta for delta in deltas if delta])
+            return {"status": "ok", "barcode": updated}
+
+    # Results of write() (a list of {"status", "barcode"}), run in one transaction that is
+    # rolled back unless every status is "ok"
+    def _all_or_nothing(self, write):
+        try:
+            with self.lock, self.transaction():
+                results = write()
+                if any(result["status"] != "ok" for result in results):
+                    raise BatchRejected(results)
+        except BatchRejected as e:
+            return e.results
+        return results
+
+    # BEGIN/COMMIT around a group of statements (the connection is in autocommit mode)
+    def transaction(self):
+        return SQLiteTransaction(self.connection)
+
+
+# What a barcode row counts in inventory_totals, times sign (None for a removed barcode)
+def barcode_inventory_delta(row, sign):
+    if int(row["remove"] or 0) != 0:
+        return None
+    return {**{column: row[column] for column in INVENTORY_KEY}, "quantity": sign * int(row["quantity"] or 0)}
+
+
+# Raised inside a transaction to roll back a batch that is not written in full
+class BatchRejected(Exception):
+    def __init__(self, results):
+        super().__init__(f"{sum(result['status'] != 'ok' for result in results)} of {len(results)} items rejected")
+        self.results = results
+
+
+class SQLiteTransaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, tb):
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def sqlite_identifier(name):
+    if not IDENTIFIER.match(name):
+        raise ValueError(f"Invalid column or table name: {name!r}")
+    return name
+
+
+def sqlite_columns(columns):
+    if columns.strip() == "*":
+        return "*"
+    return ", ".join(sqlite_identifier(column.strip()) for column in columns.split(","))
+
+
+# Translate filters into a WHERE clause and its parameters
+def sqlite_where(filters):
+    conditions = []
+    params = []
+    for column, op, value in filters:
+        if op == "or_":
+            groups = []
+            for group in value:
+                group_conditions = []
+                for c, o, v in group:
+                    condition, condition_params = sqlite_condition(c, o, v)
+                    group_conditions.append(condition)
+                    params += condition_params
+                groups.append("(" + " AND ".join(group_conditions) + ")")
+            conditions.append("(" + " OR ".join(groups) + ")")
+        else:
+            condition, condition_params = sqlite_condition(column, op, value)
+            conditions.append(condition)
+            params += condition_params
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+
+def sqlite_condition(column, op, value):
+    column = sqlite_identifier(column)
+    if op == "ilike":
+        return f"{column} LIKE ? ESCAPE '\\'", [value]
+    if op == "in_":
+        value = list(value)
+        if not value:
+            return "0", []
+        return f"{column} IN ({', '.join('?' for _ in value)})", value
+    if op == "is_":
+        return f"{column} IS NULL", []
+    if op == "not_is_":
+        return f"{column} IS NOT NULL", []
+    return f"{column} {SQLITE_OPERATORS[op]} ?", [value]
+
+
+# Build the backend chosen in configuration ("supabase" or "sqlite")
+def create_storage(backend, supabase_url=None, supabase_key=None, sqlite_path=None):
+    if backend == "sqlite":
+        return SQLiteStorage(sqlite_path)
+    if backend == "supabase":
+        return SupabaseStorage(supabase_url, supabase_key)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend!r}")
@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DIRECTORY = tempfile.mkdtemp()
+
+# main.py reads its configuration at import time, so it is set before any test module imports it
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = os.path.join(DIRECTORY, "test.db")
+os.environ["EXPORT_DIR"] = os.path.join(DIRECTORY, "exports")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("PASSWORD", "test")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from storage import SQLiteStorage
+
+
+# An empty SQLite database of its own for each test
+@pytest.fixture
+def storage(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "storage.db"))
+    storage.setup()
+    return storage
@@ -0,0 +1,61 @@
+import io
+import time
+
+import pytest
+from openpyxl import load_workbook
+from starlette.testclient import TestClient
+
+import main
+import synthetic
+
+
+@pytest.fixture(scope="module")
+def client():
+    main.STORAGE.setup()
+    transactions, barcodes = synthetic.generate(500)
+    synthetic.load(main.STORAGE, transactions, barcodes)
+    with TestClient(main.app) as client:
+        client.cookies.set("session", main.SECRET_KEY)
+        yield client
+
+
+def wait_for(client, job, timeout=60):
+    deadline = time.monotonic() + timeout
+    while job["status"] == "running":
+        assert time.monotonic() < deadline, "export did not finish"
+        time.sleep(0.05)
+        response = client.get(f"/export_jobs/{job['id']}")
+        assert response.status_code == 200
+        job = response.json()
+    return job
+
+
+def test_export_job_runs_to_completion(client):
+    response = client.post("/export_jobs")
+    assert response.status_code == 202
+    job = wait_for(client, response.json())
+
+    assert job["status"] == "done"
+    assert job["progress"] == 1.0
+    assert job["rows"] == 800  # 500 transactions and 300 barcodes
+
+    download = client.get(job["file"])
+    assert download.status_code == 200
+    workbook = load_workbook(io.BytesIO(download.content), read_only=True)
+    assert workbook.sheetnames == ["Transactions", "Barcodes", "Inventory"]
+
+
+def test_export_job_is_reused_until_the_data_changes(client):
+    first = wait_for(client, client.post("/export_jobs").json())
+    assert client.post("/export_jobs").json()["id"] == first["id"]
+
+    # A write made outside the app's handlers changes the data version too
+    barcode = main.STORAGE.select("barcodes", columns="barcode", limit=1)[0]["barcode"]
+    main.STORAGE.update("barcodes", {"description": "Changed"}, [("barcode", "eq", barcode)])
+    second = wait_for(client, client.post("/export_jobs").json())
+    assert second["id"] != first["id"]
+    assert client.get(f"/export_jobs/{first['id']}").status_code == 404
+
+
+def test_export_job_requires_login(client):
+    assert TestClient(main.app).post("/export_jobs").status_code == 401
@@ -0,0 +1,65 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+import synthetic
+from inventory_history import (
+    CHECKPOINT_COLUMNS, build_checkpoints, empty_inventory, inventory_as_of, invalidate_checkpoints, replay,
+)
+from storage import INVENTORY_KEY
+
+# Month starts, mid-month moments and the edges of the generated three years
+MOMENTS = ["2023-01-01", "2023-02-01", "2023-07-15 12:30", "2024-03-01", "2025-06-10 08:00", "2026-01-01", "2026-06-01"]
+
+
+@pytest.fixture
+def history(storage):
+    transactions, barcodes = synthetic.generate(2000)
+    synthetic.load(storage, transactions, barcodes)
+    return storage
+
+
+# Inventory just before `when`, replayed from the whole transaction log with no checkpoint
+def replayed(storage, when):
+    transactions = pd.DataFrame(storage.select(
+        "transactions",
+        filters=[("trans_date", "lt", pd.Timestamp(when).isoformat(sep=" "))],
+        order=[("trans_id", False)]
+    ))
+    if transactions.empty:
+        return empty_inventory()
+    return replay(empty_inventory(), transactions).sort_values(INVENTORY_KEY, ignore_index=True, na_position="first")
+
+
+def as_records(frame):
+    return sorted(map(repr, frame[CHECKPOINT_COLUMNS].astype(object).to_dict("records")))
+
+
+@pytest.mark.parametrize("when", MOMENTS)
+def test_as_of_matches_a_replay_of_the_whole_log(history, when):
+    assert as_records(asyncio.run(inventory_as_of(history, when))) == as_records(replayed(history, when))
+
+
+def test_as_of_uses_stored_checkpoints(history):
+    asyncio.run(build_checkpoints(history, pd.Timestamp("2025-01-01").date()))
+    days = [row["day"] for row in history.select("inventory_checkpoints", order=[("day", False)])]
+    assert days[0] == "2023-02-01" and days[-1] == "2025-01-01"
+
+    # A checkpoint's rows are the inventory at its day
+    rows = pd.DataFrame(history.select("inventory_checkpoint_rows", filters=[("day", "eq", "2024-06-01")]))
+    assert as_records(rows) == as_records(replayed(history, "2024-06-01"))
+
+    assert as_records(asyncio.run(inventory_as_of(history, "2024-06-20"))) == as_records(replayed(history, "2024-06-20"))
+
+
+def test_as_of_after_an_edited_transaction(history):
+    asyncio.run(build_checkpoints(history, pd.Timestamp("2025-06-01").date()))
+    edited = history.select("transactions", filters=[("add_remove", "eq", "Add"), ("trans_date", "gte", "2024-02-10")], order=[("trans_id", False)], limit=1)[0]
+
+    history.update("transactions", {"quantity": edited["quantity"] + 100}, [("trans_id", "eq", edited["trans_id"])])
+    asyncio.run(invalidate_checkpoints(history, edited["trans_date"]))
+
+    assert history.select("inventory_checkpoints", filters=[("day", "gt", "2024-03-01")]) == []
+    for when in ["2024-02-01", "2024-05-15", "2025-04-01"]:
+        assert as_records(asyncio.run(inventory_as_of(history, when))) == as_records(replayed(history, when))
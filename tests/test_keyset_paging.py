@@ -0,0 +1,79 @@
+import re
+
+import pytest
+from starlette.testclient import TestClient
+
+import main
+
+# Sort values with repeats and NULLs, so pages break inside runs of equal values
+EXP_DATES = ["2025-01-01", "2025-06-30", None, "2026-03-15", None, "2025-06-30"]
+TYPES = ["Damage", None, "Return", "Damage"]
+
+
+@pytest.fixture
+def barcodes(storage):
+    storage.insert("barcodes", [
+        {
+            "barcode": str(100000 + i),
+            "item_number": f"ITEM-{i % 7}",
+            "description": "Widget",
+            "lot_number": None if i % 5 == 0 else f"LOT-{i % 3}",
+            "exp_date": EXP_DATES[i % len(EXP_DATES)],
+            "typ": TYPES[i % len(TYPES)],
+            "quantity": i % 4 + 1,
+        }
+        for i in range(23)
+    ])
+    return storage
+
+
+# Barcodes in the order the view shows them: by the sort column with NULLs last, then barcode
+def expected_order(rows, sort, descending):
+    with_value = sorted((row for row in rows if row[sort] is not None), key=lambda row: (row[sort], row["barcode"]), reverse=descending)
+    without = sorted((row for row in rows if row[sort] is None), key=lambda row: row["barcode"], reverse=descending)
+    return [row["barcode"] for row in with_value + without]
+
+
+# One page as /barcodes reads it: the rows after (or before) the cursor row, in view order
+def read_page(storage, sort, descending, cursor, forward, size):
+    filters = []
+    if cursor:
+        filters.append(main.keyset_filter(sort, descending, cursor["barcode"], cursor[sort], forward))
+    rows = storage.select("barcodes", filters=filters, order=main.keyset_order(sort, descending, forward), limit=size)
+    return rows if forward else rows[::-1]
+
+
+@pytest.mark.parametrize("sort", ["exp_date", "typ", "lot_number", "quantity", "barcode"])
+@pytest.mark.parametrize("descending", [False, True])
+def test_pages_forward_and_back_cover_every_row_once(barcodes, sort, descending):
+    expected = expected_order(barcodes.select("barcodes"), sort, descending)
+
+    pages = []
+    cursor = None
+    while True:
+        page = read_page(barcodes, sort, descending, cursor, True, 4)
+        if not page:
+            break
+        pages.append(page)
+        cursor = page[-1]
+    assert [row["barcode"] for page in pages for row in page] == expected
+
+    # Paging back from the last page returns the same pages
+    back = [pages[-1]]
+    while len(back) < len(pages):
+        back.append(read_page(barcodes, sort, descending, back[-1][0], False, 4))
+    assert [[row["barcode"] for row in page] for page in reversed(back)] == [[row["barcode"] for row in page] for page in pages]
+
+
+def test_barcodes_view_pages_past_a_cursor_without_exp_date(barcodes, monkeypatch):
+    monkeypatch.setattr(main, "STORAGE", barcodes)
+    monkeypatch.setattr(main, "BARCODE_CACHE", main.BarcodeCache())
+    client = TestClient(main.app)
+    client.cookies.set("session", main.SECRET_KEY)
+
+    # 100002 has no exp_date, so the rows after it are the later barcodes without one
+    response = client.get("/barcodes", params={"sort": "exp_date", "dir": "asc", "after": "100002"})
+    assert response.status_code == 200
+    shown = list(dict.fromkeys(re.findall(r'href="/edit_barcode\?barcode=(\d+)"', response.text)))
+    expected = expected_order(barcodes.select("barcodes"), "exp_date", False)
+    assert shown == expected[expected.index("100002") + 1:]
@@ -0,0 +1,145 @@
+import pytest
+
+import synthetic
+
+TRANS_DATE = "2025-03-01 09:00:00.000001"
+
+
+@pytest.fixture
+def loaded(storage):
+    transactions, barcodes = synthetic.generate(300)
+    synthetic.load(storage, transactions, barcodes)
+    return storage
+
+
+def new_item(barcode, quantity=5):
+    row = {
+        "barcode": barcode,
+        "item_number": "ITEM-NEW",
+        "description": "New widget",
+        "lot_number": "LOT-NEW",
+        "exp_date": "2027-01-01",
+        "typ": "Damage",
+    }
+    return {
+        "transaction": {**row, "add_remove": "Add", "quantity": quantity, "trans_date": TRANS_DATE, "employee": "alice"},
+        "barcode": {**row, "quantity": quantity, "remove": 0},
+    }
+
+
+# Everything a barcode write touches, so a rejected batch can be checked to leave it all as it was
+def snapshot(storage):
+    return {
+        table: sorted(map(repr, storage.select(table)))
+        for table in ("barcodes", "transactions", "inventory_totals", "transaction_daily")
+    }
+
+
+# The aggregates as the write paths left them, and as a rebuild from the tables computes them
+def aggregates(storage):
+    return sorted(map(repr, storage.select("inventory_totals"))), sorted(map(repr, storage.select("transaction_daily")))
+
+
+def assert_aggregates_match_rebuild(storage):
+    incremental = aggregates(storage)
+    storage.rebuild_inventory()
+    storage.rebuild_rollups()
+    assert incremental == aggregates(storage)
+
+
+def active_barcodes(storage, count):
+    return storage.select("barcodes", filters=[("remove", "eq", 0), ("quantity", "gt", 3)], order=[("barcode", False)], limit=count)
+
+
+def test_add_barcodes_writes_nothing_if_one_barcode_exists(loaded):
+    existing = active_barcodes(loaded, 1)[0]
+    before = snapshot(loaded)
+
+    results = loaded.add_barcodes([new_item("990001"), new_item(existing["barcode"])])
+
+    assert [result["status"] for result in results] == ["ok", "exists"]
+    assert results[1]["barcode"]["barcode"] == existing["barcode"]
+    assert snapshot(loaded) == before
+
+
+def test_add_barcodes_writes_every_item(loaded):
+    results = loaded.add_barcodes([new_item("990001"), new_item("990002", quantity=3)])
+
+    assert [result["status"] for result in results] == ["ok", "ok"]
+    rows = loaded.select("barcodes", filters=[("barcode", "in_", ["990001", "990002"])], order=[("barcode", False)])
+    assert [(row["barcode"], row["quantity"]) for row in rows] == [("990001", 5), ("990002", 3)]
+    assert len(loaded.select("transactions", filters=[("item_number", "eq", "ITEM-NEW")])) == 2
+    assert_aggregates_match_rebuild(loaded)
+
+
+def test_remove_barcodes_writes_nothing_if_one_item_fails(loaded):
+    first, second = active_barcodes(loaded, 2)
+    before = snapshot(loaded)
+
+    results = loaded.remove_barcodes([
+        {"barcode": first["barcode"], "quantity": 1},
+        {"barcode": second["barcode"], "quantity": second["quantity"] + 1},
+        {"barcode": "990009", "quantity": 1},
+    ], "bob", TRANS_DATE)
+
+    assert [result["status"] for result in results] == ["ok", "insufficient", "not_found"]
+    assert snapshot(loaded) == before
+
+
+def test_remove_barcodes_writes_every_item(loaded):
+    first, second = active_barcodes(loaded, 2)
+
+    results = loaded.remove_barcodes([
+        {"barcode": first["barcode"], "quantity": 1},
+        {"barcode": second["barcode"], "quantity": second["quantity"]},
+    ], "bob", TRANS_DATE)
+
+    assert [result["status"] for result in results] == ["ok", "ok"]
+    assert (results[0]["barcode"]["quantity"], results[0]["barcode"]["remove"]) == (first["quantity"] - 1, 0)
+    assert (results[1]["barcode"]["quantity"], results[1]["barcode"]["remove"]) == (0, 1)
+    assert_aggregates_match_rebuild(loaded)
+
+    # A barcode the batch flagged removed rejects the next one
+    again = loaded.remove_barcodes([{"barcode": second["barcode"], "quantity": 1}], "bob", TRANS_DATE)
+    assert again[0]["status"] == "removed"
+
+
+def test_single_writes_keep_aggregates_in_step(loaded):
+    barcode = active_barcodes(loaded, 1)[0]
+
+    assert loaded.add_barcode(**new_item("990001"))["status"] == "ok"
+    assert loaded.add_barcode(**new_item("990001"))["status"] == "exists"
+    assert loaded.remove_barcode(barcode["barcode"], 2, "carol", TRANS_DATE)["status"] == "ok"
+    assert loaded.remove_barcode("990001", 6, "carol", TRANS_DATE)["status"] == "insufficient"
+    assert_aggregates_match_rebuild(loaded)
+
+
+@pytest.mark.parametrize("values", [
+    {"lot_number": "LOT-EDITED"},
+    {"quantity": 1},
+    {"item_number": "ITEM-EDITED", "exp_date": None, "quantity": 9},
+    {"remove": 1},
+])
+def test_update_barcode_moves_inventory_like_a_rebuild(loaded, values):
+    barcode = active_barcodes(loaded, 1)[0]
+
+    result = loaded.update_barcode(barcode["barcode"], values)
+
+    assert result["status"] == "ok"
+    assert result["barcode"] == {**barcode, **values}
+    assert_aggregates_match_rebuild(loaded)
+
+
+def test_update_barcode_restores_a_removed_barcode_to_inventory(loaded):
+    barcode = active_barcodes(loaded, 1)[0]
+    loaded.update_barcode(barcode["barcode"], {"remove": 1})
+
+    loaded.update_barcode(barcode["barcode"], {"remove": 0, "quantity": 7})
+
+    assert_aggregates_match_rebuild(loaded)
+
+
+def test_update_barcode_of_a_missing_barcode(loaded):
+    before = snapshot(loaded)
+    assert loaded.update_barcode("990009", {"quantity": 1}) == {"status": "not_found", "barcode": None}
+    assert snapshot(loaded) == before